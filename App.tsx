@@ -23,6 +23,7 @@ import { LifeProjects } from './components/LifeProjects';
 import { Transaction, UserProfile, Account } from './types';
 import { Bell, Menu } from 'lucide-react';
 import { apiService } from './services/apiService';
+import { eventsService } from './services/eventsService';
 
 const App: React.FC = () => {
   const [currentView, setCurrentView] = useState('dashboard');
@@ -59,6 +60,38 @@ const App: React.FC = () => {
     loadData();
   }, []);
 
+  // Live updates: patch local state from server events instead of refetching
+  useEffect(() => {
+    const sameId = (a: string | number, b: string | number) => String(a) === String(b);
+
+    return eventsService.subscribe({
+      'transaction': ({ action, transaction }) => {
+        setTransactions(prev => {
+          const rest = prev.filter(t => !sameId(t.id, transaction.id));
+          if (action === 'deleted') return rest;
+          const exists = rest.length !== prev.length;
+          return exists
+            ? prev.map(t => sameId(t.id, transaction.id) ? transaction : t)
+            : [transaction, ...prev];
+        });
+      },
+      'account-balance': ({ accountId, balance }) => {
+        setAccounts(prev => {
+          if (!prev.some(a => sameId(a.id, accountId))) {
+            // Conta nova (criada em outra aba): busca a lista completa
+            apiService.getAccounts().then(setAccounts).catch(console.error);
+            return prev;
+          }
+          return prev.map(a => sameId(a.id, accountId) ? { ...a, balance } : a);
+        });
+      },
+      'resync': () => {
+        apiService.getTransactions().then(setTransactions).catch(console.error);
+        apiService.getAccounts().then(setAccounts).catch(console.error);
+      },
+    });
+  }, []);
+
   const handleUpdateProfile = async (newProfile: UserProfile) => {
     try {
       const updated = await apiService.updateProfile(newProfile);
@@ -72,7 +105,8 @@ const App: React.FC = () => {
     try {
       const created = await apiService.createTransaction(newTransaction);
       if (created) {
-        setTransactions(prev => [created, ...prev]);
+        // O evento SSE pode ter chegado antes da resposta
+        setTransactions(prev => [created, ...prev.filter(t => String(t.id) !== String(created.id))]);
         // Don't switch view, stay on list to see result
       }
     } catch (e) {
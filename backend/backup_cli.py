@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Backups do Axxy Finance pela linha de comando (mesmo banco do backend:
+DATABASE_URL ou DATABASE_FILE).
+
+    python backup_cli.py export -o completo.ndjson.gz
+    python backup_cli.py export --since 1520 -o delta.ndjson.gz
+    python backup_cli.py restore completo.ndjson.gz delta1.ndjson.gz delta2.ndjson.gz
+    python backup_cli.py snapshot -o banco.db.gz   # "-o -" escreve na saída padrão
+
+O token impresso pelo export (também gravado no cabeçalho do arquivo) é o
+`--since` do próximo backup incremental.
+"""
+import argparse
+import itertools
+import json
+import sys
+
+from main import (
+    BackupImportError,
+    create_database_snapshot,
+    create_db_and_tables,
+    engine,
+    get_backup_token,
+    import_backup_stream,
+    iter_backup_batches,
+    iter_gzip_chunks,
+    iter_snapshot_chunks,
+    open_backup,
+)
+
+
+def export(args):
+    if args.since is not None:
+        with engine.connect() as conn:
+            token, reset_id = get_backup_token(conn)
+        if not reset_id <= args.since <= token:
+            print("❌ Token inválido ou expirado: faça um backup completo.", file=sys.stderr)
+            return 1
+
+    batches = iter_backup_batches(args.since)
+    first = next(batches)
+    header = json.loads(first[0])
+    with open(args.output, "wb") as output:
+        for chunk in iter_gzip_chunks(itertools.chain([first], batches)):
+            output.write(chunk)
+
+    print(f"✓ Backup {header['mode']} gravado em {args.output}")
+    print(f"Token: {header['token']}")
+    return 0
+
+
+def restore(args):
+    # Valida a cadeia antes de tocar no banco: completo e depois deltas encadeados
+    headers = []
+    for path in args.files:
+        with open(path, "rb") as backup:
+            try:
+                header, _ = open_backup(backup)
+            except BackupImportError as e:
+                print(f"❌ {path}: {e}", file=sys.stderr)
+                return 1
+        headers.append(header)
+
+    if headers[0].get("mode") != "full":
+        print(f"❌ {args.files[0]} não é um backup completo.", file=sys.stderr)
+        return 1
+    for previous, (path, header) in zip(headers, zip(args.files[1:], headers[1:])):
+        if header.get("mode") != "delta" or header.get("since") != previous.get("token"):
+            print(f"❌ {path} não continua o backup anterior (since={header.get('since')}, "
+                  f"esperado {previous.get('token')}).", file=sys.stderr)
+            return 1
+
+    for path in args.files:
+        with open(path, "rb") as backup:
+            result = import_backup_stream(backup)
+        imported = sum(result["imported"].values())
+        deleted = sum(result["deleted"].values())
+        print(f"✓ {path}: {imported} linhas gravadas, {deleted} removidas")
+        for table, count in result["skipped"].items():
+            print(f"  ⚠ {table}: {count} linhas descartadas")
+
+    print("Reinicie o backend para recarregar os caches em memória.")
+    return 0
+
+
+def snapshot(args):
+    path, filename = create_database_snapshot()
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in iter_snapshot_chunks(path):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    if args.output != "-":
+        print(f"✓ Fotografia gravada em {args.output} ({filename})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backups completos e incrementais do Axxy Finance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Exporta um backup completo ou incremental")
+    export_parser.add_argument("--since", type=int, help="Token do backup anterior (gera um delta)")
+    export_parser.add_argument("-o", "--output", required=True, help="Arquivo .ndjson.gz de saída")
+    export_parser.set_defaults(handler=export)
+
+    restore_parser = commands.add_parser("restore", help="Restaura um backup completo seguido de deltas")
+    restore_parser.add_argument("files", nargs="+", help="Backup completo e depois os deltas, em ordem")
+    restore_parser.set_defaults(handler=restore)
+
+    snapshot_parser = commands.add_parser("snapshot", help="Fotografia consistente do banco inteiro (gzip)")
+    snapshot_parser.add_argument("-o", "--output", required=True, help="Arquivo de saída (.db.gz / .sql.gz) ou - para stdout")
+    snapshot_parser.set_defaults(handler=snapshot)
+
+    args = parser.parse_args()
+    create_db_and_tables()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,28 @@
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from pydantic_core import PydanticUndefined
+from sqlmodel import SQLModel, Field, Relationship, Session, create_engine, select, func, or_
+from sqlalchemy import Index, Numeric, UniqueConstraint, case, cast, delete, event, insert, inspect, literal, text, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import AddConstraint
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
-import random
+import asyncio
+import calendar
+import csv
+import gzip
+import io
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+import numpy as np
 
 # ==========================================
 # 1. CONFIGURAÇÃO DO BANCO DE DADOS
@@ -28,9 +45,90 @@ else:
     
     engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
 
+    # SQLite só aplica chaves estrangeiras (e o ON DELETE) com o pragma ligado por conexão
+    @event.listens_for(engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
 def create_db_and_tables():
     """Cria o arquivo do banco de dados e as tabelas automaticamente."""
     SQLModel.metadata.create_all(engine)
+    # create_all não adiciona colunas nem índices novos em tabelas que já existem
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                # Só colunas opcionais: as obrigatórias continuam no migrate_db.py
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    migrate_foreign_keys()
+
+
+def _stale_foreign_keys(inspector, table) -> list:
+    """Chaves estrangeiras do modelo cujo ON DELETE difere do banco: [(fk, nome no banco)]."""
+    existing = {tuple(fk["constrained_columns"]): fk for fk in inspector.get_foreign_keys(table.name)}
+    stale = []
+    for fk in table.foreign_keys:
+        if not fk.ondelete:
+            continue
+        current = existing.get((fk.parent.name,))
+        if current is None or (current["options"].get("ondelete") or "").upper() != fk.ondelete.upper():
+            stale.append((fk, current and current.get("name")))
+    return stale
+
+
+def migrate_foreign_keys():
+    """
+    create_all não altera chaves estrangeiras de tabelas existentes. Para as que
+    estão sem o ON DELETE do modelo: o SQLite reconstrói a tabela (cópia das linhas)
+    e o PostgreSQL troca a constraint. Órfãs acumuladas enquanto o SQLite não
+    verificava as chaves são removidas (CASCADE) ou desvinculadas (SET NULL).
+    """
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        stale = {table: _stale_foreign_keys(inspector, table) for table in SQLModel.metadata.sorted_tables
+                 if inspector.has_table(table.name)}
+        stale = {table: fks for table, fks in stale.items() if fks}
+        if not stale:
+            return
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            # Fora de transação: o pragma é ignorado dentro de uma
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.exec_driver_sql("PRAGMA legacy_alter_table=ON")  # Renomear não reescreve outras tabelas
+            conn.commit()
+        try:
+            with conn.begin():
+                for table, fks in stale.items():
+                    if sqlite:
+                        columns = ", ".join(f'"{c["name"]}"' for c in inspector.get_columns(table.name) if c["name"] in table.c)
+                        for index in inspector.get_indexes(table.name):
+                            conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+                        conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}__old"'))
+                        table.create(conn)
+                        conn.execute(text(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{table.name}__old"'))
+                        conn.execute(text(f'DROP TABLE "{table.name}__old"'))
+                    for fk, _ in fks:
+                        orphan = fk.parent.isnot(None) & fk.parent.not_in(select(fk.column))
+                        if fk.ondelete.upper() == "CASCADE":
+                            conn.execute(delete(table).where(orphan))
+                        else:
+                            conn.execute(update(table).where(orphan).values({fk.parent.name: None}))
+                    if not sqlite:
+                        for fk, name in fks:
+                            if name:
+                                conn.execute(text(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{name}"'))
+                            conn.execute(AddConstraint(fk.constraint))
+        finally:
+            if sqlite:
+                conn.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+                conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+                conn.commit()
 
 def get_session():
     """Injeção de dependência para obter a sessão do banco."""
@@ -50,11 +148,11 @@ class UserProfile(SQLModel, table=True):
 
 class Transaction(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    accountId: Optional[int] = Field(default=None, foreign_key="account.id")
+    accountId: Optional[int] = Field(default=None, foreign_key="account.id", ondelete="SET NULL")
     description: str
     amount: float
     type: str  # 'income' | 'expense'
-    date: str
+    date: str = Field(index=True)
     category: str
     status: str = "completed" # 'completed' | 'pending'
 
@@ -83,10 +181,12 @@ class Budget(SQLModel, table=True):
     deadline: Optional[str] = None  # Prazo final (para metas)
     ai_priority_score: Optional[float] = None  # Score de prioridade calculado pela IA (0-100)
     ai_priority_reason: Optional[str] = None  # Explicação da IA sobre a prioridade
+    # Itens saem junto com o orçamento (ON DELETE CASCADE no banco, sem carregá-los)
+    items: List["BudgetItem"] = Relationship(cascade_delete=True, passive_deletes=True)
 
 class BudgetItem(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    budget_id: int = Field(foreign_key="budget.id")
+    budget_id: int = Field(foreign_key="budget.id", ondelete="CASCADE")
     name: str  # "Compra de sofá", "Reforma cozinha"
     target_amount: float
     spent: float = 0
@@ -111,13 +211,19 @@ class Debt(SQLModel, table=True):
     name: str
     remaining: float
     monthly: float
-    dueDate: str
+    dueDate: str = Field(index=True)
     status: str
     isUrgent: bool = False
     debtType: str = "parcelado"
     totalInstallments: Optional[int] = None
     currentInstallment: Optional[int] = None
     category: str = Field(default="Outros")
+    interestRate: Optional[float] = None  # Juros ao mês em % (opcional)
+    # Recorrência (opcional; sem ela vale a regra derivada de debtType/parcelas/dueDate)
+    recurrenceFreq: Optional[str] = None  # 'monthly' | 'none'
+    recurrenceDay: Optional[int] = None  # Dia do mês (meses curtos usam o último dia)
+    recurrenceCount: Optional[int] = None  # Nº de ocorrências (vazio = sem fim)
+    recurrenceStart: Optional[str] = None  # Primeira ocorrência (YYYY-MM-DD)
 
 class Alert(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -127,6 +233,38 @@ class Alert(SQLModel, table=True):
     enabled: bool
     iconName: str
     colorClass: str
+    # Disparos saem junto com o alerta: o id liberado pode ser reaproveitado e a
+    # constraint (alert_id, period) engoliria o primeiro disparo do novo alerta
+    fired: List["FiredAlert"] = Relationship(cascade_delete=True, passive_deletes=True)
+
+class FiredAlert(SQLModel, table=True):
+    """Disparo de um alerta de limite (no máximo um por alerta e mês)"""
+    __table_args__ = (UniqueConstraint("alert_id", "period"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    alert_id: int = Field(foreign_key="alert.id", index=True, ondelete="CASCADE")
+    category: str
+    period: str  # YYYY-MM
+    spent: float  # Gasto da categoria no mês no momento do disparo
+    budget: float
+    threshold: int
+    message: str
+    fired_at: str
+    read: bool = False
+
+class BehavioralAlertState(SQLModel, table=True):
+    """Contadores do mês/dívidas e alertas comportamentais já avaliados (linha única)"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    month: str = ""  # YYYY-MM dos contadores mensais
+    evaluatedOn: str = ""  # Dia da última reconstrução (regras de vencimento dependem da data)
+    monthIncome: float = 0
+    monthExpenses: float = 0
+    debtCount: int = 0
+    debtTotal: float = 0
+    overdueCount: int = 0
+    overdueTotal: float = 0
+    dueSoonCount: int = 0
+    alerts: str = "[]"  # Lista de alertas avaliada (JSON)
+    updated_at: str = ""
 
 class Asset(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -161,6 +299,27 @@ class NetWorthGoal(SQLModel, table=True):
     is_active: bool = True  # Se é a meta ativa
 
 
+class NetWorthSnapshot(SQLModel, table=True):
+    """Fotografia diária do patrimônio (uma linha por dia, sobrescrita a cada mudança)"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    date: str = Field(index=True, unique=True)  # YYYY-MM-DD
+    totalAssets: float = 0
+    totalLiabilities: float = 0
+    totalInvestments: float = 0  # Valor atual da carteira de investimentos
+    netWorth: float = 0
+    updated_at: str = ""
+
+
+class ChangeLog(SQLModel, table=True):
+    """Log de alterações para backups incrementais (o id é o token do backup)"""
+    __table_args__ = (Index("ix_changelog_table_name_id", "table_name", "id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str  # Nome da tabela no backup (ex: "transactions")
+    row_id: int
+    op: str  # "upsert", "delete" ou "reset" (marca o início de uma nova linha de base)
+    changed_at: str = ""
+
+
 class PaycheckAllocation(SQLModel, table=True):
     """Alocação de salário quinzenal - armazena o cabeçalho da alocação"""
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -168,12 +327,14 @@ class PaycheckAllocation(SQLModel, table=True):
     paycheck_amount: float  # Valor recebido
     created_at: str = ""  # Data de criação
     status: str = "draft"  # draft, applied, cancelled
+    apply_key: Optional[str] = None  # Chave de idempotência usada ao aplicar
+    items: List["AllocationItem"] = Relationship(cascade_delete=True, passive_deletes=True)
 
 
 class AllocationItem(SQLModel, table=True):
     """Itens individuais de uma alocação"""
     id: Optional[int] = Field(default=None, primary_key=True)
-    allocation_id: int = Field(foreign_key="paycheckallocation.id")
+    allocation_id: int = Field(foreign_key="paycheckallocation.id", index=True, ondelete="CASCADE")
     category: str  # "essentials", "goals", "budgets", "safety_margin"
     name: str  # Nome do item (ex: "Aluguel", "Viagem")
     amount: float
@@ -182,6 +343,595 @@ class AllocationItem(SQLModel, table=True):
     reference_type: Optional[str] = None  # "debt", "goal", "budget"
 
 
+# ==========================================
+# CACHE ANALÍTICO EM MEMÓRIA (COLUNAR)
+# ==========================================
+# Rotas analíticas (relatórios, alertas, orçamentos, previsões) leem estes arrays
+# em vez de materializar objetos Transaction. O cache é carregado no startup e
+# atualizado pelas rotas de escrita; operações em massa (importação, reset) apenas
+# o invalidam e ele é reconstruído na próxima leitura.
+# Observação: o cache é por processo (uvicorn roda com um único worker).
+
+TRANSACTION_TYPE_CODES = {"expense": 0, "income": 1}
+OTHER_TRANSACTION_TYPE = 2
+INVALID_DAY = np.iinfo(np.int32).min  # data inválida: fica fora de qualquer intervalo
+
+
+def day_number(date_str: str) -> int:
+    """Converte 'YYYY-MM-DD' (ou ISO com horário) em dias desde 1970-01-01."""
+    return int(np.datetime64(date_str[:10], "D").astype(np.int64))
+
+
+def parse_day_number(t_date) -> int:
+    """Como day_number, mas datas ausentes ou inválidas viram INVALID_DAY."""
+    try:
+        parsed = np.datetime64(t_date[:10], "D")
+    except (ValueError, TypeError):
+        return INVALID_DAY
+    return INVALID_DAY if np.isnat(parsed) else int(parsed.astype(np.int64))
+
+
+def day_numbers(dates) -> np.ndarray:
+    """Versão vetorizada de parse_day_number (int64)."""
+    try:
+        parsed = np.array([d[:10] for d in dates], dtype="datetime64[D]")
+    except (ValueError, TypeError):
+        return np.array([parse_day_number(d) for d in dates], dtype=np.int64)
+    days = parsed.astype(np.int64)
+    days[np.isnat(parsed)] = INVALID_DAY
+    return days
+
+
+ALL_CODES = -1  # chave de agregação "todas as contas/categorias" no índice de somas prefixadas
+
+
+class CumulativeSeries:
+    """Somas acumuladas por dia (valor e quantidade) de uma combinação conta/tipo/categoria."""
+
+    __slots__ = ("days", "amounts", "counts", "size")
+
+    def __init__(self, days=None, amounts=None, counts=None):
+        n = 0 if days is None else len(days)
+        capacity = max(16, n * 2)
+        self.days = np.zeros(capacity, dtype=np.int32)
+        self.amounts = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        if n:
+            self.days[:n] = days
+            self.amounts[:n] = amounts
+            self.counts[:n] = counts
+        self.size = n
+
+    def add(self, day: int, amount: float, count: int):
+        """Soma `amount`/`count` ao dia e a todos os acumulados posteriores."""
+        n = self.size
+        pos = int(np.searchsorted(self.days[:n], np.int32(day), side="left"))
+        if pos == n or self.days[pos] != day:
+            if n == len(self.days):
+                for name in ("days", "amounts", "counts"):
+                    column = getattr(self, name)
+                    grown = np.zeros(len(column) * 2, dtype=column.dtype)
+                    grown[:n] = column[:n]
+                    setattr(self, name, grown)
+            for name in ("days", "amounts", "counts"):
+                column = getattr(self, name)
+                column[pos + 1:n + 1] = column[pos:n]
+            self.days[pos] = day
+            self.amounts[pos] = self.amounts[pos - 1] if pos else 0.0
+            self.counts[pos] = self.counts[pos - 1] if pos else 0
+            self.size = n = n + 1
+        self.amounts[pos:n] += amount
+        self.counts[pos:n] += count
+
+    def range(self, start_day: int, end_day: int):
+        """(valor, quantidade) no intervalo inclusivo [start_day, end_day]."""
+        days = self.days[:self.size]
+        lo = int(np.searchsorted(days, np.int32(start_day), side="left"))
+        hi = int(np.searchsorted(days, np.int32(end_day), side="right"))
+        if hi <= lo:
+            return 0.0, 0
+        amount = self.amounts[hi - 1] - (self.amounts[lo - 1] if lo else 0.0)
+        count = self.counts[hi - 1] - (self.counts[lo - 1] if lo else 0)
+        # Arredonda para centavos: a diferença de acumulados carrega resíduo de ponto flutuante
+        return round(float(amount), 2), int(count)
+
+
+class PrefixSumIndex:
+    """
+    Índice de somas prefixadas por (conta, tipo, categoria), com agregados para
+    "todas as contas" e/ou "todas as categorias". O total de qualquer intervalo
+    de datas é a diferença entre dois acumulados localizados por busca binária,
+    independente do tamanho do histórico.
+    """
+
+    def __init__(self):
+        self.series = {}
+
+    @staticmethod
+    def _keys(account: int, t_type: int, category: int):
+        return (
+            (account, t_type, category), (account, t_type, ALL_CODES),
+            (ALL_CODES, t_type, category), (ALL_CODES, t_type, ALL_CODES),
+        )
+
+    def build(self, days, amounts, types, categories, accounts):
+        """Constrói o índice a partir de colunas já ordenadas por dia."""
+        self.series = {}
+        valid = days != INVALID_DAY
+        days, amounts = days[valid], amounts[valid]
+        types, categories, accounts = types[valid], categories[valid], accounts[valid]
+        if not len(days):
+            return
+        everything = np.full(len(days), ALL_CODES, dtype=np.int64)
+        # Chave composta inteira (base mista) para agrupar com um único argsort
+        type_base = OTHER_TRANSACTION_TYPE + 1
+        category_base = int(categories.max()) + 2
+        for account_column, category_column in (
+            (accounts, categories), (accounts, everything),
+            (everything, categories), (everything, everything),
+        ):
+            composite = ((account_column.astype(np.int64) + 1) * type_base + types) * category_base + category_column + 1
+            # Ordenação estável por chave preserva a ordem por dia dentro de cada grupo
+            order = np.argsort(composite, kind="stable")
+            bounds = np.flatnonzero(np.diff(composite[order])) + 1
+            for rows in np.split(order, bounds):
+                group_days = days[rows]
+                starts = np.flatnonzero(np.concatenate(([True], group_days[1:] != group_days[:-1])))
+                day_amounts = np.add.reduceat(amounts[rows], starts)
+                day_counts = np.diff(np.append(starts, len(rows)))
+                row = rows[0]
+                key = (int(account_column[row]), int(types[row]), int(category_column[row]))
+                self.series[key] = CumulativeSeries(group_days[starts], np.cumsum(day_amounts), np.cumsum(day_counts))
+
+    def add(self, day: int, amount: float, t_type: int, category: int, account: int, count: int = 1):
+        if day == INVALID_DAY:
+            return
+        for key in self._keys(account, t_type, category):
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = CumulativeSeries()
+            series.add(day, amount, count)
+
+    def remove(self, day: int, amount: float, t_type: int, category: int, account: int):
+        self.add(day, -amount, t_type, category, account, count=-1)
+
+    def range(self, start_day: int, end_day: int, t_type: int, category: int = ALL_CODES, account: int = ALL_CODES):
+        series = self.series.get((account, t_type, category))
+        return series.range(start_day, end_day) if series is not None else (0.0, 0)
+
+
+class TransactionColumnStore:
+    """
+    Arrays NumPy com data, valor, tipo, categoria e conta de cada transação,
+    mantidos ordenados por data: um intervalo de datas vira uma fatia obtida
+    com busca binária, e só os filtros de tipo/conta são aplicados como máscara.
+    """
+
+    COLUMNS = ("ids", "days", "amounts", "types", "categories", "accounts")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.version = 0
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        capacity = max(1024, capacity)
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.days = np.zeros(capacity, dtype=np.int32)
+        self.amounts = np.zeros(capacity, dtype=np.float64)
+        self.types = np.zeros(capacity, dtype=np.int8)
+        self.categories = np.zeros(capacity, dtype=np.int32)
+        self.accounts = np.zeros(capacity, dtype=np.int32)
+        # Dicionários de codificação (código -> valor e valor -> código)
+        self.category_names = []
+        self._category_codes = {}
+        self.account_ids = []
+        self._account_codes = {}
+        self._days_by_id = {}  # id da transação -> dia (localiza a linha por busca binária)
+        self.prefix = PrefixSumIndex()
+
+    # --- Carga e escrita ---
+
+    def load(self, session: Session):
+        """(Re)constrói o cache a partir do banco com uma única consulta de colunas."""
+        rows = session.exec(select(
+            Transaction.id, Transaction.date, Transaction.amount,
+            Transaction.type, Transaction.category, Transaction.accountId
+        )).all()
+        with self._lock:
+            n = len(rows)
+            self._reset(n * 2)
+            if n:
+                ids, dates, amounts, types, categories, accounts = zip(*rows)
+                days = day_numbers(dates)
+                order = np.argsort(days, kind="stable")
+                self.ids[:n] = np.asarray(ids, dtype=np.int64)[order]
+                self.days[:n] = days[order]
+                self.amounts[:n] = np.asarray([a or 0 for a in amounts], dtype=np.float64)[order]
+                self.types[:n] = np.asarray([TRANSACTION_TYPE_CODES.get(t, OTHER_TRANSACTION_TYPE) for t in types], dtype=np.int8)[order]
+                self.categories[:n] = np.asarray([self._encode(c or "", self.category_names, self._category_codes) for c in categories], dtype=np.int32)[order]
+                self.accounts[:n] = np.asarray([self._encode(a, self.account_ids, self._account_codes) for a in accounts], dtype=np.int32)[order]
+                self._days_by_id = dict(zip(ids, days.tolist()))
+                self.size = n
+                self.prefix.build(self.days[:n], self.amounts[:n], self.types[:n], self.categories[:n], self.accounts[:n])
+            self.version += 1
+            self._loaded = True
+
+    def ensure_loaded(self, session: Session):
+        if not self._loaded:
+            self.load(session)
+
+    def invalidate(self):
+        """Marca o cache para reconstrução (usado após escritas em massa)."""
+        with self._lock:
+            self._loaded = False
+            self.version += 1
+
+    def upsert(self, transaction: Transaction):
+        """Insere ou atualiza uma transação já persistida."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._delete_row(transaction.id)
+            day = parse_day_number(transaction.date)
+            n = self.size
+            if n == len(self.ids):
+                self._grow()
+            # Caso comum (transação de hoje) é um append; datas retroativas deslocam a cauda
+            pos = int(np.searchsorted(self.days[:n], np.int32(day), side="right"))
+            values = (
+                transaction.id, day, transaction.amount or 0,
+                TRANSACTION_TYPE_CODES.get(transaction.type, OTHER_TRANSACTION_TYPE),
+                self._encode(transaction.category or "", self.category_names, self._category_codes),
+                self._encode(transaction.accountId, self.account_ids, self._account_codes),
+            )
+            for name, value in zip(self.COLUMNS, values):
+                column = getattr(self, name)
+                if pos < n:
+                    column[pos + 1:n + 1] = column[pos:n]
+                column[pos] = value
+            self._days_by_id[transaction.id] = day
+            self.size = n + 1
+            self.prefix.add(day, *values[2:])
+            self.version += 1
+
+    def remove(self, transaction_id: int):
+        """Remove uma transação do cache."""
+        with self._lock:
+            if self._loaded and self._delete_row(transaction_id):
+                self.version += 1
+
+    def _delete_row(self, transaction_id: int) -> bool:
+        day = self._days_by_id.pop(transaction_id, None)
+        if day is None:
+            return False
+        n = self.size
+        lo, hi = np.searchsorted(self.days[:n], np.array([day, day + 1], dtype=np.int32))
+        pos = int(lo + np.flatnonzero(self.ids[lo:hi] == transaction_id)[0])
+        self.prefix.remove(day, self.amounts[pos], int(self.types[pos]), int(self.categories[pos]), int(self.accounts[pos]))
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[pos:n - 1] = column[pos + 1:n]
+        self.size = n - 1
+        return True
+
+    def _grow(self):
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    @staticmethod
+    def _encode(value, names: list, codes: dict) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    # --- Consultas vetorizadas ---
+
+    def _select(self, start: Optional[str] = None, end: Optional[str] = None,
+                t_type: Optional[str] = None, account: str = 'all'):
+        """Fatia [lo, hi) do intervalo de datas (inclusivo) e máscara de tipo/conta dentro dela."""
+        n = self.size
+        days = self.days[:n]
+        # Datas inválidas ficam no início do array e nunca entram em intervalos.
+        # Os limites são int32 para que a busca binária não converta o array inteiro.
+        lo = int(np.searchsorted(days, np.int32(day_number(start) if start else INVALID_DAY), side="right" if not start else "left"))
+        hi = int(np.searchsorted(days, np.int32(day_number(end)), side="right")) if end else n
+        hi = max(lo, hi)
+        selected = None
+        if t_type:
+            selected = self.types[lo:hi] == TRANSACTION_TYPE_CODES.get(t_type, OTHER_TRANSACTION_TYPE)
+        if account != 'all':
+            code = self._account_codes.get(int(account))
+            by_account = self.accounts[lo:hi] == (-1 if code is None else code)
+            selected = by_account if selected is None else selected & by_account
+        return lo, hi, selected
+
+    def total_and_count(self, start: Optional[str] = None, end: Optional[str] = None,
+                        t_type: Optional[str] = None, account: str = 'all',
+                        category: Optional[str] = None):
+        """
+        (valor, quantidade) do intervalo de datas (inclusivo) via índice de somas
+        prefixadas: duas buscas binárias por tipo, qualquer que seja o histórico.
+        """
+        with self._lock:
+            account_code = category_code = ALL_CODES
+            if account != 'all':
+                account_code = self._account_codes.get(int(account))
+            if category is not None:
+                category_code = self._category_codes.get(category)
+            if account_code is None or category_code is None:
+                return 0.0, 0
+            start_day = day_number(start) if start else INVALID_DAY + 1
+            end_day = day_number(end) if end else np.iinfo(np.int32).max
+            type_codes = (TRANSACTION_TYPE_CODES.get(t_type, OTHER_TRANSACTION_TYPE),) if t_type \
+                else (*TRANSACTION_TYPE_CODES.values(), OTHER_TRANSACTION_TYPE)
+            amount, count = 0.0, 0
+            for type_code in type_codes:
+                a, c = self.prefix.range(start_day, end_day, type_code, category_code, account_code)
+                amount += a
+                count += c
+            return amount, count
+
+    def total(self, **filters) -> float:
+        return self.total_and_count(**filters)[0]
+
+    def count(self, **filters) -> int:
+        return self.total_and_count(**filters)[1]
+
+    def sum_by_category(self, **filters) -> dict:
+        """Soma por categoria via bincount; só inclui categorias com transações no filtro."""
+        with self._lock:
+            lo, hi, selected = self._select(**filters)
+            codes = self.categories[lo:hi]
+            amounts = self.amounts[lo:hi]
+            size = len(self.category_names)
+            if selected is None:
+                totals = np.bincount(codes, weights=amounts, minlength=size)
+                counts = np.bincount(codes, minlength=size)
+            else:
+                totals = np.bincount(codes, weights=amounts * selected, minlength=size)
+                counts = np.bincount(codes, weights=selected, minlength=size)
+            return {self.category_names[c]: float(totals[c]) for c in np.flatnonzero(counts)}
+
+    def category_periods(self, end_day: int, periods: int, width: int, t_type: str = "expense", span: Optional[int] = None):
+        """
+        Matriz (categorias x períodos) de somas e de contagens: o período k cobre os
+        `width` dias terminando em end_day - k * width. Com `span`, só entram os
+        últimos `span` dias (o último período pode ficar parcial). Um único bincount 2D.
+        Retorna (nomes das categorias, somas, contagens).
+        """
+        with self._lock:
+            n = self.size
+            days = self.days[:n]
+            start_day = end_day - (span or periods * width) + 1
+            lo, hi = np.searchsorted(days, np.array([start_day, end_day + 1], dtype=np.int32))
+            selected = self.types[lo:hi] == TRANSACTION_TYPE_CODES.get(t_type, OTHER_TRANSACTION_TYPE)
+            period = (end_day - days[lo:hi][selected].astype(np.int64)) // width
+            cells = self.categories[lo:hi][selected].astype(np.int64) * periods + period
+            size = len(self.category_names) * periods
+            sums = np.bincount(cells, weights=self.amounts[lo:hi][selected], minlength=size)
+            counts = np.bincount(cells, minlength=size)
+            shape = (len(self.category_names), periods)
+            return list(self.category_names), sums.reshape(shape), counts.reshape(shape)
+
+
+transaction_store = TransactionColumnStore()
+
+
+def get_transaction_store(session: Session) -> TransactionColumnStore:
+    """Retorna o cache colunar, carregando-o se necessário."""
+    transaction_store.ensure_loaded(session)
+    return transaction_store
+
+
+# --- Estatísticas de gasto por categoria ---
+# Janelas móveis de 30/90/365 dias terminando hoje, em "meses" de 30 dias: média,
+# mediana e volatilidade (desvio padrão) do gasto mensal de cada categoria. Total,
+# contagem e média cobrem a janela exata; mediana e volatilidade usam só os meses
+# completos (a janela de 365 dias tem 12 meses e sobra de 5 dias).
+# Calculadas de uma vez a partir do cache colunar e guardadas até a versão do
+# cache (ou o dia) mudar.
+
+SPENDING_WINDOWS = (30, 90, 365)
+SPENDING_PERIOD_DAYS = 30
+
+
+class SpendingStatsCache:
+    """Estatísticas por categoria, recalculadas quando transaction_store.version muda."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._stats = {}
+
+    def get(self, session: Session) -> dict:
+        """{categoria: {"30"|"90"|"365": {mean, median, volatility, total, count}}}"""
+        store = get_transaction_store(session)
+        today = day_number(datetime.now().strftime("%Y-%m-%d"))
+        with self._lock:
+            key = (store.version, today)
+            if self._key != key:
+                self._stats = self._compute(store, today)
+                self._key = key
+            return self._stats
+
+    @staticmethod
+    def _compute(store: TransactionColumnStore, today: int) -> dict:
+        span = max(SPENDING_WINDOWS)
+        periods = -(-span // SPENDING_PERIOD_DAYS)
+        names, sums, counts = store.category_periods(today, periods, SPENDING_PERIOD_DAYS, span=span)
+        stats = {}
+        for window in SPENDING_WINDOWS:
+            k = max(window // SPENDING_PERIOD_DAYS, 1)
+            monthly = sums[:, :k]
+            window_sums, window_counts = sums[:, :k].sum(axis=1), counts[:, :k].sum(axis=1)
+            if window % SPENDING_PERIOD_DAYS:
+                # Sobra parcial: só vale para a maior janela, cujo último período já vem cortado
+                window_sums = window_sums + sums[:, k]
+                window_counts = window_counts + counts[:, k]
+            mean = window_sums * SPENDING_PERIOD_DAYS / window
+            median = np.median(monthly, axis=1)
+            volatility = monthly.std(axis=1)
+            for c in np.flatnonzero(window_counts):
+                stats.setdefault(names[c], {})[str(window)] = {
+                    "mean": round(float(mean[c]), 2),
+                    "median": round(float(median[c]), 2),
+                    "volatility": round(float(volatility[c]), 2),
+                    "total": round(float(window_sums[c]), 2),
+                    "count": int(window_counts[c]),
+                }
+        return stats
+
+
+spending_stats = SpendingStatsCache()
+
+
+def category_monthly_average(stats: dict, category: str, window: int = 90) -> Optional[float]:
+    """Gasto médio mensal da categoria na janela, ou None sem histórico nela."""
+    entry = stats.get(category, {}).get(str(window))
+    return entry["mean"] if entry else None
+
+
+# ==========================================
+# EVENTOS EM TEMPO REAL (SSE)
+# ==========================================
+# Barramento em processo: as rotas (síncronas, no threadpool) publicam eventos e
+# cada conexão SSE tem sua própria fila no event loop do servidor.
+#
+# Eventos tipados de mudança (o frontend aplica o patch em vez de recarregar):
+#   transaction     -> {"action": created|updated|deleted, "transaction": {...}}
+#   account-balance -> {"accountId", "balance"}
+#   budget-spent    -> {"budgetId", "category", "spent"}
+#   debt-status     -> {"action", "debt": {...}}
+#   insight-ready   -> {"kind", ...} (ex.: alertas comportamentais reavaliados)
+# Além deles: alert.fired, heartbeat e resync (cliente perdeu eventos e deve recarregar).
+
+CHANGE_EVENT_TYPES = ("transaction", "account-balance", "budget-spent", "debt-status", "insight-ready")
+
+
+class EventSubscription:
+    """Fila limitada de uma conexão. Cliente lento perde os eventos mais antigos."""
+
+    def __init__(self, loop, maxsize: int, types: Optional[set] = None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.types = types
+        self.dropped = 0  # Eventos descartados desde a última entrega
+
+    def wants(self, event_type: str) -> bool:
+        return self.types is None or event_type in self.types
+
+    def deliver(self, message: dict):
+        if self.queue.full():
+            self.queue.get_nowait()  # Backpressure: descarta o evento mais antigo
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def next_message(self, timeout: float) -> Optional[dict]:
+        """Próximo evento, `resync` se houve descarte, ou None no timeout (heartbeat)."""
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"id": None, "type": "resync", "data": {"dropped": dropped}, "at": datetime.now().isoformat()}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    """Distribui eventos para as conexões abertas em /api/events."""
+
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._sequence = 0
+
+    def subscribe(self, types: Optional[set] = None) -> EventSubscription:
+        subscription = EventSubscription(asyncio.get_running_loop(), self.QUEUE_SIZE, types)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type: str, data: dict):
+        """Pode ser chamado de qualquer thread."""
+        with self._lock:
+            self._sequence += 1
+            message = {"id": self._sequence, "type": event_type, "data": data, "at": datetime.now().isoformat()}
+            subscribers = [s for s in self._subscribers if s.wants(event_type)]
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                self.unsubscribe(subscription)  # Loop já encerrado
+
+
+event_bus = EventBus()
+
+
+# --- Eventos pendentes da sessão ---
+# Helpers que rodam antes do commit enfileiram eventos na sessão; eles só são
+# publicados se o commit acontecer (rollback descarta).
+
+def queue_event(session: Session, event_type: str, data: dict):
+    session.info.setdefault("pending_events", []).append((event_type, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    for event_type, data in session.info.pop("pending_events", []):
+        event_bus.publish(event_type, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_events(session):
+    session.info.pop("pending_events", None)
+
+
+# --- Publicadores tipados (chamar depois do commit) ---
+
+def publish_transaction_change(session: Session, action: str, transaction: dict, *fields: Optional[tuple]):
+    """
+    Publica a transação alterada e o novo `spent` dos orçamentos afetados.
+    `fields` são os transaction_fields de antes/depois da escrita.
+    """
+    event_bus.publish("transaction", {"action": action, "transaction": transaction})
+    publish_budget_spent(session, {f[3] for f in fields if f is not None and f[0] == "expense"})
+
+
+def publish_budget_spent(session: Session, categories: set):
+    if not categories:
+        return
+    budgets = session.exec(select(Budget.id, Budget.category).where(Budget.category.in_(categories))).all()
+    if not budgets:
+        return
+    store = get_transaction_store(session)
+    for budget_id, category in budgets:
+        # Mesmo cálculo de read_budgets: total de despesas da categoria
+        spent = round(store.total(t_type="expense", category=category), 2)
+        event_bus.publish("budget-spent", {"budgetId": budget_id, "category": category, "spent": spent})
+
+
+def publish_account_balance(account: "Account"):
+    event_bus.publish("account-balance", {"accountId": account.id, "balance": account.balance})
+
+
+def publish_debt_status(action: str, debt: dict):
+    event_bus.publish("debt-status", {"action": action, "debt": debt})
+
+
 # ==========================================
 # 3. INICIALIZAÇÃO DA API
 # ==========================================
@@ -204,8 +954,19 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    with Session(engine) as session:
+        transaction_store.load(session)
+        # Garante a fotografia de hoje e agenda o tick diário de patrimônio
+        record_net_worth_snapshot(session)
+    net_worth_scheduler_stop.clear()
+    threading.Thread(target=run_net_worth_snapshot_scheduler, daemon=True).start()
     # Se quiser criar dados iniciais (Seed), chame uma função aqui.
 
+
+@app.on_event("shutdown")
+def on_shutdown():
+    net_worth_scheduler_stop.set()
+
 def ask_ai_analysis(prompt: str, session: Session):
     """Função auxiliar para consultar a IA configurada."""
     settings = session.exec(select(AISettings)).first()
@@ -389,247 +1150,680 @@ def test_ai_connection(session: Session = Depends(get_session)):
 
 # --- BACKUP & RESTAURAÇÃO ---
 
+BACKUP_FORMAT_VERSION = "2.0"
+BACKUP_CHUNK_ROWS = 1000  # Linhas por lote lido do cursor e por bloco comprimido
+
+
+def get_backup_tables() -> list:
+    """
+    Tabelas do backup, pais antes de filhos (ordem segura para importar).
+    Ficam de fora AISettings (chave de API) e BehavioralAlertState (derivado).
+    """
+    return [
+        ("profile", UserProfile),
+        ("accounts", Account),
+        ("transactions", Transaction),
+        ("budgets", Budget),
+        ("budget_items", BudgetItem),
+        ("goals", Goal),
+        ("debts", Debt),
+        ("categories", Category),
+        ("alerts", Alert),
+        ("fired_alerts", FiredAlert),
+        ("assets", Asset),
+        ("liabilities", Liability),
+        ("investments", Investment),
+        ("investment_prices", InvestmentPrice),
+        ("net_worth_goals", NetWorthGoal),
+        ("net_worth_snapshots", NetWorthSnapshot),
+        ("life_projects", LifeProject),
+        ("project_tasks", ProjectTask),
+        ("paycheck_allocations", PaycheckAllocation),
+        ("allocation_items", AllocationItem),
+    ]
+
+
+# --- Log de alterações (backups incrementais) ---
+# Toda escrita via ORM registra (tabela, id, op) em ChangeLog no mesmo flush.
+# Escritas em massa via Core não passam por aqui: as pontuais (apply_allocation)
+# chamam record_changes; importação e reset chamam reset_change_log,
+# invalidando tokens anteriores.
+
+_backup_table_names = {}
+
+
+def _backup_name(model) -> Optional[str]:
+    if not _backup_table_names:
+        _backup_table_names.update((model, name) for name, model in get_backup_tables())
+    return _backup_table_names.get(model)
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    now = datetime.now().isoformat()
+    entries = []
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    for objects, op in ((session.new, "upsert"), (modified, "upsert"), (session.deleted, "delete")):
+        for obj in objects:
+            name = _backup_name(type(obj))
+            if name is not None and obj.id is not None:
+                entries.append({"table_name": name, "row_id": obj.id, "op": op, "changed_at": now})
+    if entries:
+        session.connection().execute(insert(ChangeLog.__table__), entries)
+
+
+def record_changes(session: Session, model, ids, op: str = "upsert"):
+    """Registra no log linhas escritas via Core (insert/update em massa)."""
+    name = _backup_name(model)
+    now = datetime.now().isoformat()
+    entries = [{"table_name": name, "row_id": row_id, "op": op, "changed_at": now} for row_id in ids]
+    if name is not None and entries:
+        session.connection().execute(insert(ChangeLog.__table__), entries)
+
+
+def reset_change_log(conn):
+    """
+    Começa uma nova linha de base: grava o marcador "reset" e descarta o log
+    anterior. O marcador fica com o maior id, então os tokens seguem crescentes.
+    """
+    marker_id = conn.execute(insert(ChangeLog.__table__).returning(ChangeLog.__table__.c.id), {
+        "table_name": "*", "row_id": 0, "op": "reset", "changed_at": datetime.now().isoformat(),
+    }).scalar_one()
+    conn.execute(delete(ChangeLog.__table__).where(ChangeLog.__table__.c.id < marker_id))
+
+
+def get_backup_token(conn) -> tuple:
+    """(token atual, id do último reset): um `since` só vale entre os dois."""
+    log = ChangeLog.__table__
+    token = conn.execute(select(func.max(log.c.id))).scalar() or 0
+    reset_id = conn.execute(select(func.max(log.c.id)).where(log.c.op == "reset")).scalar() or 0
+    return token, reset_id
+
+
+def iter_backup_batches(since: Optional[int] = None):
+    """
+    Gera o backup como NDJSON, em lotes de linhas: um cabeçalho, uma linha
+    {"table", "row"} por registro e um rodapé com as contagens. Cada tabela é lida
+    com cursor em lotes (yield_per), então a memória não depende do tamanho do banco.
+    Com `since`, só saem as linhas alteradas depois do token (modo "delta"), e as
+    removidas viram {"table", "delete": id} (filhos antes dos pais).
+    """
+    tables = get_backup_tables()
+    encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+    log = ChangeLog.__table__
+    counts, deleted = {}, {}
+    with engine.connect() as conn:
+        token, _ = get_backup_token(conn)
+        yield [encode({
+            "type": "header",
+            "version": BACKUP_FORMAT_VERSION,
+            "appName": "Axxy Finance",
+            "exportedAt": datetime.now().isoformat(),
+            "mode": "full" if since is None else "delta",
+            "since": since,
+            "token": token,
+            "tables": [name for name, _ in tables],
+        })]
+        streaming = conn.execution_options(yield_per=BACKUP_CHUNK_ROWS)
+        for name, model in tables:
+            table = model.__table__
+            query = select(table).order_by(*table.primary_key.columns)
+            if since is not None:
+                changed = select(log.c.row_id).where(log.c.table_name == name, log.c.id > since, log.c.id <= token)
+                query = query.where(table.c.id.in_(changed))
+            result = streaming.execute(query)
+            keys = list(result.keys())
+            prefix = f'{{"table": {encode(name)}, "row": '
+            counts[name] = 0
+            for rows in result.partitions():
+                counts[name] += len(rows)
+                yield [prefix + encode(dict(zip(keys, row))) + "}" for row in rows]
+        if since is not None:
+            for name, model in reversed(tables):
+                table = model.__table__
+                result = streaming.execute(
+                    select(log.c.row_id).distinct()
+                    .where(log.c.table_name == name, log.c.id > since, log.c.id <= token, log.c.op == "delete")
+                    .where(log.c.row_id.not_in(select(table.c.id)))
+                    .order_by(log.c.row_id)
+                )
+                prefix = f'{{"table": {encode(name)}, "delete": '
+                for rows in result.partitions():
+                    deleted[name] = deleted.get(name, 0) + len(rows)
+                    yield [prefix + encode(row[0]) + "}" for row in rows]
+    yield [encode({"type": "end", "counts": counts, "deleted": deleted})]
+
+
+def iter_gzip_chunks(batches):
+    """Comprime os lotes de linhas em um único stream gzip, emitindo blocos conforme ficam prontos."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: cabeçalho gzip
+    for lines in batches:
+        chunk = compressor.compress(("\n".join(lines) + "\n").encode("utf-8"))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
 @app.get("/api/backup/export")
-def export_backup(session: Session = Depends(get_session)):
+def export_backup(since: Optional[int] = None):
     """
-    Exporta todos os dados do banco em formato JSON para backup.
-    Retorna um arquivo JSON com todas as tabelas.
+    Exporta todas as tabelas como NDJSON comprimido (gzip), em streaming.
+    Com `since=<token>` (o `token` do cabeçalho do backup anterior), exporta só
+    o que mudou desde então. O arquivo pode ser restaurado por /api/backup/import.
     """
-    # Buscar todos os dados de cada tabela
-    profile = session.exec(select(UserProfile)).first()
-    accounts = session.exec(select(Account)).all()
-    transactions = session.exec(select(Transaction)).all()
-    budgets = session.exec(select(Budget)).all()
-    budget_items = session.exec(select(BudgetItem)).all()
-    goals = session.exec(select(Goal)).all()
-    debts = session.exec(select(Debt)).all()
-    categories = session.exec(select(Category)).all()
-    alerts = session.exec(select(Alert)).all()
-    assets = session.exec(select(Asset)).all()
-    liabilities = session.exec(select(Liability)).all()
-    
-    # Converter para dicionários
-    backup_data = {
-        "version": "1.0",
-        "appName": "Axxy Finance",
-        "exportedAt": datetime.now().isoformat(),
-        "data": {
-            "profile": {
-                "name": profile.name if profile else "Usuário Axxy",
-                "email": profile.email if profile else "usuario@email.com",
-                "avatar": profile.avatar if profile else ""
-            } if profile else None,
-            "accounts": [
-                {"id": a.id, "name": a.name, "type": a.type, "balance": a.balance, "color": a.color, "icon": a.icon}
-                for a in accounts
-            ],
-            "transactions": [
-                {"id": t.id, "accountId": t.accountId, "description": t.description, "amount": t.amount, 
-                 "type": t.type, "date": t.date, "category": t.category, "status": t.status}
-                for t in transactions
-            ],
-            "budgets": [
-                {"id": b.id, "category": b.category, "spent": b.spent, "limit": b.limit, "icon": b.icon,
-                 "priority": b.priority, "goal": b.goal, "budget_type": b.budget_type,
-                 "target_amount": b.target_amount, "current_amount": b.current_amount, "deadline": b.deadline,
-                 "ai_priority_score": b.ai_priority_score, "ai_priority_reason": b.ai_priority_reason}
-                for b in budgets
-            ],
-            "budget_items": [
-                {"id": bi.id, "budget_id": bi.budget_id, "name": bi.name, "target_amount": bi.target_amount,
-                 "spent": bi.spent, "completed": bi.completed}
-                for bi in budget_items
-            ],
-            "goals": [
-                {"id": g.id, "name": g.name, "currentAmount": g.currentAmount, "targetAmount": g.targetAmount,
-                 "deadline": g.deadline, "color": g.color, "imageUrl": g.imageUrl}
-                for g in goals
-            ],
-            "debts": [
-                {"id": d.id, "name": d.name, "remaining": d.remaining, "monthly": d.monthly,
-                 "dueDate": d.dueDate, "status": d.status, "isUrgent": d.isUrgent, "debtType": d.debtType,
-                 "totalInstallments": d.totalInstallments, "currentInstallment": d.currentInstallment}
-                for d in debts
-            ],
-            "categories": [
-                {"id": c.id, "name": c.name, "type": c.type, "color": c.color}
-                for c in categories
-            ],
-            "alerts": [
-                {"id": a.id, "category": a.category, "budget": a.budget, "threshold": a.threshold,
-                 "enabled": a.enabled, "iconName": a.iconName, "colorClass": a.colorClass}
-                for a in alerts
-            ],
-            "assets": [
-                {"id": a.id, "name": a.name, "type": a.type, "value": a.value, "iconType": a.iconType}
-                for a in assets
-            ],
-            "liabilities": [
-                {"id": l.id, "name": l.name, "type": l.type, "value": l.value, "iconType": l.iconType}
-                for l in liabilities
-            ]
+    if since is not None:
+        with engine.connect() as conn:
+            token, reset_id = get_backup_token(conn)
+        if not reset_id <= since <= token:
+            raise HTTPException(status_code=409, detail="Token de backup inválido ou expirado: faça um backup completo")
+    kind = "full" if since is None else f"delta-{since}"
+    filename = f"axxy-backup-{datetime.now().strftime('%Y-%m-%d')}-{kind}.ndjson.gz"
+    return StreamingResponse(
+        iter_gzip_chunks(iter_backup_batches(since)),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+class BackupImportError(ValueError):
+    """Arquivo de backup malformado (vira HTTP 400)."""
+
+
+def open_backup(stream) -> tuple:
+    """
+    Abre um backup (arquivo binário com seek) e devolve (cabeçalho, linhas), onde
+    linhas gera (tabela, linha, op) em ordem, com op "upsert" ou "delete".
+    Aceita o NDJSON do export (gzip ou não) e o JSON legado `{"version", "data": {...}}`.
+    """
+    magic = stream.read(2)
+    stream.seek(0)
+    text_stream = io.TextIOWrapper(gzip.GzipFile(fileobj=stream, mode="rb") if magic == b"\x1f\x8b" else stream, encoding="utf-8")
+    first_line = text_stream.readline()
+    try:
+        header = json.loads(first_line)
+    except json.JSONDecodeError:
+        header = None
+    if isinstance(header, dict) and header.get("type") == "header":
+        return header, _read_ndjson_rows(text_stream)
+    # JSON legado: documento único (o tamanho já é limitado pelo formato antigo)
+    text_stream.seek(0)
+    try:
+        backup_data = json.load(text_stream)
+    except json.JSONDecodeError:
+        raise BackupImportError("Formato de backup inválido: JSON malformado")
+    if not isinstance(backup_data, dict) or "data" not in backup_data:
+        raise BackupImportError("Formato de backup inválido: campo 'data' não encontrado")
+    header = {"type": "header", "version": backup_data.get("version"), "mode": "full"}
+    return header, _read_legacy_rows(backup_data["data"])
+
+
+def _read_legacy_rows(data: dict):
+    for name, _ in get_backup_tables():
+        rows = data.get(name) or []
+        for row in [rows] if isinstance(rows, dict) else rows:
+            yield name, row, "upsert"
+
+
+def _read_ndjson_rows(lines):
+    finished = False
+    for line_number, line in enumerate(lines, start=2):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise BackupImportError(f"Linha {line_number} do backup é inválida")
+        if record.get("type") == "end":
+            finished = True
+            break
+        if "delete" in record:
+            yield record["table"], {"id": record["delete"]}, "delete"
+        else:
+            yield record["table"], record["row"], "upsert"
+    if not finished:
+        raise BackupImportError("Backup incompleto: rodapé não encontrado")
+
+
+def upsert_insert(conn):
+    """insert() do dialeto com ON CONFLICT (PostgreSQL/SQLite), ou None se não houver."""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _column_defaults(model) -> tuple:
+    """Defaults fixos e factories dos campos (insert em Core não passa pelo SQLModel)."""
+    defaults, factories = {}, {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            factories[name] = field.default_factory
+        elif field.default is not PydanticUndefined and field.default is not None:
+            defaults[name] = field.default
+    return defaults, factories
+
+
+class BackupImporter:
+    """
+    Importa linhas em lotes via insert em Core, preservando as chaves primárias.
+
+    Backup completo: linhas sem id (ou com id repetido) recebem um novo id via
+    RETURNING e as chaves estrangeiras são remapeadas em memória a partir dos ids
+    já importados: referência órfã vira NULL (coluna opcional) ou descarta a linha
+    (obrigatória). Delta: as linhas são aplicadas por upsert no id, sem remapear.
+
+    Cada lote roda em um SAVEPOINT; se falhar, o lote é refeito linha a linha
+    para descartar só as linhas inválidas.
+    """
+
+    def __init__(self, conn, delta: bool = False):
+        self.conn = conn
+        self.delta = delta
+        self.tables = dict(get_backup_tables())
+        self.table_names = {model.__table__.name: name for name, model in self.tables.items()}
+        # Só as tabelas referenciadas por alguma FK precisam do mapa id antigo -> novo
+        parents = {
+            self.table_names[fk.column.table.name]
+            for model in self.tables.values()
+            for fk in model.__table__.foreign_keys
+            if fk.column.table.name in self.table_names
         }
+        self.id_maps = {name: {} for name in self.tables if name in parents}
+        self.imported = {name: 0 for name in self.tables}
+        self.deleted = {name: 0 for name in self.tables}
+        self.skipped = {name: 0 for name in self.tables}
+        self._plans = {}
+
+    def _plan(self, name: str):
+        """Colunas, defaults e FKs (coluna, tabela pai, anulável) de uma tabela."""
+        if name not in self._plans:
+            table = self.tables[name].__table__
+            foreign_keys = [
+                (fk.parent.name, self.table_names[fk.column.table.name], fk.parent.nullable)
+                for fk in table.foreign_keys
+                if fk.column.table.name in self.table_names
+            ]
+            defaults, factories = _column_defaults(self.tables[name])
+            self._plans[name] = (table, set(table.columns.keys()), defaults, factories, foreign_keys)
+        return self._plans[name]
+
+    def _prepare(self, name: str, row: dict) -> Optional[dict]:
+        _, columns, defaults, factories, foreign_keys = self._plan(name)
+        if row.keys() <= columns:
+            values = {**defaults, **row}
+        else:
+            values = {**defaults, **{key: value for key, value in row.items() if key in columns}}
+        for key, factory in factories.items():
+            if key not in values:
+                values[key] = factory()
+        if self.delta:
+            return values if values.get("id") is not None else None
+        for column, parent, nullable in foreign_keys:
+            reference = values.get(column)
+            if reference is None:
+                continue
+            mapped = self.id_maps[parent].get(reference)
+            if mapped is None:
+                if not nullable:
+                    return None
+            values[column] = mapped
+        return values
+
+    def insert_chunk(self, name: str, rows: List[dict]):
+        prepared = []
+        for row in rows:
+            values = self._prepare(name, row)
+            if values is None:
+                self.skipped[name] += 1
+            else:
+                prepared.append(values)
+        if not prepared:
+            return
+        try:
+            with self.conn.begin_nested():
+                self._insert(name, prepared)
+        except IntegrityError:
+            for values in prepared:  # Isola as linhas problemáticas
+                try:
+                    with self.conn.begin_nested():
+                        self._insert(name, [values])
+                except IntegrityError:
+                    self._insert_renumbered(name, values)
+
+    def _insert_renumbered(self, name: str, values: dict):
+        """Sem mapa de ids, um id repetido só aparece no conflito: tenta de novo com id novo."""
+        if name in self.id_maps or values.get("id") is None:
+            self.skipped[name] += 1
+            return
+        try:
+            with self.conn.begin_nested():
+                self._insert(name, [{key: value for key, value in values.items() if key != "id"}])
+        except IntegrityError:
+            self.skipped[name] += 1
+
+    def delete_chunk(self, name: str, rows: List[dict]):
+        table = self._plan(name)[0]
+        result = self.conn.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+        self.deleted[name] += result.rowcount
+
+    def _upsert_statement(self, table):
+        dialect_insert = upsert_insert(self.conn)
+        if dialect_insert is None:
+            raise BackupImportError("Backup incremental não suportado neste banco de dados")
+        statement = dialect_insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={column.name: statement.excluded[column.name] for column in table.columns if column.name != "id"},
+        )
+
+    def _insert(self, name: str, rows: List[dict]):
+        table = self._plan(name)[0]
+        if self.delta:
+            self.conn.execute(self._upsert_statement(table), rows)
+            self.imported[name] += len(rows)
+            return
+        id_map = self.id_maps.get(name)
+        keep, renumber, old_ids = [], [], []
+        for values in rows:
+            old_id = values.get("id")
+            if old_id is not None and (id_map is None or old_id not in id_map):
+                keep.append(values)
+            else:
+                renumber.append({key: value for key, value in values.items() if key != "id"})
+                old_ids.append(old_id)
+        if keep:
+            self.conn.execute(insert(table), keep)
+        new_ids = []
+        if renumber:
+            new_ids = self.conn.execute(insert(table).returning(table.c.id), renumber).scalars().all()
+        if id_map is None:
+            self.imported[name] += len(rows)
+            return
+        # Só registra os ids depois que o lote inteiro entrou
+        for values in keep:
+            id_map[values["id"]] = values["id"]
+        for old_id, new_id in zip(old_ids, new_ids):
+            if old_id is not None:
+                id_map.setdefault(old_id, new_id)
+        self.imported[name] += len(rows)
+
+    def reset_sequences(self):
+        """PostgreSQL: ids explícitos não avançam a sequence do SERIAL."""
+        if self.conn.dialect.name != "postgresql":
+            return
+        for name, model in self.tables.items():
+            if self.imported[name]:
+                quoted = self.conn.dialect.identifier_preparer.quote(model.__table__.name)
+                self.conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{quoted}', 'id'), "
+                    f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {quoted}"
+                ))
+
+
+def import_backup_stream(stream) -> dict:
+    """
+    Aplica um backup numa única transação. Completo: substitui todos os dados.
+    Delta: aplica upserts e remoções sobre os dados atuais.
+    """
+    header, rows = open_backup(stream)
+    delta = header.get("mode") == "delta"
+    with engine.begin() as conn:
+        # BehavioralAlertState é derivado: reconstruído na próxima leitura
+        models = [BehavioralAlertState] if delta else [BehavioralAlertState] + [model for _, model in get_backup_tables()]
+        clear_tables(conn, models)
+
+        importer = BackupImporter(conn, delta=delta)
+        chunk, chunk_key = [], None
+        for name, row, op in rows:
+            if name not in importer.tables or not isinstance(row, dict):
+                continue
+            if (name, op) != chunk_key or len(chunk) >= BACKUP_CHUNK_ROWS:
+                if chunk:
+                    _apply_backup_chunk(importer, chunk_key, chunk)
+                chunk, chunk_key = [], (name, op)
+            chunk.append(row)
+        if chunk:
+            _apply_backup_chunk(importer, chunk_key, chunk)
+        importer.reset_sequences()
+        # O log local não descreve mais os dados: tokens anteriores deixam de valer
+        reset_change_log(conn)
+    return {
+        "mode": "delta" if delta else "full",
+        "imported": importer.imported,
+        "deleted": {k: v for k, v in importer.deleted.items() if v},
+        "skipped": {k: v for k, v in importer.skipped.items() if v},
     }
-    
-    return backup_data
+
+
+def _apply_backup_chunk(importer: BackupImporter, chunk_key: tuple, rows: List[dict]):
+    name, op = chunk_key
+    if op == "delete":
+        importer.delete_chunk(name, rows)
+    else:
+        importer.insert_chunk(name, rows)
 
 
 @app.post("/api/backup/import")
-def import_backup(backup_data: dict, session: Session = Depends(get_session)):
+async def import_backup(request: Request):
+    """
+    Importa um backup (NDJSON do export, gzip ou não, ou o JSON legado) enviado
+    como corpo da requisição. Um delta (export com `since`) é aplicado por cima
+    dos dados atuais.
+    ATENÇÃO: um backup completo substitui TODOS os dados existentes!
+    """
+    # O corpo vai para um arquivo temporário (em disco acima de 8MB), não para a memória
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        try:
+            result = await run_in_threadpool(import_backup_stream, upload)
+        except BackupImportError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao importar backup: {str(e)}")
+        finally:
+            transaction_store.invalidate()
+            debt_recurrence.invalidate()
+            alert_rules.invalidate()
+
+    with Session(engine) as session:
+        record_net_worth_snapshot(session)
+
+    return {
+        "success": True,
+        "message": "Backup importado com sucesso!",
+        **result,
+    }
+
+
+# --- FOTOGRAFIA CONSISTENTE DO BANCO (ADMIN) ---
+# SQLite: API de backup online do sqlite3, em lotes de páginas com pausa entre
+# eles para não travar quem está escrevendo. PostgreSQL: dump lógico com COPY
+# dentro de uma transação REPEATABLE READ (todas as tabelas no mesmo instante).
+
+SNAPSHOT_PAGES_PER_STEP = 1024  # Páginas copiadas por passo (~4MB com páginas de 4KB)
+SNAPSHOT_STEP_SLEEP = 0.01  # Pausa entre passos (segundos): libera o banco para escritas
+SNAPSHOT_MAX_RESTARTS = 3  # Reinícios tolerados antes de copiar o resto num passo só
+SNAPSHOT_READ_SIZE = 1024 * 1024
+
+
+def create_database_snapshot() -> tuple:
     """
-    Importa dados de um backup JSON.
-    ATENÇÃO: Isso substitui TODOS os dados existentes!
+    Grava a fotografia num arquivo temporário e retorna (caminho, nome sugerido
+    do arquivo comprimido). Quem consome deve apagar o arquivo.
     """
+    stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    if engine.dialect.name == "sqlite":
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        filename = f"axxy-snapshot-{stamp}.db.gz"
+        writer = _write_sqlite_snapshot
+    elif engine.dialect.name == "postgresql":
+        fd, path = tempfile.mkstemp(suffix=".sql")
+        os.close(fd)
+        filename = f"axxy-snapshot-{stamp}.sql.gz"
+        writer = _write_postgres_dump
+    else:
+        raise RuntimeError(f"Fotografia não suportada para {engine.dialect.name}")
     try:
-        # Validar estrutura básica
-        if "data" not in backup_data:
-            raise HTTPException(status_code=400, detail="Formato de backup inválido: campo 'data' não encontrado")
-        
-        data = backup_data["data"]
-        
-        # Limpar dados existentes (em ordem para respeitar foreign keys)
-        session.exec(select(BudgetItem)).all()
-        for item in session.exec(select(BudgetItem)).all():
-            session.delete(item)
-        
-        for table in [Transaction, Budget, Goal, Debt, Category, Alert, Asset, Liability, Account, UserProfile]:
-            for record in session.exec(select(table)).all():
-                session.delete(record)
-        
-        session.commit()
-        
-        # Importar perfil
-        if data.get("profile"):
-            p = data["profile"]
-            profile = UserProfile(name=p.get("name", "Usuário"), email=p.get("email", ""), avatar=p.get("avatar", ""))
-            session.add(profile)
-        
-        # Importar contas
-        account_id_map = {}  # Mapear IDs antigos para novos
-        for acc in data.get("accounts", []):
-            old_id = acc.pop("id", None)
-            new_account = Account(**acc)
-            session.add(new_account)
-            session.flush()  # Para obter o novo ID
-            if old_id:
-                account_id_map[old_id] = new_account.id
-        
-        # Importar transações (atualizando accountId)
-        for tx in data.get("transactions", []):
-            tx.pop("id", None)
-            old_account_id = tx.get("accountId")
-            if old_account_id and old_account_id in account_id_map:
-                tx["accountId"] = account_id_map[old_account_id]
-            session.add(Transaction(**tx))
-        
-        # Importar orçamentos
-        budget_id_map = {}
-        for bud in data.get("budgets", []):
-            old_id = bud.pop("id", None)
-            new_budget = Budget(**bud)
-            session.add(new_budget)
-            session.flush()
-            if old_id:
-                budget_id_map[old_id] = new_budget.id
-        
-        # Importar itens de orçamento
-        for bi in data.get("budget_items", []):
-            bi.pop("id", None)
-            old_budget_id = bi.get("budget_id")
-            if old_budget_id and old_budget_id in budget_id_map:
-                bi["budget_id"] = budget_id_map[old_budget_id]
-            session.add(BudgetItem(**bi))
-        
-        # Importar metas
-        for goal in data.get("goals", []):
-            goal.pop("id", None)
-            session.add(Goal(**goal))
-        
-        # Importar dívidas
-        for debt in data.get("debts", []):
-            debt.pop("id", None)
-            session.add(Debt(**debt))
-        
-        # Importar categorias
-        for cat in data.get("categories", []):
-            cat.pop("id", None)
-            session.add(Category(**cat))
-        
-        # Importar alertas
-        for alert in data.get("alerts", []):
-            alert.pop("id", None)
-            session.add(Alert(**alert))
-        
-        # Importar ativos
-        for asset in data.get("assets", []):
-            asset.pop("id", None)
-            session.add(Asset(**asset))
-        
-        # Importar passivos
-        for liability in data.get("liabilities", []):
-            liability.pop("id", None)
-            session.add(Liability(**liability))
-        
-        session.commit()
-        
-        return {
-            "success": True,
-            "message": "Backup importado com sucesso!",
-            "imported": {
-                "accounts": len(data.get("accounts", [])),
-                "transactions": len(data.get("transactions", [])),
-                "budgets": len(data.get("budgets", [])),
-                "goals": len(data.get("goals", [])),
-                "debts": len(data.get("debts", [])),
-                "categories": len(data.get("categories", []))
-            }
-        }
-        
-    except HTTPException:
+        writer(path)
+    except Exception:
+        os.remove(path)
         raise
+    return path, filename
+
+
+class _SnapshotRestarted(Exception):
+    pass
+
+
+def _write_sqlite_snapshot(path: str):
+    source = sqlite3.connect(engine.url.database)
+    target = sqlite3.connect(path)
+    state = {"remaining": None, "restarts": 0}
+
+    def pause_between_steps(status, remaining, total):
+        # Escrita de outra conexão no meio faz o sqlite reiniciar a cópia
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > SNAPSHOT_MAX_RESTARTS:
+                raise _SnapshotRestarted()
+        state["remaining"] = remaining
+        time.sleep(SNAPSHOT_STEP_SLEEP)
+
+    try:
+        try:
+            # A cada passo o lock de leitura é solto, então as escritas seguem
+            source.backup(target, pages=SNAPSHOT_PAGES_PER_STEP, progress=pause_between_steps)
+        except _SnapshotRestarted:
+            # Escritas contínuas: termina num passo só (lock de leitura até o fim)
+            source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _write_postgres_dump(path: str):
+    """Dump só de dados, restaurável com `psql` sobre o schema criado pela API."""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        quote = engine.dialect.identifier_preparer.quote
+        tables = SQLModel.metadata.sorted_tables  # Pais antes de filhos
+        with open(path, "wb") as output:
+            output.write(f"-- Axxy Finance: dump lógico gerado em {datetime.now().isoformat()}\nBEGIN;\n".encode())
+            for table in tables:
+                columns = ", ".join(quote(column.name) for column in table.columns)
+                output.write(f"\nCOPY {quote(table.name)} ({columns}) FROM stdin;\n".encode())
+                cursor.copy_expert(f"COPY {quote(table.name)} ({columns}) TO STDOUT", output)
+                output.write(b"\\.\n")
+            for table in tables:
+                if "id" in table.columns and table.c.id.autoincrement:
+                    name = quote(table.name)
+                    output.write(
+                        f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                        f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {name};\n".encode()
+                    )
+            output.write(b"COMMIT;\n")
+        raw.rollback()
+    finally:
+        raw.close()
+
+
+def iter_snapshot_chunks(path: str):
+    """Lê a fotografia em blocos comprimindo em gzip, e apaga o arquivo no fim."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        with open(path, "rb") as snapshot:
+            while block := snapshot.read(SNAPSHOT_READ_SIZE):
+                chunk = compressor.compress(block)
+                if chunk:
+                    yield chunk
+        yield compressor.flush()
+    finally:
+        os.remove(path)
+
+
+def require_admin(request: Request):
+    """Rotas administrativas exigem o header X-Admin-Token igual a ADMIN_TOKEN."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Defina ADMIN_TOKEN para habilitar as rotas administrativas")
+    if request.headers.get("X-Admin-Token") != admin_token:
+        raise HTTPException(status_code=401, detail="Token administrativo inválido")
+
+
+@app.get("/api/admin/snapshot", dependencies=[Depends(require_admin)])
+def download_database_snapshot():
+    """
+    Fotografia consistente do banco inteiro, comprimida em gzip: arquivo SQLite
+    (.db.gz) ou dump COPY do PostgreSQL (.sql.gz).
+    """
+    try:
+        path, filename = create_database_snapshot()
     except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro ao importar backup: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar fotografia: {str(e)}")
+    return StreamingResponse(
+        iter_snapshot_chunks(path),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 # --- RESET DO SISTEMA (FACTORY RESET) ---
 
+def clear_tables(conn, models: list) -> dict:
+    """
+    Esvazia as tabelas com um comando por tabela, filhos antes dos pais, dentro
+    da transação de `conn`. Retorna {Modelo: linhas removidas}.
+    SQLite: DELETE (contagem pelo rowcount; sem AUTOINCREMENT os ids recomeçam
+    sozinhos). PostgreSQL: um único TRUNCATE ... RESTART IDENTITY, com a contagem
+    feita antes sob o mesmo lock.
+    Também serve para limpar o banco entre testes.
+    """
+    order = {table.name: position for position, table in enumerate(SQLModel.metadata.sorted_tables)}
+    models = sorted(models, key=lambda model: order[model.__table__.name], reverse=True)
+    counts = {}
+    if conn.dialect.name == "postgresql":
+        quote = conn.dialect.identifier_preparer.quote
+        names = ", ".join(quote(model.__table__.name) for model in models)
+        conn.execute(text(f"LOCK TABLE {names} IN ACCESS EXCLUSIVE MODE"))
+        for model in models:
+            counts[model.__name__] = conn.execute(select(func.count()).select_from(model.__table__)).scalar_one()
+        conn.execute(text(f"TRUNCATE {names} RESTART IDENTITY"))
+    else:
+        for model in models:
+            counts[model.__name__] = conn.execute(delete(model.__table__)).rowcount
+    return counts
+
+
+class FactoryResetRequest(BaseModel):
+    preserve_settings: bool = False  # Mantém a configuração de IA (AISettings)
+
+
 @app.post("/api/system/reset")
-def factory_reset(session: Session = Depends(get_session)):
+@app.post("/api/settings/factory-reset")
+def factory_reset(request: Optional[FactoryResetRequest] = None, session: Session = Depends(get_session)):
     """
     Restaura o sistema para as configurações de fábrica.
     ATENÇÃO: Esta ação é IRREVERSÍVEL e apaga TODOS os dados!
     """
+    preserve_settings = bool(request and request.preserve_settings)
     try:
-        # Deletar dados de todas as tabelas (em ordem para respeitar foreign keys)
+        # Todas as tabelas, numa única transação (o log de alterações recomeça à parte)
         tables_to_clear = [
-            AllocationItem,
-            PaycheckAllocation,
-            BudgetItem,
-            Transaction,
-            Budget,
-            Goal,
-            Debt,
-            Category,
-            Alert,
-            Asset,
-            Liability,
-            Account,
-            NetWorthGoal,
-            AISettings,
-            UserProfile,
+            table_model for table_model in SQLModel.__subclasses__()
+            if hasattr(table_model, "__table__") and table_model is not ChangeLog
+            and not (preserve_settings and table_model is AISettings)
         ]
-        
-        deleted_counts = {}
-        
-        for table in tables_to_clear:
-            records = session.exec(select(table)).all()
-            count = len(records)
-            for record in records:
-                session.delete(record)
-            deleted_counts[table.__name__] = count
-        
-        session.commit()
+        conn = session.connection()
+        deleted_counts = clear_tables(conn, tables_to_clear)
+        reset_change_log(conn)
         
         # Criar perfil padrão
         default_profile = UserProfile(
@@ -649,6 +1843,10 @@ def factory_reset(session: Session = Depends(get_session)):
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao resetar sistema: {str(e)}")
+    finally:
+        transaction_store.invalidate()
+        debt_recurrence.invalidate()
+        alert_rules.invalidate()
 
 
 # --- PERFIL DO USUÁRIO ---
@@ -697,6 +1895,7 @@ def create_transaction(transaction: Transaction, session: Session = Depends(get_
     session.add(transaction)
     
     # Atualizar saldo da conta se houver accountId
+    account = None
     if transaction.accountId:
         account = session.get(Account, transaction.accountId)
         if account:
@@ -706,8 +1905,14 @@ def create_transaction(transaction: Transaction, session: Session = Depends(get_
                 account.balance -= transaction.amount
             session.add(account)
             
+    track_transaction_alerts(session, None, transaction_fields(transaction))
     session.commit()
     session.refresh(transaction)
+    transaction_store.upsert(transaction)
+    evaluate_alert_rules(session, None, transaction_fields(transaction))
+    publish_transaction_change(session, "created", transaction.model_dump(), transaction_fields(transaction))
+    if account:
+        publish_account_balance(account)
     return transaction
 
 @app.delete("/api/transactions/{transaction_id}/")
@@ -716,8 +1921,13 @@ def delete_transaction(transaction_id: int, session: Session = Depends(get_sessi
     transaction = session.get(Transaction, transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
+    before = transaction_fields(transaction)
+    payload = transaction.model_dump()
+    track_transaction_alerts(session, before, None)
     session.delete(transaction)
     session.commit()
+    transaction_store.remove(transaction_id)
+    publish_transaction_change(session, "deleted", payload, before)
     return {"ok": True}
 
 @app.put("/api/transactions/{transaction_id}/", response_model=Transaction)
@@ -727,6 +1937,9 @@ def update_transaction(transaction_id: int, transaction_data: Transaction, sessi
     if not transaction:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     
+    before = transaction_fields(transaction)
+    touched_accounts = {}
+    
     # Reverter impacto da transação antiga no saldo (se houver conta vinculada)
     if transaction.accountId:
         account = session.get(Account, transaction.accountId)
@@ -736,6 +1949,7 @@ def update_transaction(transaction_id: int, transaction_data: Transaction, sessi
             elif transaction.type == 'expense':
                 account.balance += transaction.amount
             session.add(account)
+            touched_accounts[account.id] = account
     
     # Atualizar campos da transação
     transaction.accountId = transaction_data.accountId
@@ -755,10 +1969,17 @@ def update_transaction(transaction_id: int, transaction_data: Transaction, sessi
             elif transaction.type == 'expense':
                 account.balance -= transaction.amount
             session.add(account)
+            touched_accounts[account.id] = account
     
     session.add(transaction)
+    track_transaction_alerts(session, before, transaction_fields(transaction))
     session.commit()
     session.refresh(transaction)
+    transaction_store.upsert(transaction)
+    evaluate_alert_rules(session, before, transaction_fields(transaction))
+    publish_transaction_change(session, "updated", transaction.model_dump(), before, transaction_fields(transaction))
+    for account in touched_accounts.values():
+        publish_account_balance(account)
     return transaction
 
 # --- METAS (GOALS) ---
@@ -808,6 +2029,7 @@ def create_account(account: Account, session: Session = Depends(get_session)):
     session.add(account)
     session.commit()
     session.refresh(account)
+    publish_account_balance(account)
     return account
 
 @app.delete("/api/accounts/{account_id}/")
@@ -817,6 +2039,8 @@ def delete_account(account_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Conta não encontrada")
     session.delete(account)
     session.commit()
+    # As transações da conta ficaram sem conta (ON DELETE SET NULL)
+    transaction_store.invalidate()
     return {"ok": True}
 
 @app.put("/api/accounts/{account_id}/", response_model=Account)
@@ -834,6 +2058,7 @@ def update_account(account_id: int, account_data: Account, session: Session = De
     session.add(account)
     session.commit()
     session.refresh(account)
+    publish_account_balance(account)
     return account
 
 @app.get("/api/categories/", response_model=List[Category])
@@ -877,11 +2102,10 @@ def delete_category(category_id: int, session: Session = Depends(get_session)):
 def read_budgets(session: Session = Depends(get_session)):
     budgets = session.exec(select(Budget)).all()
     
-    # Lógica Real: Recalcular o 'spent' baseado nas transações
-    transactions = session.exec(select(Transaction)).all()
+    # Lógica Real: Recalcular o 'spent' baseado nas transações (cache colunar)
+    spent_by_category = get_transaction_store(session).sum_by_category(t_type="expense")
     for b in budgets:
-        total_spent = sum(t.amount for t in transactions if t.category == b.category and t.type == 'expense')
-        b.spent = total_spent
+        b.spent = spent_by_category.get(b.category, 0)
         
     return budgets
 
@@ -1061,27 +2285,19 @@ def calculate_budget_limit(data: dict, session: Session = Depends(get_session)):
     accounts = session.exec(select(Account)).all()
     total_balance = sum(a.balance for a in accounts)
     
-    # Buscar transações dos últimos 90 dias
-    from datetime import datetime, timedelta
+    # Receitas e despesas dos últimos 90 dias (cache colunar)
     cutoff_date = (datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d")
-    transactions = session.exec(select(Transaction)).all()
-    
-    # Filtrar transações recentes
-    recent_transactions = [t for t in transactions if t.date >= cutoff_date]
-    
-    # Calcular receitas e despesas mensais médias
-    total_income = sum(t.amount for t in recent_transactions if t.type == "income")
-    total_expenses = sum(t.amount for t in recent_transactions if t.type == "expense")
+    store = get_transaction_store(session)
+    total_income = store.total(start=cutoff_date, t_type="income")
+    total_expenses = store.total(start=cutoff_date, t_type="expense")
     
     # Média mensal (3 meses)
     monthly_income = total_income / 3 if total_income > 0 else 0
     monthly_expenses = total_expenses / 3 if total_expenses > 0 else 0
     monthly_available = monthly_income - monthly_expenses
     
-    # Gastos na categoria específica
-    category_expenses = sum(t.amount for t in recent_transactions 
-                           if t.type == "expense" and t.category == category)
-    monthly_category_avg = category_expenses / 3 if category_expenses > 0 else 0
+    # Gastos na categoria específica (janela móvel de 90 dias)
+    monthly_category_avg = category_monthly_average(spending_stats.get(session), category) or 0
     
     # Buscar orçamentos existentes
     existing_budgets = session.exec(select(Budget)).all()
@@ -1423,10 +2639,16 @@ def create_debt(debt: Debt, session: Session = Depends(get_session)):
     # Garantir que defaults sejam respeitados se não enviados
     if not debt.category:
         debt.category = "Outros"
+    if debt.recurrenceFreq and debt.recurrenceFreq not in DEBT_RECURRENCE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail="Recorrência inválida (use monthly ou none)")
+    freeze_debt_recurrence(debt)
         
     session.add(debt)
+    track_debt_alerts(session, None, debt_fields(debt))
     session.commit()
     session.refresh(debt)
+    debt_recurrence.invalidate()
+    publish_debt_status("created", debt.model_dump())
     
     # Criar transação correspondente se for dívida nova (opcional, dependendo da lógica de negócio)
     # Por enquanto apenas cria a dívida
@@ -1440,6 +2662,8 @@ def update_debt(debt_id: int, debt_data: Debt, session: Session = Depends(get_se
     if not debt:
         raise HTTPException(status_code=404, detail="Dívida não encontrada")
     
+    schedule_before = (debt.dueDate, debt.debtType, debt.totalInstallments, debt.currentInstallment)
+    before = debt_fields(debt)
     debt.name = debt_data.name
     debt.remaining = debt_data.remaining
     debt.monthly = debt_data.monthly
@@ -1455,10 +2679,30 @@ def update_debt(debt_id: int, debt_data: Debt, session: Session = Depends(get_se
         debt.currentInstallment = debt_data.currentInstallment
     if "category" in debt_data.model_fields_set:
         debt.category = debt_data.category
+    if "interestRate" in debt_data.model_fields_set:
+        debt.interestRate = debt_data.interestRate
+    recurrence_fields = ("recurrenceFreq", "recurrenceDay", "recurrenceCount", "recurrenceStart")
+    # O frontend reenvia o objeto inteiro: só conta como edição o que mudou de fato
+    changed_recurrence = [
+        field for field in recurrence_fields
+        if field in debt_data.model_fields_set and getattr(debt_data, field) != getattr(debt, field)
+    ]
+    if changed_recurrence:
+        if debt_data.recurrenceFreq and debt_data.recurrenceFreq not in DEBT_RECURRENCE_FREQUENCIES:
+            raise HTTPException(status_code=400, detail="Recorrência inválida (use monthly ou none)")
+        for field in changed_recurrence:
+            setattr(debt, field, getattr(debt_data, field))
+    elif schedule_before != (debt.dueDate, debt.debtType, debt.totalInstallments, debt.currentInstallment):
+        # Agenda editada: a série de parcelas é recalculada a partir do novo dueDate
+        debt.recurrenceStart = None
+        freeze_debt_recurrence(debt)
         
     session.add(debt)
+    track_debt_alerts(session, before, debt_fields(debt))
     session.commit()
     session.refresh(debt)
+    debt_recurrence.invalidate()
+    publish_debt_status("updated", debt.model_dump())
     return debt
 
 @app.delete("/api/debts/{debt_id}/")
@@ -1467,8 +2711,12 @@ def delete_debt(debt_id: int, session: Session = Depends(get_session)):
     debt = session.get(Debt, debt_id)
     if not debt:
         raise HTTPException(status_code=404, detail="Dívida não encontrada")
+    payload = debt.model_dump()
+    track_debt_alerts(session, debt_fields(debt), None)
     session.delete(debt)
     session.commit()
+    debt_recurrence.invalidate()
+    publish_debt_status("deleted", payload)
     return {"ok": True}
 
 @app.delete("/api/debts/{debt_id}/")
@@ -1476,8 +2724,12 @@ def delete_debt(debt_id: int, session: Session = Depends(get_session)):
     debt = session.get(Debt, debt_id)
     if not debt:
         raise HTTPException(status_code=404, detail="Dívida não encontrada")
+    payload = debt.model_dump()
+    track_debt_alerts(session, debt_fields(debt), None)
     session.delete(debt)
     session.commit()
+    debt_recurrence.invalidate()
+    publish_debt_status("deleted", payload)
     return {"ok": True}
 
 class DebtPayment(BaseModel):
@@ -1495,6 +2747,7 @@ def pay_debt(debt_id: int, payment: DebtPayment, session: Session = Depends(get_
     account = session.get(Account, payment.accountId)
     if not account:
         raise HTTPException(status_code=404, detail="Conta não encontrada")
+    debt_before = debt_fields(debt)
         
     # 1. Criar Transação de Despesa
     transaction = Transaction(
@@ -1516,6 +2769,7 @@ def pay_debt(debt_id: int, payment: DebtPayment, session: Session = Depends(get_
         debt.remaining = max(0, debt.remaining - payment.amount)
         
     # 4. Atualizar Parcela Atual (se for parcelado)
+    freeze_debt_recurrence(debt)
     if debt.debtType == 'parcelado' and debt.currentInstallment and debt.totalInstallments:
         if debt.currentInstallment < debt.totalInstallments:
              debt.currentInstallment += 1
@@ -1524,47 +2778,256 @@ def pay_debt(debt_id: int, payment: DebtPayment, session: Session = Depends(get_
     if debt.remaining == 0 and debt.debtType != 'fixo':
         debt.status = "Em dia" # Ou finalizar? Por enquanto 'Em dia'
         
+    track_transaction_alerts(session, None, transaction_fields(transaction))
+    track_debt_alerts(session, debt_before, debt_fields(debt))
     session.commit()
     session.refresh(debt)
+    transaction_store.upsert(transaction)
+    evaluate_alert_rules(session, None, transaction_fields(transaction))
+    publish_transaction_change(session, "created", transaction.model_dump(), transaction_fields(transaction))
+    publish_account_balance(account)
+    publish_debt_status("updated", debt.model_dump())
     
     return {"success": True, "new_remaining": debt.remaining}
 
-@app.get("/api/financial-health/summary/")
-def get_financial_health_summary(session: Session = Depends(get_session)):
-    """Retorna dados consolidados para os gráficos de Saúde Financeira."""
-    debts = session.exec(select(Debt)).all()
-    
-    # Totais por status
-    em_dia = [d for d in debts if d.status == "Em dia"]
-    pendente = [d for d in debts if d.status == "Pendente"]
-    atrasado = [d for d in debts if d.status == "Atrasado"]
-    
-    total_debt = sum(d.remaining or 0 for d in debts)
-    total_em_dia = sum(d.remaining or 0 for d in em_dia)
-    total_pendente = sum(d.remaining or 0 for d in pendente)
-    total_atrasado = sum(d.remaining or 0 for d in atrasado)
-    
-    pending_payments = sum(d.monthly or 0 for d in pendente)
-    
-    # Próximo vencimento
-    valid_dates = [d for d in debts if d.dueDate]
-    valid_dates.sort(key=lambda x: x.dueDate)
-    next_due = valid_dates[0].dueDate if valid_dates else None
-    
-    return {
-        "totalDebt": total_debt,
-        "pendingPayments": pending_payments,
-        "nextDueDate": next_due,
-        "statusBreakdown": {
-            "emDia": {"count": len(em_dia), "total": total_em_dia},
-            "pendente": {"count": len(pendente), "total": total_pendente},
-            "atrasado": {"count": len(atrasado), "total": total_atrasado}
-        },
-        "debtCount": len(debts)
-    }
 
-@app.get("/api/alerts/", response_model=List[Alert])
-def read_alerts(session: Session = Depends(get_session)):
+# --- SIMULADOR DE QUITAÇÃO DE DÍVIDAS ---
+
+DEBT_SIMULATION_STRATEGIES = ("avalanche", "snowball", "custom")
+
+
+class DebtSimulationRequest(BaseModel):
+    strategies: List[str] = ["avalanche", "snowball"]
+    extraPayments: List[float] = [0]  # Valores extras mensais a testar (todos × todas as estratégias)
+    customOrder: Optional[List[int]] = None  # IDs das dívidas na ordem desejada (estratégia "custom")
+    months: int = 360  # Horizonte máximo da simulação
+
+
+def implied_monthly_rates(balances, payments, installments, iterations: int = 30):
+    """
+    Taxa mensal implícita de cada parcelamento (Newton vetorizado sobre a fórmula
+    de anuidade): a taxa r tal que `payment * (1 - (1 + r)^-n) / r == balance`.
+    Parcelamentos cuja soma das parcelas não supera o saldo ficam com taxa zero.
+    """
+    rates = np.zeros_like(balances)
+    solvable = (installments > 0) & (payments * installments > balances * (1 + 1e-9)) & (balances > 0)
+    if not solvable.any():
+        return rates
+    pv, pmt, n = balances[solvable], payments[solvable], installments[solvable]
+    r = np.full_like(pv, 0.01)
+    for _ in range(iterations):
+        growth = (1 + r) ** -n
+        f = pmt * (1 - growth) / r - pv
+        df = pmt * (n * growth / (1 + r) / r - (1 - growth) / r ** 2)
+        r = np.clip(r - f / df, 1e-9, 1.0)
+    rates[solvable] = r
+    return rates
+
+
+def simulate_debt_payoff(balances, payments, rates, priorities, extras, months: int):
+    """
+    Amortização mês a mês de todos os cenários de uma vez (arrays cenários × dívidas).
+    Cada mês: aplica juros, paga as parcelas mínimas e direciona o valor extra mais
+    as parcelas já liberadas por dívidas quitadas à dívida de maior prioridade.
+
+    `priorities` (cenários × dívidas) traz os índices das dívidas em ordem de ataque.
+    Retorna (mês de quitação por dívida, -1 se não quitada; saldo total por mês;
+    juros totais; total pago) por cenário.
+    """
+    scenarios, count = priorities.shape
+    # Trabalha com as colunas já na ordem de ataque de cada cenário: a cascata do
+    # valor disponível vira um cumsum por linha, sem reindexar a cada mês
+    balance = balances[priorities]
+    payments = payments[priorities]
+    rates = rates[priorities]
+    budget = payments.sum(axis=1) + extras  # orçamento mensal fixo de cada cenário
+    growth = 1 + rates
+    history = np.zeros((months + 1, scenarios, count))
+    history[0] = balance
+    paid = np.zeros((months, scenarios))
+    minimum = np.empty_like(balance)
+    before = np.empty_like(balance)
+
+    last = months
+    for month in range(1, months + 1):
+        balance *= growth
+        np.minimum(balance, payments, out=minimum)
+        balance -= minimum
+        # Extra + parcelas liberadas vão em cascata pela ordem de prioridade
+        minimum_total = minimum.sum(axis=1)
+        available = budget - minimum_total
+        np.cumsum(balance, axis=1, out=before)
+        paid[month - 1] = minimum_total + np.minimum(available, before[:, -1])
+        before -= balance
+        np.subtract(available[:, None], before, out=before)
+        balance -= np.clip(before, 0, balance, out=before)
+        balance[balance <= 0.005] = 0
+        history[month] = balance
+        if not balance.any():
+            last = month
+            break
+
+    history = history[:last + 1]
+    # Métricas derivadas do histórico fora do laço
+    interest_paid = (history[:-1] * rates).sum(axis=(0, 2))
+    total_paid = paid[:last].sum(axis=0)
+    total_balance = history[1:].sum(axis=2).T
+    settled = history <= 0
+    payoff_month = np.where(settled.any(axis=0), settled.argmax(axis=0), -1).astype(np.int32)
+    # Volta à ordem original das dívidas
+    original = np.empty_like(payoff_month)
+    original[np.arange(scenarios)[:, None], priorities] = payoff_month
+    payoff_month = original
+
+    return payoff_month, total_balance, interest_paid, total_paid
+
+
+@app.post("/api/debts/simulate")
+def simulate_debts(request: DebtSimulationRequest, session: Session = Depends(get_session)):
+    """
+    Projeta a quitação de todas as dívidas com saldo sob várias estratégias
+    (avalanche: maior juros primeiro; snowball: menor saldo primeiro; custom:
+    ordem informada) e valores extras mensais, em uma única simulação vetorizada.
+    """
+    invalid = [s for s in request.strategies if s not in DEBT_SIMULATION_STRATEGIES]
+    if invalid or not request.strategies:
+        raise HTTPException(status_code=400, detail=f"Estratégia inválida: {', '.join(invalid)} (use avalanche, snowball ou custom)")
+    if not request.extraPayments or any(e < 0 for e in request.extraPayments):
+        raise HTTPException(status_code=400, detail="Valores extras devem ser maiores ou iguais a zero")
+    if "custom" in request.strategies and not request.customOrder:
+        raise HTTPException(status_code=400, detail="Informe customOrder para a estratégia custom")
+    months = max(1, min(request.months, 600))
+
+    debts = [d for d in session.exec(select(Debt).where(Debt.remaining > 0)).all() if d.debtType != 'fixo']
+    if not debts:
+        return {"debts": [], "scenarios": [], "horizonMonths": months}
+
+    balances = np.array([d.remaining for d in debts], dtype=np.float64)
+    payments = np.array([d.monthly or 0 for d in debts], dtype=np.float64)
+    informed = np.array([d.interestRate is not None for d in debts])
+    installments = np.array([
+        (d.totalInstallments - (d.currentInstallment or 1) + 1)
+        if d.debtType == 'parcelado' and d.totalInstallments else 0
+        for d in debts
+    ], dtype=np.float64)
+    rates = np.where(informed, [(d.interestRate or 0) / 100 for d in debts], 0.0)
+    implied = implied_monthly_rates(balances, payments, installments)
+    rates = np.where(informed, rates, implied)
+
+    # Ordens de ataque: avalanche (juros desc, saldo asc), snowball (saldo asc)
+    orders = {
+        "avalanche": np.lexsort((balances, -rates)),
+        "snowball": np.argsort(balances, kind="stable"),
+    }
+    if request.customOrder:
+        position = {debt_id: i for i, debt_id in enumerate(request.customOrder)}
+        rank = np.array([position.get(d.id, len(position)) for d in debts])
+        orders["custom"] = np.lexsort((balances, rank))  # não listadas vão ao fim, menor saldo primeiro
+
+    combos = [(strategy, extra) for strategy in request.strategies for extra in request.extraPayments]
+    priorities = np.stack([orders[strategy] for strategy, _ in combos])
+    extras = np.array([extra for _, extra in combos], dtype=np.float64)
+    payoff_month, total_balance, interest_paid, total_paid = simulate_debt_payoff(
+        balances, payments, rates, priorities, extras, months
+    )
+
+    first_month = shift_months(datetime.now().date().replace(day=1), 1)
+
+    def month_label(month: int) -> str:
+        return shift_months(first_month, month - 1).strftime("%Y-%m")
+
+    scenarios = []
+    for i, (strategy, extra) in enumerate(combos):
+        paid_off = payoff_month[i] >= 0
+        months_to_payoff = int(payoff_month[i].max()) if paid_off.all() else None
+        horizon = months_to_payoff or total_balance.shape[1]
+        scenarios.append({
+            "strategy": strategy,
+            "extraPayment": float(extra),
+            "monthsToPayoff": months_to_payoff,
+            "payoffDate": month_label(months_to_payoff) if months_to_payoff else None,
+            "totalInterest": round(float(interest_paid[i]), 2),
+            "totalPaid": round(float(total_paid[i]), 2),
+            "payoffOrder": [
+                {"debtId": debts[j].id, "name": debts[j].name, "month": int(payoff_month[i, j]),
+                 "date": month_label(int(payoff_month[i, j])) if payoff_month[i, j] > 0 else None}
+                for j in sorted(np.flatnonzero(paid_off), key=lambda j: payoff_month[i, j])
+            ],
+            "unpaidDebtIds": [debts[j].id for j in np.flatnonzero(~paid_off)],
+            "timeline": [
+                {"month": m + 1, "date": month_label(m + 1), "balance": round(float(total_balance[i, m]), 2)}
+                for m in range(min(horizon, total_balance.shape[1]))
+            ],
+        })
+
+    return {
+        "debts": [
+            {"id": d.id, "name": d.name, "remaining": d.remaining, "monthly": d.monthly,
+             "monthlyRate": round(float(rates[j]) * 100, 4),
+             "rateSource": "informada" if informed[j] else ("implícita" if rates[j] > 0 else "sem juros")}
+            for j, d in enumerate(debts)
+        ],
+        "scenarios": scenarios,
+        "horizonMonths": months,
+    }
+
+DEBT_STATUS_KEYS = {"Em dia": "emDia", "Pendente": "pendente", "Atrasado": "atrasado"}
+
+
+def get_debt_summary(session: Session) -> dict:
+    """
+    Totais de dívidas por status em um único GROUP BY, mais o próximo vencimento
+    via MIN(dueDate) indexado. Compartilhado pelo resumo de saúde financeira,
+    alertas comportamentais e análise de IA.
+    """
+    rows = session.exec(
+        select(Debt.status, func.count(Debt.id), func.sum(Debt.remaining), func.sum(Debt.monthly))
+        .group_by(Debt.status)
+    ).all()
+    next_due = session.exec(
+        select(func.min(Debt.dueDate)).where(Debt.dueDate.is_not(None)).where(Debt.dueDate != "")
+    ).one()
+
+    breakdown = {key: {"count": 0, "total": 0, "monthly": 0} for key in DEBT_STATUS_KEYS.values()}
+    total_debt = 0
+    debt_count = 0
+    for status, count, remaining, monthly in rows:
+        total_debt += remaining or 0
+        debt_count += count
+        key = DEBT_STATUS_KEYS.get(status)
+        if key:
+            breakdown[key] = {"count": count, "total": remaining or 0, "monthly": monthly or 0}
+
+    return {
+        "totalDebt": total_debt,
+        "pendingPayments": breakdown["pendente"]["monthly"],
+        "nextDueDate": next_due,
+        "statusBreakdown": {
+            key: {"count": value["count"], "total": value["total"]} for key, value in breakdown.items()
+        },
+        "debtCount": debt_count
+    }
+
+
+def count_debts_due_within(session: Session, days: int, status: str = "Pendente") -> int:
+    """Quantidade de dívidas com o status informado vencendo entre hoje e hoje + `days`."""
+    today = datetime.now().date()
+    return session.exec(
+        select(func.count(Debt.id))
+        .where(Debt.status == status)
+        .where(Debt.dueDate >= today.strftime("%Y-%m-%d"))
+        # Limite exclusivo no dia seguinte: também cobre datas ISO com horário
+        .where(Debt.dueDate < (today + timedelta(days=days + 1)).strftime("%Y-%m-%d"))
+    ).one()
+
+
+@app.get("/api/financial-health/summary/")
+def get_financial_health_summary(session: Session = Depends(get_session)):
+    """Retorna dados consolidados para os gráficos de Saúde Financeira."""
+    return get_debt_summary(session)
+
+@app.get("/api/alerts/", response_model=List[Alert])
+def read_alerts(session: Session = Depends(get_session)):
     alerts = session.exec(select(Alert)).all()
     return alerts
 
@@ -1573,6 +3036,7 @@ def create_alert(alert: Alert, session: Session = Depends(get_session)):
     session.add(alert)
     session.commit()
     session.refresh(alert)
+    alert_rules.invalidate()
     return alert
 
 @app.put("/api/alerts/{alert_id}/", response_model=Alert)
@@ -1592,6 +3056,7 @@ def update_alert(alert_id: int, alert_data: Alert, session: Session = Depends(ge
     session.add(alert)
     session.commit()
     session.refresh(alert)
+    alert_rules.invalidate()
     return alert
 
 @app.delete("/api/alerts/{alert_id}/")
@@ -1601,66 +3066,211 @@ def delete_alert(alert_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     session.delete(alert)
     session.commit()
+    alert_rules.invalidate()
     return {"ok": True}
 
-@app.get("/api/behavioral-alerts/")
-def get_behavioral_alerts(session: Session = Depends(get_session)):
-    """Gera alertas comportamentais automáticos baseados na análise financeira."""
-    from datetime import datetime, timedelta
-    
-    alerts = []
+# --- MOTOR DE REGRAS DOS ALERTAS DE LIMITE ---
+# Cada escrita de despesa consulta só as regras da sua categoria. O total do período
+# (mês corrente) por categoria sai do índice de somas prefixadas do cache colunar,
+# então nenhuma verificação varre transações. Cada alerta dispara no máximo uma vez
+# por mês, quando o gasto cruza budget * threshold%.
+
+class AlertRuleIndex:
+    """Alertas habilitados indexados por categoria (recarregado quando a tabela Alert muda)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_category = None
+
+    def rules_for(self, session: Session, category: str) -> List[tuple]:
+        with self._lock:
+            if self._by_category is None:
+                self._by_category = {}
+                rows = session.exec(
+                    select(Alert.id, Alert.category, Alert.budget, Alert.threshold).where(Alert.enabled == True)
+                ).all()
+                for alert_id, alert_category, budget, threshold in rows:
+                    self._by_category.setdefault(alert_category, []).append((alert_id, budget, threshold))
+            return self._by_category.get(category, [])
+
+    def invalidate(self):
+        with self._lock:
+            self._by_category = None
+
+
+alert_rules = AlertRuleIndex()
+
+
+def evaluate_alert_rules(session: Session, before: Optional[tuple], after: Optional[tuple]) -> List[FiredAlert]:
+    """
+    Avalia as regras afetadas por uma escrita de transação (chamar depois do commit e
+    da atualização do cache). `before`/`after` vêm de transaction_fields.
+    Disparos são gravados em FiredAlert e publicados no barramento de eventos.
+    """
     today = datetime.now().date()
+    period = today.strftime("%Y-%m")
+    deltas = {}
+    for fields, sign in ((before, -1), (after, 1)):
+        if fields is None:
+            continue
+        t_type, amount, t_date, category = fields
+        if t_type == "expense" and t_date[:7] == period:
+            deltas[category] = deltas.get(category, 0) + sign * amount
+
+    candidates = []
+    store = None
+    for category, delta in deltas.items():
+        # Só aumentos de gasto podem cruzar um limite
+        rules = alert_rules.rules_for(session, category) if delta > 0 else []
+        if not rules:
+            continue
+        store = store or get_transaction_store(session)
+        last_day = calendar.monthrange(today.year, today.month)[1]
+        spent = store.total(start=f"{period}-01", end=f"{period}-{last_day:02d}", t_type="expense", category=category)
+        previous = spent - delta
+        for alert_id, budget, threshold in rules:
+            limit = budget * threshold / 100
+            if previous < limit <= spent:
+                candidates.append((alert_id, category, budget, threshold, spent))
+    if not candidates:
+        return []
+
+    already_fired = set(session.exec(
+        select(FiredAlert.alert_id)
+        .where(FiredAlert.period == period)
+        .where(FiredAlert.alert_id.in_([c[0] for c in candidates]))
+    ).all())
+    rows = []
+    for alert_id, category, budget, threshold, spent in candidates:
+        if alert_id in already_fired:
+            continue
+        percentage = spent / budget * 100 if budget > 0 else 100
+        rows.append({
+            "alert_id": alert_id,
+            "category": category,
+            "period": period,
+            "spent": round(spent, 2),
+            "budget": budget,
+            "threshold": threshold,
+            "message": f"Você já gastou R$ {spent:,.2f} em {category} este mês ({percentage:.0f}% do limite de R$ {budget:,.2f}).",
+            "fired_at": datetime.now().isoformat(),
+            "read": False,
+        })
+    if not rows:
+        return []
+    # Escritas concorrentes podem cruzar o mesmo limite: a constraint (alert_id, period)
+    # decide quem dispara e só as linhas realmente inseridas são publicadas
+    table = FiredAlert.__table__
+    statement = upsert_insert(session.connection())(table).values(rows)
+    statement = statement.on_conflict_do_nothing(index_elements=[table.c.alert_id, table.c.period]).returning(*table.c)
+    fired = [FiredAlert.model_validate(dict(row._mapping)) for row in session.connection().execute(statement)]
+    record_changes(session, FiredAlert, [fired_alert.id for fired_alert in fired])
+    session.commit()
+    for fired_alert in fired:
+        event_bus.publish("alert.fired", fired_alert.model_dump())
+    return fired
+
+
+@app.get("/api/alerts/fired/", response_model=List[FiredAlert])
+def read_fired_alerts(limit: int = Query(50, ge=1, le=500), unread_only: bool = False, session: Session = Depends(get_session)):
+    """Histórico de disparos dos alertas de limite, do mais recente para o mais antigo."""
+    query = select(FiredAlert).order_by(FiredAlert.id.desc()).limit(limit)
+    if unread_only:
+        query = query.where(FiredAlert.read == False)
+    return session.exec(query).all()
+
+@app.put("/api/alerts/fired/{fired_id}/read/", response_model=FiredAlert)
+def mark_fired_alert_read(fired_id: int, session: Session = Depends(get_session)):
+    """Marca um disparo como lido."""
+    fired_alert = session.get(FiredAlert, fired_id)
+    if not fired_alert:
+        raise HTTPException(status_code=404, detail="Disparo de alerta não encontrado")
+    fired_alert.read = True
+    session.add(fired_alert)
+    session.commit()
+    session.refresh(fired_alert)
+    return fired_alert
+
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+def format_sse(message: dict) -> str:
+    event_id = f"id: {message['id']}\n" if message.get("id") else ""
+    return f"{event_id}event: {message['type']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/events")
+async def stream_events(request: Request, types: Optional[str] = None):
+    """
+    Stream SSE com os eventos de mudança (ver CHANGE_EVENT_TYPES) e alert.fired.
+    `types` filtra por tipo (separados por vírgula). Um heartbeat sai a cada 15s
+    sem eventos; `resync` avisa que a fila da conexão transbordou.
+    """
+    wanted = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    subscription = event_bus.subscribe(wanted)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                message = await subscription.next_message(EVENTS_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield f"event: heartbeat\ndata: {json.dumps({'at': datetime.now().isoformat()})}\n\n"
+                    continue
+                yield format_sse(message)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- ALERTAS COMPORTAMENTAIS (ESTADO INCREMENTAL) ---
+# Os contadores do mês e de dívidas ficam em BehavioralAlertState e são ajustados
+# na mesma transação do banco de cada escrita de transação/dívida; as regras são
+# reavaliadas ali mesmo e o GET só devolve a lista já pronta. Na virada do dia
+# (vencimentos próximos) ou do mês (contadores), o estado é reconstruído uma vez.
+
+BEHAVIORAL_DUE_SOON_DAYS = 7
+
+
+def transaction_fields(t: Optional[Transaction]) -> Optional[tuple]:
+    """(tipo, valor, data, categoria) de uma transação, para calcular deltas."""
+    return (t.type, t.amount or 0, t.date or "", t.category or "") if t is not None else None
+
+
+def debt_fields(d: Optional[Debt]) -> Optional[tuple]:
+    """(status, restante, vencimento) de uma dívida, para calcular deltas."""
+    return (d.status, d.remaining or 0, d.dueDate or "") if d is not None else None
+
+
+def evaluate_behavioral_alerts(state: BehavioralAlertState) -> List[dict]:
+    """Aplica as regras de alerta aos contadores do estado."""
+    alerts = []
     
-    # 1. Análise de Dívidas Atrasadas
-    debts = session.exec(select(Debt)).all()
-    atrasadas = [d for d in debts if d.status == "Atrasado"]
-    if atrasadas:
-        total_atrasado = sum(d.remaining or 0 for d in atrasadas)
+    # 1. Dívidas atrasadas
+    if state.overdueCount:
         alerts.append({
             "id": "debt_overdue",
             "type": "danger",
             "icon": "alert-triangle",
-            "title": f"⚠️ {len(atrasadas)} dívida(s) atrasada(s)",
-            "message": f"Você tem R$ {total_atrasado:,.2f} em dívidas vencidas. Regularize para evitar juros.",
+            "title": f"⚠️ {state.overdueCount} dívida(s) atrasada(s)",
+            "message": f"Você tem R$ {state.overdueTotal:,.2f} em dívidas vencidas. Regularize para evitar juros.",
             "priority": 1
         })
     
     # 2. Dívidas prestes a vencer (próximos 7 dias)
-    pendentes = [d for d in debts if d.status == "Pendente" and d.dueDate]
-    proximas = []
-    for d in pendentes:
-        try:
-            due_date = datetime.strptime(d.dueDate.split('T')[0], "%Y-%m-%d").date()
-            days_until = (due_date - today).days
-            if 0 <= days_until <= 7:
-                proximas.append(d)
-        except (ValueError, AttributeError):
-            pass
-    if proximas:
+    if state.dueSoonCount:
         alerts.append({
             "id": "debt_due_soon",
             "type": "warning",
             "icon": "clock",
-            "title": f"📅 {len(proximas)} pagamento(s) próximo(s)",
+            "title": f"📅 {state.dueSoonCount} pagamento(s) próximo(s)",
             "message": f"Você tem pagamentos vencendo nos próximos 7 dias. Prepare-se!",
             "priority": 2
         })
     
-    # 3. Análise de Gastos do Mês
-    transactions = session.exec(select(Transaction)).all()
-    first_day = today.replace(day=1)
-    first_day_str = first_day.strftime("%Y-%m-%d")
-    
-    # Comparar datas como strings (formato YYYY-MM-DD é comparável)
-    gastos_mes = [t for t in transactions if t.type == "expense" and t.date and t.date >= first_day_str]
-    receitas_mes = [t for t in transactions if t.type == "income" and t.date and t.date >= first_day_str]
-    
-    total_gastos = sum(t.amount for t in gastos_mes)
-    total_receitas = sum(t.amount for t in receitas_mes)
-    
-    # 4. Gastos maiores que receitas
-    if total_gastos > total_receitas and total_receitas > 0:
-        excesso = total_gastos - total_receitas
+    # 3. Gastos maiores que receitas
+    if state.monthExpenses > state.monthIncome and state.monthIncome > 0:
+        excesso = state.monthExpenses - state.monthIncome
         alerts.append({
             "id": "spending_exceeds_income",
             "type": "danger",
@@ -1670,10 +3280,9 @@ def get_behavioral_alerts(session: Session = Depends(get_session)):
             "priority": 1
         })
     
-    # 5. Alerta de endividamento alto
-    total_dividas = sum(d.remaining or 0 for d in debts)
-    if total_dividas > 0 and total_receitas > 0:
-        ratio = total_dividas / total_receitas
+    # 4. Endividamento alto
+    if state.debtTotal > 0 and state.monthIncome > 0:
+        ratio = state.debtTotal / state.monthIncome
         if ratio > 3:
             alerts.append({
                 "id": "high_debt_ratio",
@@ -1684,8 +3293,8 @@ def get_behavioral_alerts(session: Session = Depends(get_session)):
                 "priority": 2
             })
     
-    # 6. Alerta positivo - Saúde financeira OK
-    if not atrasadas and total_gastos <= total_receitas:
+    # 5. Alerta positivo - Saúde financeira OK
+    if not state.overdueCount and state.monthExpenses <= state.monthIncome:
         alerts.append({
             "id": "financial_health_ok",
             "type": "success",
@@ -1697,15 +3306,129 @@ def get_behavioral_alerts(session: Session = Depends(get_session)):
     
     # Ordenar por prioridade
     alerts.sort(key=lambda x: x["priority"])
+    return alerts
+
+
+def _store_alerts(session: Session, state: BehavioralAlertState):
+    alerts = evaluate_behavioral_alerts(state)
+    serialized = json.dumps(alerts, ensure_ascii=False)
+    if serialized != state.alerts:
+        queue_event(session, "insight-ready", {"kind": "behavioral-alerts", "alerts": alerts})
+    state.alerts = serialized
+    state.updated_at = datetime.now().isoformat()
+
+
+def rebuild_behavioral_alert_state(session: Session) -> BehavioralAlertState:
+    """Reconstrução completa (primeiro uso, virada de dia/mês, importação e reset)."""
+    today = datetime.now().date()
+    first_day_str = today.replace(day=1).strftime("%Y-%m-%d")
+    store = get_transaction_store(session)
+    debt_summary = get_debt_summary(session)
+
+    state = session.exec(select(BehavioralAlertState)).first() or BehavioralAlertState()
+    state.month = first_day_str[:7]
+    state.evaluatedOn = today.isoformat()
+    state.monthIncome = round(store.total(start=first_day_str, t_type="income"), 2)
+    state.monthExpenses = round(store.total(start=first_day_str, t_type="expense"), 2)
+    state.debtCount = debt_summary["debtCount"]
+    state.debtTotal = round(debt_summary["totalDebt"], 2)
+    state.overdueCount = debt_summary["statusBreakdown"]["atrasado"]["count"]
+    state.overdueTotal = round(debt_summary["statusBreakdown"]["atrasado"]["total"], 2)
+    state.dueSoonCount = count_debts_due_within(session, BEHAVIORAL_DUE_SOON_DAYS)
+    _store_alerts(session, state)
+    session.add(state)
+    session.commit()
+    session.refresh(state)
+    return state
+
+
+def _current_alert_state(session: Session) -> Optional[BehavioralAlertState]:
+    """Estado ainda válido para hoje, ou None se precisar de reconstrução."""
+    state = session.exec(select(BehavioralAlertState)).first()
+    if state is None or state.evaluatedOn != datetime.now().date().isoformat():
+        return None
+    return state
+
+
+def _apply_alert_deltas(session: Session, state: BehavioralAlertState, deltas: dict):
+    """
+    Soma os deltas aos contadores no próprio UPDATE, e não sobre o valor lido:
+    escritas concorrentes não perdem o ajuste uma da outra. Recarrega o estado
+    para reavaliar as regras já com os contadores atualizados.
+    """
+    table = BehavioralAlertState.__table__
+    values = {
+        name: table.c[name] + delta if name.endswith("Count") else func.round(cast(table.c[name] + delta, Numeric), 2)
+        for name, delta in deltas.items() if delta
+    }
+    if not values:
+        return
+    session.connection().execute(update(table).where(table.c.id == state.id).values(values))
+    session.refresh(state)
+
+
+def track_transaction_alerts(session: Session, before: Optional[tuple], after: Optional[tuple]):
+    """
+    Ajusta os contadores do mês com o delta de uma escrita de transação (chamar antes
+    do commit da própria escrita). `before`/`after` vêm de transaction_fields.
+    """
+    state = _current_alert_state(session)
+    if state is None:
+        return  # Reconstruído na próxima leitura
+    first_day_str = f"{state.month}-01"
+    deltas = {"monthIncome": 0, "monthExpenses": 0}
+    for fields, sign in ((before, -1), (after, 1)):
+        if fields is None:
+            continue
+        t_type, amount, t_date, _ = fields
+        if t_date >= first_day_str:
+            if t_type == "income":
+                deltas["monthIncome"] += sign * amount
+            elif t_type == "expense":
+                deltas["monthExpenses"] += sign * amount
+    _apply_alert_deltas(session, state, deltas)
+    _store_alerts(session, state)
+    session.add(state)
+
+
+def track_debt_alerts(session: Session, before: Optional[tuple], after: Optional[tuple]):
+    """Ajusta os contadores de dívidas com o delta de uma escrita (antes do commit)."""
+    state = _current_alert_state(session)
+    if state is None:
+        return
+    today = datetime.now().date()
+    due_from = today.strftime("%Y-%m-%d")
+    due_until = (today + timedelta(days=BEHAVIORAL_DUE_SOON_DAYS + 1)).strftime("%Y-%m-%d")
+    deltas = {"debtCount": 0, "debtTotal": 0, "overdueCount": 0, "overdueTotal": 0, "dueSoonCount": 0}
+    for fields, sign in ((before, -1), (after, 1)):
+        if fields is None:
+            continue
+        status, remaining, due_date = fields
+        deltas["debtCount"] += sign
+        deltas["debtTotal"] += sign * remaining
+        if status == "Atrasado":
+            deltas["overdueCount"] += sign
+            deltas["overdueTotal"] += sign * remaining
+        if status == "Pendente" and due_from <= due_date < due_until:
+            deltas["dueSoonCount"] += sign
+    _apply_alert_deltas(session, state, deltas)
+    _store_alerts(session, state)
+    session.add(state)
+
+
+@app.get("/api/behavioral-alerts/")
+def get_behavioral_alerts(session: Session = Depends(get_session)):
+    """Retorna os alertas comportamentais já avaliados nas escritas."""
+    state = _current_alert_state(session) or rebuild_behavioral_alert_state(session)
     
     return {
-        "alerts": alerts,
+        "alerts": json.loads(state.alerts),
         "summary": {
-            "totalDebts": len(debts),
-            "overdueDebts": len(atrasadas),
-            "monthlyExpenses": total_gastos,
-            "monthlyIncome": total_receitas,
-            "balance": total_receitas - total_gastos
+            "totalDebts": state.debtCount,
+            "overdueDebts": state.overdueCount,
+            "monthlyExpenses": state.monthExpenses,
+            "monthlyIncome": state.monthIncome,
+            "balance": state.monthIncome - state.monthExpenses
         }
     }
 
@@ -1714,22 +3437,22 @@ def get_ai_financial_health_analysis(session: Session = Depends(get_session)):
     """Análise de saúde financeira usando IA."""
     from datetime import datetime
     
-    # Coleta de dados
-    debts = session.exec(select(Debt)).all()
-    transactions = session.exec(select(Transaction)).all()
+    # Coleta de dados (apenas as dívidas enviadas no contexto da IA)
+    debts = session.exec(select(Debt).limit(15)).all()  # Aumentando limite levemente pois é importante
+    store = get_transaction_store(session)
     
     today = datetime.now().date()
     first_day = today.replace(day=1)
-    first_day_str = first_day.strftime("%Y-%m-%d")  # Converter para string para comparar
+    first_day_str = first_day.strftime("%Y-%m-%d")
     
     # Calcular métricas
-    total_dividas = sum(d.remaining or 0 for d in debts)
-    atrasadas = [d for d in debts if d.status == "Atrasado"]
-    total_atrasado = sum(d.remaining or 0 for d in atrasadas)
+    debt_summary = get_debt_summary(session)
+    total_dividas = debt_summary["totalDebt"]
+    atrasadas = debt_summary["statusBreakdown"]["atrasado"]["count"]
+    total_atrasado = debt_summary["statusBreakdown"]["atrasado"]["total"]
     
-    # Comparar datas como strings (formato YYYY-MM-DD é comparável)
-    gastos_mes = sum(t.amount for t in transactions if t.type == "expense" and t.date and t.date >= first_day_str)
-    receitas_mes = sum(t.amount for t in transactions if t.type == "income" and t.date and t.date >= first_day_str)
+    gastos_mes = store.total(start=first_day_str, t_type="expense")
+    receitas_mes = store.total(start=first_day_str, t_type="income")
     
     # Montar contexto para IA
     debts_info = [
@@ -1741,14 +3464,14 @@ def get_ai_financial_health_analysis(session: Session = Depends(get_session)):
             "tipo": getattr(d, 'debtType', 'parcelado'),
             "parcelas": f"{getattr(d, 'currentInstallment', '?')}/{getattr(d, 'totalInstallments', '?')}" if getattr(d, 'debtType', 'parcelado') == "parcelado" else "Recorrente"
         }
-        for d in debts[:15]  # Aumentando limite levemente pois é importante
+        for d in debts
     ]
     
     prompt = f"""
 Analise a saúde financeira do usuário com base nos dados:
 
 DÍVIDAS TOTAIS: R$ {total_dividas:,.2f}
-DÍVIDAS ATRASADAS: R$ {total_atrasado:,.2f} ({len(atrasadas)} itens)
+DÍVIDAS ATRASADAS: R$ {total_atrasado:,.2f} ({atrasadas} itens)
 GASTOS DO MÊS: R$ {gastos_mes:,.2f}
 RECEITAS DO MÊS: R$ {receitas_mes:,.2f}
 SALDO DO MÊS: R$ {receitas_mes - gastos_mes:,.2f}
@@ -1782,6 +3505,7 @@ Retorne um JSON com:
         }
     
     # Fallback se IA não disponível
+    priority_debt = session.exec(select(Debt.name).where(Debt.status == "Atrasado").limit(1)).first()
     score = 100
     if total_atrasado > 0:
         score -= 40
@@ -1804,7 +3528,7 @@ Retorne um JSON com:
                 "Crie uma reserva de emergência",
                 "Renegocie dívidas com juros altos"
             ],
-            "priority_debt": atrasadas[0].name if atrasadas else "Nenhuma dívida urgente",
+            "priority_debt": priority_debt or "Nenhuma dívida urgente",
             "savings_tip": "Revise gastos recorrentes como assinaturas e serviços não utilizados"
         },
         "data": {
@@ -1816,9 +3540,113 @@ Retorne um JSON com:
         "ai_available": False
     }
 
+# Pesos padrão do score de prioridade (normalizados pela soma na hora do cálculo)
+DEBT_PRIORITY_WEIGHTS = {
+    "status": 0.35,    # Atrasado > Pendente > Em dia
+    "due": 0.25,       # Proximidade do vencimento (vencida = máximo)
+    "burden": 0.20,    # Peso da parcela no total mensal de dívidas
+    "progress": 0.10,  # Parcelamentos perto do fim liberam caixa antes
+    "urgent": 0.10,    # Marcada como urgente pelo usuário
+}
+DEBT_STATUS_SCORES = {"Atrasado": 1.0, "Pendente": 0.5, "Em dia": 0.0}
+DEBT_DUE_HORIZON_DAYS = 30  # A partir daqui o vencimento não pesa mais
+
+
+def score_debt_priorities(debts: List[Debt], weights: Optional[dict] = None) -> List[dict]:
+    """
+    Score determinístico (0-100) de prioridade de pagamento, calculado em uma única
+    passada vetorizada sobre todas as dívidas. Retorna as prioridades ordenadas no
+    mesmo formato do endpoint de IA, com explicações montadas a partir dos fatores.
+    """
+    weights = {**DEBT_PRIORITY_WEIGHTS, **(weights or {})}
+    today = day_number(datetime.now().strftime("%Y-%m-%d"))
+
+    remaining = np.array([d.remaining or 0 for d in debts], dtype=np.float64)
+    monthly = np.array([d.monthly or 0 for d in debts], dtype=np.float64)
+    due_days = day_numbers([d.dueDate or "" for d in debts])
+    has_due = due_days != INVALID_DAY
+    days_to_due = np.where(has_due, due_days - today, DEBT_DUE_HORIZON_DAYS)
+    total_inst = np.array([(d.totalInstallments or 0) if d.debtType == "parcelado" else 0 for d in debts], dtype=np.float64)
+    current_inst = np.array([d.currentInstallment or 0 for d in debts], dtype=np.float64)
+
+    factors = {
+        "status": np.array([DEBT_STATUS_SCORES.get(d.status, 0.25) for d in debts]),
+        "due": np.clip(1 - days_to_due / DEBT_DUE_HORIZON_DAYS, 0, 1),
+        "burden": monthly / monthly.max() if monthly.max() > 0 else np.zeros(len(debts)),
+        "progress": np.divide(current_inst, total_inst, out=np.zeros(len(debts)), where=total_inst > 0).clip(0, 1),
+        "urgent": np.array([1.0 if d.isUrgent else 0.0 for d in debts]),
+    }
+    weight_total = sum(weights.values()) or 1
+    contributions = np.stack([factors[name] * weights[name] / weight_total for name in DEBT_PRIORITY_WEIGHTS])
+    scores = contributions.sum(axis=0) * 100
+    # Maior score primeiro; empate: maior saldo
+    order = np.lexsort((-remaining, -scores))
+    monthly_total = monthly.sum()
+    factor_names = list(DEBT_PRIORITY_WEIGHTS)
+
+    def reason(i: int, name: str) -> str:
+        d = debts[i]
+        if name == "status":
+            return "Dívida atrasada" if d.status == "Atrasado" else "Pagamento pendente" if d.status == "Pendente" else "Em dia"
+        if name == "due":
+            days = int(days_to_due[i])
+            return f"vencida há {-days} dia(s)" if days < 0 else "vence hoje" if days == 0 else f"vence em {days} dia(s)"
+        if name == "burden":
+            share = monthly[i] / monthly_total * 100 if monthly_total > 0 else 0
+            return f"parcela de R$ {monthly[i]:,.2f} ({share:.0f}% do total mensal em dívidas)"
+        if name == "progress":
+            return f"faltam {int(total_inst[i] - current_inst[i]) + 1} de {int(total_inst[i])} parcelas"
+        return "marcada como urgente"
+
+    priorities = []
+    for rank, i in enumerate(order, 1):
+        d = debts[i]
+        score = float(scores[i])
+        overdue = d.status == "Atrasado" or (has_due[i] and days_to_due[i] < 0)
+        urgencia = "alta" if overdue or score >= 60 else "media" if score >= 35 else "baixa"
+        # Explicação: os dois fatores que mais contribuíram para o score
+        top = [factor_names[k] for k in np.argsort(-contributions[:, i], kind="stable")[:2] if contributions[k, i] > 0]
+        motivo = "; ".join(reason(i, name) for name in top) or "Sem fatores de urgência"
+        if overdue:
+            acao = "Pagar imediatamente"
+            impacto = "Juros e multa por atraso, além de risco de negativação"
+        elif urgencia == "alta" or (has_due[i] and days_to_due[i] <= 7):
+            acao = "Agendar pagamento"
+            impacto = f"Entra em atraso em {max(int(days_to_due[i]), 0)} dia(s)" if has_due[i] else "Risco de atraso"
+        else:
+            acao = "Continuar pagando normalmente"
+            impacto = "Baixo impacto imediato"
+        priorities.append({
+            "id": d.id,
+            "nome": d.name,
+            "prioridade": rank,
+            "urgencia": urgencia,
+            "score": round(score, 1),
+            "valor_restante": d.remaining,
+            "parcela": d.monthly,
+            "status": d.status,
+            "motivo": motivo[0].upper() + motivo[1:],
+            "acao_recomendada": acao,
+            "impacto_se_ignorar": impacto,
+        })
+    return priorities
+
+
 @app.get("/api/ai/debt-priority/")
-def get_ai_debt_priority(session: Session = Depends(get_session)):
-    """IA analisa e prioriza dívidas para pagamento."""
+def get_ai_debt_priority(
+    use_ai: bool = False,
+    status_weight: Optional[float] = Query(None, ge=0),
+    due_weight: Optional[float] = Query(None, ge=0),
+    burden_weight: Optional[float] = Query(None, ge=0),
+    progress_weight: Optional[float] = Query(None, ge=0),
+    urgent_weight: Optional[float] = Query(None, ge=0),
+    session: Session = Depends(get_session)
+):
+    """
+    Prioriza dívidas para pagamento com o score determinístico; os pesos podem ser
+    ajustados por parâmetro. Com use_ai=true, a IA complementa a análise partindo
+    da ordem calculada.
+    """
     
     debts = session.exec(select(Debt)).all()
     
@@ -1829,26 +3657,33 @@ def get_ai_debt_priority(session: Session = Depends(get_session)):
             "priorities": []
         }
     
-    # Montar dados das dívidas
-    debts_data = []
-    for d in debts:
-        debts_data.append({
-            "id": d.id,
-            "nome": d.name,
-            "valor_restante": d.remaining,
-            "parcela_mensal": d.monthly,
-            "status": d.status,
-            "vencimento": str(d.dueDate) if d.dueDate else "Não definido",
-            "tipo": getattr(d, 'debtType', 'parcelado'),
-            "info_parcelas": f"{getattr(d, 'currentInstallment', '?')}/{getattr(d, 'totalInstallments', '?')}" if getattr(d, 'debtType', 'parcelado') == "parcelado" else "Recorrente/Fixo"
-        })
+    overrides = {
+        "status": status_weight, "due": due_weight, "burden": burden_weight,
+        "progress": progress_weight, "urgent": urgent_weight,
+    }
+    priorities = score_debt_priorities(debts, {k: v for k, v in overrides.items() if v is not None})
+    result = {
+        "success": True,
+        "priorities": priorities,
+        "estrategia_geral": "Priorize dívidas atrasadas e com vencimento próximo; entre as demais, as de maior parcela e as perto de quitar.",
+        "total_debts": len(debts),
+        "ai_powered": False
+    }
+    if not use_ai:
+        return result
     
+    ranking = [
+        {"id": p["id"], "nome": p["nome"], "prioridade": p["prioridade"], "score": p["score"],
+         "status": p["status"], "valor_restante": p["valor_restante"], "parcela": p["parcela"], "motivo": p["motivo"]}
+        for p in priorities
+    ]
     prompt = f"""
-Analise as seguintes dívidas e crie uma ordem de prioridade para pagamento.
-Considere: status (atrasado é urgente), valor da parcela, impacto financeiro.
+As dívidas abaixo já foram priorizadas por um score (0-100) que considera status,
+vencimento, peso da parcela, progresso do parcelamento e urgência.
+Complemente a análise sem alterar a ordem, a menos que haja um motivo forte.
 
-DÍVIDAS:
-{debts_data}
+RANKING:
+{ranking}
 
 Retorne um JSON com:
 {{
@@ -1870,98 +3705,188 @@ Retorne um JSON com:
 """
     
     ai_result = ask_ai_analysis(prompt, session)
-    
     if ai_result:
-        return {
-            "success": True,
-            "analysis": ai_result,
-            "total_debts": len(debts),
-            "ai_powered": True
-        }
-    
-    # Fallback: priorizar por status e valor
-    fallback_priorities = []
-    status_order = {"Atrasado": 1, "Pendente": 2, "Em dia": 3}
-    sorted_debts = sorted(debts, key=lambda d: (status_order.get(d.status, 3), -(d.remaining or 0)))
-    
-    for i, d in enumerate(sorted_debts, 1):
-        urgencia = "alta" if d.status == "Atrasado" else "media" if d.status == "Pendente" else "baixa"
-        fallback_priorities.append({
-            "id": d.id,
-            "nome": d.name,
-            "prioridade": i,
-            "urgencia": urgencia,
-            "valor_restante": d.remaining,
-            "parcela": d.monthly,
-            "status": d.status,
-            "motivo": f"{'URGENTE: Dívida atrasada!' if d.status == 'Atrasado' else 'Pagamento pendente' if d.status == 'Pendente' else 'Em dia, manter controle'}",
-            "acao_recomendada": "Pagar imediatamente" if d.status == "Atrasado" else "Agendar pagamento" if d.status == "Pendente" else "Continuar pagando normalmente"
-        })
-    
-    return {
-        "success": True,
-        "priorities": fallback_priorities,
-        "estrategia_geral": "Priorize dívidas atrasadas, depois pendentes, por ordem de maior valor.",
-        "total_debts": len(debts),
-        "ai_powered": False
-    }
+        result["analysis"] = ai_result
+        result["ai_powered"] = True
+    return result
 
 # ==========================================
 # 5. ROTAS DE PATRIMÔNIO LÍQUIDO
 # ==========================================
 
+NET_WORTH_COMPOSITION_LABELS = {"home": "Imóveis", "car": "Veículos", "investment": "Investimentos"}
+NET_WORTH_HISTORY_GRANULARITIES = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+
+def get_net_worth_totals(session: Session) -> dict:
+    """
+    Totais atuais de patrimônio em uma única agregação: ativos e passivos somados
+    por iconType e a carteira de investimentos, unidos em um só resultado.
+    """
+    query = union_all(
+        select(literal("asset"), Asset.iconType, func.sum(Asset.value)).group_by(Asset.iconType),
+        select(literal("liability"), Liability.iconType, func.sum(Liability.value)).group_by(Liability.iconType),
+        select(literal("investment"), literal(""), func.sum(Investment.current_value)),
+    )
+    totals = {"totalAssets": 0.0, "totalLiabilities": 0.0, "totalInvestments": 0.0, "assetsByType": {}}
+    for kind, icon_type, value in session.exec(query).all():
+        value = value or 0
+        if kind == "asset":
+            totals["totalAssets"] += value
+            totals["assetsByType"][icon_type] = value
+        elif kind == "liability":
+            totals["totalLiabilities"] += value
+        else:
+            totals["totalInvestments"] += value
+    totals["netWorth"] = totals["totalAssets"] - totals["totalLiabilities"]
+    return totals
+
+
+def record_net_worth_snapshot(session: Session, totals: Optional[dict] = None) -> NetWorthSnapshot:
+    """Grava (ou sobrescreve) a fotografia de patrimônio do dia atual."""
+    totals = totals or get_net_worth_totals(session)
+    now = datetime.now()
+    values = {
+        "date": now.strftime("%Y-%m-%d"),
+        "totalAssets": totals["totalAssets"],
+        "totalLiabilities": totals["totalLiabilities"],
+        "totalInvestments": totals["totalInvestments"],
+        "netWorth": totals["netWorth"],
+        "updated_at": now.isoformat(),
+    }
+    # Upsert na data: duas escritas no mesmo dia não disputam o insert da linha única
+    table = NetWorthSnapshot.__table__
+    statement = upsert_insert(session.connection())(table).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.date],
+        set_={name: statement.excluded[name] for name in values if name != "date"},
+    ).returning(*table.c)
+    snapshot = NetWorthSnapshot.model_validate(dict(session.connection().execute(statement).one()._mapping))
+    record_changes(session, NetWorthSnapshot, [snapshot.id])
+    session.commit()
+    return snapshot
+
+
+def get_net_worth_history(session: Session, start_date: str, end_date: str, granularity: str = "month") -> List[dict]:
+    """
+    Série de patrimônio reduzida no servidor: cada período usa a última fotografia
+    registrada nele. Períodos sem fotografia repetem o último valor conhecido;
+    períodos anteriores à primeira fotografia ficam de fora.
+    """
+    columns = (
+        NetWorthSnapshot.date, NetWorthSnapshot.totalAssets, NetWorthSnapshot.totalLiabilities,
+        NetWorthSnapshot.totalInvestments, NetWorthSnapshot.netWorth,
+    )
+    previous = session.exec(
+        select(*columns).where(NetWorthSnapshot.date < start_date).order_by(NetWorthSnapshot.date.desc()).limit(1)
+    ).first()
+    rows = session.exec(
+        select(*columns)
+        .where(NetWorthSnapshot.date >= start_date)
+        .where(NetWorthSnapshot.date <= end_date)
+        .order_by(NetWorthSnapshot.date)
+    ).all()
+
+    last_by_bucket = {}
+    for row in rows:
+        d = datetime.strptime(row[0], "%Y-%m-%d").date()
+        last_by_bucket[_bucket_start(d, granularity)] = row
+
+    months_pt = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+    history = []
+    current_row = previous
+    current = _bucket_start(datetime.strptime(start_date, "%Y-%m-%d").date(), granularity)
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    while current <= end:
+        current_row = last_by_bucket.get(current, current_row)
+        if current_row:
+            snapshot_date, total_assets, total_liabilities, total_investments, net_worth = current_row
+            history.append({
+                "period": current.isoformat(),
+                "month": months_pt[current.month - 1] if granularity == "month" else current.strftime("%d/%m"),
+                "date": snapshot_date,
+                "value": net_worth,
+                "totalAssets": total_assets,
+                "totalLiabilities": total_liabilities,
+                "totalInvestments": total_investments,
+            })
+        current = _next_bucket(current, granularity)
+    return history
+
+
+net_worth_scheduler_stop = threading.Event()
+
+
+def run_net_worth_snapshot_scheduler():
+    """Tick diário: grava a fotografia logo após a meia-noite, mesmo sem alterações no dia."""
+    while True:
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        if net_worth_scheduler_stop.wait((next_midnight - now).total_seconds() + 1):
+            return
+        try:
+            with Session(engine) as session:
+                record_net_worth_snapshot(session)
+        except Exception as e:
+            print(f"Erro ao gravar fotografia de patrimônio: {e}")
+
+
 @app.get("/api/net-worth/")
 def get_net_worth_dashboard(session: Session = Depends(get_session)):
     """Retorna dados agregados para o dashboard de Patrimônio."""
     assets = session.exec(select(Asset)).all()
     liabilities = session.exec(select(Liability)).all()
+    totals = get_net_worth_totals(session)
     
-    assets = session.exec(select(Asset)).all()
-    liabilities = session.exec(select(Liability)).all()
-    
-    total_assets = sum(a.value for a in assets)
-    total_liabilities = sum(l.value for l in liabilities)
-    net_worth = total_assets - total_liabilities
-    
-    # Mock de histórico (para o gráfico) - Gera variação baseada no valor atual
-    history = []
-    months = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun"]
-    base_val = net_worth * 0.95
-    for m in months:
-        val = base_val + (random.random() * (net_worth * 0.1))
-        history.append({"month": m, "value": val})
+    # Histórico (para o gráfico): últimos 6 meses a partir das fotografias diárias
+    today = datetime.now().date()
+    history = [
+        {"month": point["month"], "value": point["value"]}
+        for point in get_net_worth_history(
+            session, shift_months(today.replace(day=1), -5).isoformat(), today.isoformat(), "month"
+        )
+    ]
     
     # Composição
     composition = []
     colors = ["#22c55e", "#3b82f6", "#a855f7", "#64748b"]
-    asset_types = {}
-    for a in assets:
-        asset_types[a.iconType] = asset_types.get(a.iconType, 0) + a.value
-    
-    i = 0
-    for key, val in asset_types.items():
-        label = "Outros"
-        if key == "home": label = "Imóveis"
-        elif key == "car": label = "Veículos"
-        elif key == "investment": label = "Investimentos"
-        
+    for i, (key, val) in enumerate(totals["assetsByType"].items()):
+        label = NET_WORTH_COMPOSITION_LABELS.get(key, "Outros")
         composition.append({"name": label, "value": val, "color": colors[i % len(colors)]})
-        i += 1
         
     return {
-        "totalAssets": total_assets,
-        "totalLiabilities": total_liabilities,
-        "netWorth": net_worth,
+        "totalAssets": totals["totalAssets"],
+        "totalLiabilities": totals["totalLiabilities"],
+        "netWorth": totals["netWorth"],
         "assets": assets,
         "liabilities": liabilities,
         "history": history,
         "composition": composition
     }
 
+@app.get("/api/net-worth/history/")
+def get_net_worth_history_route(
+    granularity: str = Query("monthly"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    session: Session = Depends(get_session)
+):
+    """Histórico de patrimônio em qualquer intervalo, com granularidade daily, weekly ou monthly."""
+    if granularity not in NET_WORTH_HISTORY_GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Granularidade inválida (use daily, weekly ou monthly)")
+    today = datetime.now().date()
+    end_date = end or today.isoformat()
+    start_date = start or shift_months(today.replace(day=1), -11).isoformat()
+    try:
+        return get_net_worth_history(session, start_date, end_date, NET_WORTH_HISTORY_GRANULARITIES[granularity])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas inválidas (use YYYY-MM-DD)")
+
 @app.post("/api/assets/")
 def create_asset(asset: Asset, session: Session = Depends(get_session)):
     session.add(asset)
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(asset)
     return asset
 
@@ -1971,6 +3896,7 @@ def delete_asset(asset_id: int, session: Session = Depends(get_session)):
     if not asset: raise HTTPException(404)
     session.delete(asset)
     session.commit()
+    record_net_worth_snapshot(session)
     return {"ok": True}
 
 @app.put("/api/assets/{asset_id}/", response_model=Asset)
@@ -1987,6 +3913,7 @@ def update_asset(asset_id: int, asset_data: Asset, session: Session = Depends(ge
     
     session.add(asset)
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(asset)
     return asset
 
@@ -1994,6 +3921,7 @@ def update_asset(asset_id: int, asset_data: Asset, session: Session = Depends(ge
 def create_liability(liability: Liability, session: Session = Depends(get_session)):
     session.add(liability)
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(liability)
     return liability
 
@@ -2003,6 +3931,7 @@ def delete_liability(liability_id: int, session: Session = Depends(get_session))
     if not liab: raise HTTPException(404)
     session.delete(liab)
     session.commit()
+    record_net_worth_snapshot(session)
     return {"ok": True}
 
 @app.put("/api/liabilities/{liability_id}/", response_model=Liability)
@@ -2019,6 +3948,7 @@ def update_liability(liability_id: int, liability_data: Liability, session: Sess
     
     session.add(liability)
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(liability)
     return liability
 
@@ -2218,6 +4148,136 @@ def get_net_worth_ai_insight(session: Session = Depends(get_session)):
 # 6. ROTAS AVANÇADAS (AGREGADORES E IA)
 # ==========================================
 
+# --- RECORRÊNCIA DE DÍVIDAS ---
+# Regra no estilo RRULE (FREQ=MONTHLY;BYMONTHDAY;COUNT): dívidas fixas repetem todo
+# mês sem fim, parceladas têm uma ocorrência por parcela e as demais vencem uma vez.
+# Campos recurrence* explícitos na dívida têm precedência sobre a regra derivada.
+
+DEBT_RECURRENCE_FREQUENCIES = ("monthly", "none")
+
+
+def month_index(year: int, month: int) -> int:
+    """Meses desde o ano 0 (aritmética de meses sem datas)."""
+    return year * 12 + month - 1
+
+
+def _parse_date_prefix(value: Optional[str]):
+    try:
+        return datetime.strptime((value or "")[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+class DebtRecurrenceEngine:
+    """
+    Expande as recorrências das dívidas em ocorrências para qualquer intervalo.
+    A regra de cada dívida é interpretada uma única vez e as ocorrências ficam em
+    cache por (dívida, mês); a chave inclui os campos que definem a regra, então
+    uma dívida alterada nunca reaproveita ocorrências antigas.
+    """
+
+    MAX_CACHED_MONTHS = 100_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = {}
+        self._months = {}
+
+    @staticmethod
+    def _fingerprint(debt: Debt) -> tuple:
+        return (
+            debt.id, debt.dueDate, debt.debtType, debt.totalInstallments, debt.currentInstallment,
+            debt.recurrenceFreq, debt.recurrenceDay, debt.recurrenceCount, debt.recurrenceStart,
+        )
+
+    @staticmethod
+    def build_rule(debt: Debt) -> Optional[tuple]:
+        """(mês inicial, dia do mês, quantidade ou None, numerada) ou None se não houver data."""
+        installments = debt.debtType == "parcelado" and bool(debt.totalInstallments)
+        freq = debt.recurrenceFreq or ("monthly" if debt.debtType == "fixo" or installments else "none")
+        start = _parse_date_prefix(debt.recurrenceStart)
+        if start:
+            start_month = month_index(start.year, start.month)
+        else:
+            start = _parse_date_prefix(debt.dueDate)
+            if not start:
+                return None
+            start_month = month_index(start.year, start.month)
+            if freq == "monthly" and installments:
+                # dueDate é o vencimento da parcela atual: recua até a primeira
+                start_month -= (debt.currentInstallment or 1) - 1
+        day = debt.recurrenceDay or start.day
+        if freq != "monthly":
+            return start_month, day, 1, False
+        count = debt.recurrenceCount or (debt.totalInstallments if installments else None)
+        return start_month, day, count, installments
+
+    def rule(self, debt: Debt) -> Optional[tuple]:
+        key = self._fingerprint(debt)
+        if key not in self._rules:
+            self._rules[key] = self.build_rule(debt)
+        return self._rules[key]
+
+    def _occurrence(self, key: tuple, rule: tuple, month: int) -> tuple:
+        cached = self._months.get((key, month))
+        if cached is None:
+            start_month, day, _, numbered = rule
+            year, month0 = divmod(month, 12)
+            last_day = calendar.monthrange(year, month0 + 1)[1]
+            cached = (f"{year:04d}-{month0 + 1:02d}-{min(day, last_day):02d}", month - start_month + 1 if numbered else None)
+            self._months[(key, month)] = cached
+        return cached
+
+    def expand(self, debts: List[Debt], start_date: str, end_date: str) -> List[tuple]:
+        """
+        Ocorrências no intervalo inclusivo, ordenadas por data:
+        (dívida, data YYYY-MM-DD, nº da parcela ou None, é recorrente).
+        """
+        first = month_index(int(start_date[:4]), int(start_date[5:7]))
+        last = month_index(int(end_date[:4]), int(end_date[5:7]))
+        occurrences = []
+        with self._lock:
+            if len(self._months) > self.MAX_CACHED_MONTHS:
+                self._months.clear()
+            for debt in debts:
+                rule = self.rule(debt)
+                if rule is None:
+                    continue
+                start_month, _, count, _ = rule
+                lo = max(first, start_month)
+                hi = last if count is None else min(last, start_month + count - 1)
+                key = self._fingerprint(debt)
+                for month in range(lo, hi + 1):
+                    occ_date, number = self._occurrence(key, rule, month)
+                    if start_date <= occ_date <= end_date:
+                        occurrences.append((debt, occ_date, number, count != 1))
+        occurrences.sort(key=lambda occ: occ[1])
+        return occurrences
+
+    def first_occurrence(self, debt: Debt) -> Optional[str]:
+        """Data da primeira ocorrência (usada para fixar o início das parceladas)."""
+        with self._lock:
+            rule = self.rule(debt)
+            return self._occurrence(self._fingerprint(debt), rule, rule[0])[0] if rule else None
+
+    def invalidate(self):
+        with self._lock:
+            self._rules.clear()
+            self._months.clear()
+
+
+debt_recurrence = DebtRecurrenceEngine()
+
+
+def freeze_debt_recurrence(debt: Debt):
+    """
+    Fixa o início da série de parcelas. Sem isso, o avanço de currentInstallment
+    (ex.: ao pagar) deslocaria a série derivada de dueDate em um mês.
+    """
+    if debt.recurrenceStart is None and debt.debtType == "parcelado" and debt.totalInstallments:
+        debt.recurrenceStart = debt_recurrence.first_occurrence(debt)
+
+
 def get_unified_transactions(session: Session, start_date: str, end_date: str, account_filter: str = 'all') -> List[Transaction]:
     """
     Retorna uma lista unificada de transações reais e virtuais (dívidas a pagar).
@@ -2236,276 +4296,391 @@ def get_unified_transactions(session: Session, start_date: str, end_date: str, a
     if account_filter != 'all':
         return list(real_transactions)
 
-    # 2. Buscar dívidas que vencem no período e não estão pagas
-    # Assumimos que 'Em dia' = Paga ou não vencida. Mas se gerou transação, ok.
-    # Se status for 'Pendente' ou 'Atrasado', projetamos como despesa.
-    debts = session.exec(select(Debt)).all()
-    
-    virtual_transactions = []
-    
-    for debt in debts:
-        if not debt.dueDate:
-             continue
-             
-        # Verificar se vence no período
-        # A data de vencimento da dívida é YYYY-MM-DD
-        debt_date = debt.dueDate.split('T')[0]
-        
-        if start_date <= debt_date <= end_date:
-            # Check de Status: Se já está paga ("Em dia" e remaining == 0), não criamos virtual a menos que
-            # queiramos mostrar o histórico. Mas se está paga, deveria ter uma transação real criada pelo "Pagar".
-            # Se a transação real existe, o loop de deduplicação abaixo vai pegar.
-            # Se não existe transação real (pagou por fora?), confiamos no status.
-            
+    real_expenses = [t for t in real_transactions if t.type == 'expense']
+    return list(real_transactions) + get_projected_debt_transactions(session, start_date, end_date, real_expenses)
+
+
+def unpaid_debt_occurrences(session: Session, start_date: str, end_date: str, real_expenses: Optional[List[Transaction]] = None) -> List[tuple]:
+    """
+    Ocorrências de dívidas a pagar no período que ainda não foram casadas com um
+    pagamento real, como (dívida, data, nº da parcela, valor). Entram:
+    - a ocorrência em aberto (mês do dueDate) de dívidas Pendentes/Atrasadas;
+    - as ocorrências futuras de dívidas recorrentes (fixas e parcelas restantes).
+    Se `real_expenses` não for informado, busca no banco apenas as despesas candidatas
+    (mesmo período e valor próximo das parcelas), sem carregar o período inteiro.
+    """
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    projected = []
+    for debt, occ_date, number, recurring in debt_recurrence.expand(session.exec(select(Debt)).all(), start_date, end_date):
+        if number is not None and number < (debt.currentInstallment or 1):
+            continue  # Parcela já paga
+        outstanding = debt.status in ("Pendente", "Atrasado") and occ_date[:7] == (debt.dueDate or "")[:7]
+        scheduled = (
+            recurring and occ_date >= today_str
+            and (debt.debtType == "fixo" or (debt.remaining or 0) > 0)
+        )
+        if outstanding or scheduled:
             # Valor a considerar: parcela mensal (se parcelado/fixo) ou restante
             amount = debt.monthly if debt.monthly > 0 else debt.remaining
-            
-            # Deduplicação: Verificar se existe transação real com mesmo valor e descrição similar
-            # Isso "casa" o pagamento real com a dívida
-            is_paid = False
-            for t in real_transactions:
-                # Logica simples de match: mesmo valor E (nome da dívida na descrição OU categoria igual)
-                if t.type == 'expense' and abs(t.amount - amount) < 0.01:
-                    if debt.name.lower() in t.description.lower() or t.category == debt.category:
-                        is_paid = True
-                        break
-            
-            if not is_paid and debt.status in ["Pendente", "Atrasado"]:
-                # Criar transação virtual
-                virtual_t = Transaction(
-                    id=-debt.id, # ID negativo para indicar virtual
-                    description=f"[Previsto] {debt.name}",
-                    amount=amount,
-                    type="expense",
-                    date=debt_date,
-                    category=debt.category or "Dívidas",
-                    status="pending",
-                    accountId=None
-                )
-                virtual_transactions.append(virtual_t)
+            projected.append((debt, occ_date, number, amount))
+    if not projected:
+        return []
+
+    if real_expenses is None:
+        amounts = {amount for _, _, _, amount in projected}
+        real_expenses = session.exec(
+            select(Transaction)
+            .where(Transaction.date >= start_date)
+            .where(Transaction.date <= end_date)
+            .where(Transaction.type == 'expense')
+            .where(or_(*[Transaction.amount.between(a - 0.01, a + 0.01) for a in amounts]))
+        ).all()
+
+    # Indexar as despesas reais uma única vez por (valor em centavos, mês), para que
+    # cada ocorrência seja casada com uma consulta O(1) em vez de varrer tudo.
+    # Cada pagamento real quita no máximo uma ocorrência.
+    expenses_by_cents = {}
+    for t in real_expenses:
+        key = (round(t.amount * 100), t.date[:7])
+        expenses_by_cents.setdefault(key, []).append([t.amount, t.description.lower(), t.category, False])
+
+    unpaid = []
+    for debt, occ_date, number, amount in projected:
+        # Deduplicação: existe transação real no mesmo mês com mesmo valor (diferença < 0.01)
+        # E (categoria igual OU nome da dívida na descrição)? Então a ocorrência já foi paga.
+        # Valores a menos de 1 centavo caem no mesmo bucket ou em um vizinho.
+        cents = round(amount * 100)
+        debt_name = debt.name.lower()
+        match = next((
+            candidate
+            for key in (cents, cents - 1, cents + 1)
+            for candidate in expenses_by_cents.get((key, occ_date[:7]), ())
+            if not candidate[3] and abs(candidate[0] - amount) < 0.01
+            and (candidate[2] == debt.category or debt_name in candidate[1])
+        ), None)
+        if match:
+            match[3] = True
+            continue
+        unpaid.append((debt, occ_date, number, amount))
+    return unpaid
+
+
+def get_projected_debt_transactions(session: Session, start_date: str, end_date: str, real_expenses: Optional[List[Transaction]] = None) -> List[Transaction]:
+    """
+    Retorna as transações virtuais (ocorrências de dívidas a pagar) do período que
+    ainda não foram casadas com um pagamento real (ver unpaid_debt_occurrences).
+    """
+    virtual_transactions = []
+    for debt, occ_date, number, amount in unpaid_debt_occurrences(session, start_date, end_date, real_expenses):
+        suffix = f" ({number}/{debt.recurrenceCount or debt.totalInstallments})" if number else ""
+        virtual_transactions.append(Transaction(
+            # ID negativo indica virtual; o mês entra no ID para distinguir as ocorrências
+            id=-(debt.id * 100000 + month_index(int(occ_date[:4]), int(occ_date[5:7])) % 100000),
+            description=f"[Previsto] {debt.name}{suffix}",
+            amount=amount,
+            type="expense",
+            date=occ_date,
+            category=debt.category or "Dívidas",
+            status="pending",
+            accountId=None
+        ))
 
-    return list(real_transactions) + virtual_transactions
+    return virtual_transactions
 
 
-@app.get("/api/reports/")
-def get_reports(range: str = 'this-month', account: str = 'all', session: Session = Depends(get_session)):
+# --- SÉRIES TEMPORAIS (FLUXO DE CAIXA / TENDÊNCIAS) ---
+
+TIME_SERIES_GRANULARITIES = ("month", "week", "day")
+
+
+def shift_months(d, months: int):
+    """Retorna o primeiro dia do mês deslocado `months` meses a partir de `d`."""
+    index = d.year * 12 + (d.month - 1) + months
+    return d.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def _bucket_start(d, granularity: str):
+    """Data inicial do bucket (mês, semana ISO ou dia) que contém `d`."""
+    if granularity == "month":
+        return d.replace(day=1)
+    if granularity == "week":
+        return d - timedelta(days=d.weekday())
+    return d
+
+
+def _next_bucket(d, granularity: str):
+    if granularity == "month":
+        return shift_months(d, 1)
+    return d + timedelta(days=7 if granularity == "week" else 1)
+
+
+def get_time_series(session: Session, start_date: str, end_date: str, granularity: str = "month", account_filter: str = 'all', projected: Optional[List[Transaction]] = None) -> List[dict]:
     """
-    Gera dados agregados para os gráficos de relatório.
-    Calcula KPI e distribuição de despesas com base nas transações reais.
-    """
-    transactions = session.exec(select(Transaction)).all()
-    
-    # Mapear valores do frontend para dias
-    range_map = {
-        "this-month": 30,
-        "30-days": 30,
-        "this-year": 365,
-        "7d": 7,
-        "30d": 30,
-        "90d": 90,
-    }
-    days = range_map.get(range, 30)
+    Soma receitas e despesas por mês de calendário (ou semana/dia) entre start_date e end_date.
+    A agregação é feita com um único GROUP BY no banco (coluna `date` indexada); as previsões
+    de dívidas são somadas em seguida, como em `get_unified_transactions` (ou as de
+    `projected`, já calculadas para um intervalo que contém este).
+    Buckets sem movimentação são preenchidos com zero.
+    """
+    if granularity not in TIME_SERIES_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularidade inválida: {granularity}")
+
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+    # Semanas são agrupadas por dia no SQL (portável entre SQLite e Postgres) e consolidadas aqui
+    bucket = func.substr(Transaction.date, 1, 7 if granularity == "month" else 10)
+    query = (
+        select(bucket, Transaction.type, func.sum(Transaction.amount))
+        .where(Transaction.date >= start_date)
+        .where(Transaction.date <= end_date)
+        .group_by(bucket, Transaction.type)
+    )
+    if account_filter != 'all':
+        query = query.where(Transaction.accountId == int(account_filter))
+
+    totals = {}
+
+    def add(key: str, t_type: str, amount: float):
+        try:
+            d = datetime.strptime(key, "%Y-%m" if granularity == "month" else "%Y-%m-%d").date()
+        except ValueError:
+            return
+        slot = totals.setdefault(_bucket_start(d, granularity), {"income": 0, "expense": 0})
+        if t_type in slot:
+            slot[t_type] += amount or 0
+
+    for key, t_type, total in session.exec(query).all():
+        add(key, t_type, total)
+
+    if account_filter == 'all':
+        if projected is None:
+            projected = get_projected_debt_transactions(session, start_date, end_date)
+        for t in projected:
+            if not start_date <= t.date <= end_date:
+                continue
+            add(t.date[:7] if granularity == "month" else t.date[:10], t.type, t.amount)
+
+    months_pt = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+    series = []
+    current = _bucket_start(start, granularity)
+    while current <= end:
+        slot = totals.get(current, {"income": 0, "expense": 0})
+        label = months_pt[current.month - 1] if granularity == "month" else current.strftime("%d/%m")
+        series.append({
+            "period": current.isoformat(),
+            "month": label,
+            "income": slot["income"],
+            "expense": slot["expense"],
+            "balance": slot["income"] - slot["expense"]
+        })
+        current = _next_bucket(current, granularity)
+    return series
+
+
+def get_spending_trend_series(series: List[dict]) -> List[dict]:
+    """Converte uma série de fluxo de caixa em tendência de gastos com variação percentual."""
+    result = []
+    prev_value = None
+    for point in series:
+        month_expense = point["expense"]
+        if prev_value is not None and prev_value > 0:
+            change = round(((month_expense - prev_value) / prev_value) * 100, 1)
+        else:
+            change = 0
+        result.append({"period": point["period"], "month": point["month"], "value": month_expense, "change": change})
+        prev_value = month_expense
+    return result
+
+
+def _series_window(num_months: int, start: Optional[str], end: Optional[str]):
+    """
+    Janela padrão: os últimos `num_months` meses de calendário, incluindo o atual.
+    `start`/`end` informados precisam ser YYYY-MM-DD (400 caso contrário).
+    """
+    today = datetime.now().date()
+    start_date = start or shift_months(today, -(num_months - 1)).isoformat()
+    end_date = end or today.isoformat()
+    for value in (start_date, end_date):
+        try:
+            valid = datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") == value  # Recusa 2026-1-1
+        except ValueError:
+            valid = False
+        if not valid:
+            raise HTTPException(status_code=400, detail="Datas inválidas (use YYYY-MM-DD)")
+    return start_date, end_date
+
+
+REPORT_RANGE_DAYS = {"this-month": 30, "30-days": 30, "this-year": 365, "7d": 7, "30d": 30, "90d": 90}
+
+
+def build_expense_report(session: Session, days: int, account: str = 'all', projected: Optional[List[Transaction]] = None) -> dict:
+    """
+    KPIs e distribuição de despesas dos últimos `days` dias (reais + dívidas previstas,
+    ou as de `projected` se já calculadas para um intervalo que contém este).
+    As somas das transações reais saem do cache colunar; a comparação com o período
+    anterior considera apenas transações reais e usa o índice de somas prefixadas.
+    """
+    store = get_transaction_store(session)
     today = datetime.now()
     cutoff_date = (today - timedelta(days=days)).strftime("%Y-%m-%d")
     today_str = today.strftime("%Y-%m-%d")
 
-    # Obter transações unificadas (Reais + Dívidas)
-    # Buscamos até hoje, mas para relatórios pode ser interessante ver o consolidado do período
-    unified_transactions = get_unified_transactions(session, cutoff_date, today_str, account)
-    
-    # Filtrar por tipo (apenas despesas)
-    filtered = [
-        t for t in unified_transactions 
-        if t.type == 'expense'
-    ]
-    
-    total_spent = sum(t.amount for t in filtered)
-    
-    # Agrupar por categoria
-    category_map = {}
-    for t in filtered:
-        category_map[t.category] = category_map.get(t.category, 0) + t.amount
-        
+    category_map = store.sum_by_category(start=cutoff_date, end=today_str, t_type="expense", account=account)
+    transaction_count = store.count(start=cutoff_date, end=today_str, t_type="expense", account=account)
+
+    # Dívidas previstas entram apenas na visão de todas as contas
+    if account == 'all':
+        if projected is None:
+            projected = get_projected_debt_transactions(session, cutoff_date, today_str)
+        for t in projected:
+            if not cutoff_date <= t.date <= today_str:
+                continue
+            category_map[t.category] = category_map.get(t.category, 0) + t.amount
+            transaction_count += 1
+
+    total_spent = sum(category_map.values())
+
     distribution = []
     colors = ['#8b5cf6', '#22c55e', '#f59e0b', '#ef4444', '#3b82f6', '#ec4899', '#14b8a6', '#f97316']
-    
     top_category_name = "N/A"
     top_category_value = 0
-    
     for i, (cat, val) in enumerate(category_map.items()):
         if val > top_category_value:
             top_category_value = val
             top_category_name = cat
-            
         distribution.append({
             "name": cat,
             "value": val,
             "percentage": round((val / total_spent * 100), 1) if total_spent > 0 else 0,
             "color": colors[i % len(colors)]
         })
-    
-    # Calcular variação vs período anterior
-    prev_cutoff_start = (datetime.now() - timedelta(days=days * 2)).strftime("%Y-%m-%d")
-    prev_cutoff_end = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-    prev_filtered = [t for t in transactions if prev_cutoff_start <= t.date < prev_cutoff_end and t.type == "expense"]
-    prev_total = sum(t.amount for t in prev_filtered)
-    
+
+    # Calcular variação vs período anterior: [hoje - 2*days, hoje - days)
+    prev_start = (today - timedelta(days=days * 2)).strftime("%Y-%m-%d")
+    prev_end = (today - timedelta(days=days + 1)).strftime("%Y-%m-%d")
+    prev_total, prev_count = store.total_and_count(start=prev_start, end=prev_end, t_type="expense", account=account)
     change = round(((total_spent - prev_total) / prev_total) * 100, 1) if prev_total > 0 else 0
-        
+    count_change = round(((transaction_count - prev_count) / prev_count) * 100, 1) if prev_count > 0 else 0
+
     return {
         "kpi": {
             "totalSpent": total_spent,
             "totalSpentChange": change,
             "topCategory": top_category_name,
             "topCategoryValue": top_category_value,
-            "transactionCount": len(filtered),
-            "transactionCountChange": 0
+            "transactionCount": transaction_count,
+            "transactionCountChange": count_change
         },
         "distribution": distribution
     }
 
 
-@app.get("/api/reports/cash-flow/")
-@app.get("/api/reports/cash-flow/")
-@app.get("/api/reports/cash-flow/")
-def get_cash_flow(date_range: str = "this-year", account: str = 'all', session: Session = Depends(get_session)):
-    """Retorna dados de fluxo de caixa (receitas vs despesas) por mês."""
-    
-    # Determinar range para buscar transações
+def build_income_sources(session: Session, days: int, account: str = 'all') -> List[dict]:
+    """Receitas dos últimos `days` dias agrupadas por categoria/fonte."""
+    store = get_transaction_store(session)
     today = datetime.now()
-    range_months = {"this-month": 1, "30-days": 1, "this-year": 12, "7d": 1, "30d": 1, "90d": 3}
-    num_months = range_months.get(date_range, 6)
-    
-    start_date = (today - timedelta(days=30 * num_months)).strftime("%Y-%m-%d")
+    start_date = (today - timedelta(days=days)).strftime("%Y-%m-%d")
     end_date = today.strftime("%Y-%m-%d")
-    
-    transactions = get_unified_transactions(session, start_date, end_date, account)
-    
-    # Determinar número de meses baseado no range
-    range_months = {
-        "this-month": 1,
-        "30-days": 1,
-        "this-year": 12,
-        "7d": 1,
-        "30d": 1,
-        "90d": 3,
-    }
-    num_months = range_months.get(date_range, 6)
-    
-    # Gerar dados mensais
-    months_pt = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
-    today = datetime.now()
-    result = []
-    
-    for idx in range(num_months - 1, -1, -1):
-        target_date = today - timedelta(days=30 * idx)
-        month_start = target_date.replace(day=1).strftime("%Y-%m")
-        month_label = months_pt[target_date.month - 1]
-        
-        month_income = sum(t.amount for t in transactions 
-                         if t.type == "income" and t.date.startswith(month_start))
-        month_expense = sum(t.amount for t in transactions 
-                          if t.type == "expense" and t.date.startswith(month_start))
-        
-        result.append({
-            "month": month_label,
-            "income": month_income,
-            "expense": month_expense,
-            "balance": month_income - month_expense
-        })
-    
-    return result
 
+    categories = {}
+    for cat, val in store.sum_by_category(start=start_date, end=end_date, t_type="income", account=account).items():
+        cat = cat or "Outros"
+        categories[cat] = categories.get(cat, 0) + val
+    total_income = sum(categories.values())
+    colors = ['#22c55e', '#3b82f6', '#8b5cf6', '#f59e0b', '#14b8a6', '#ec4899']
 
-@app.get("/api/reports/spending-trends/")
-@app.get("/api/reports/spending-trends/")
-def get_spending_trends(date_range: str = "this-year", account: str = 'all', session: Session = Depends(get_session)):
-    """Retorna tendência de gastos ao longo dos meses."""
-    
-    # Determinar range
-    today = datetime.now()
-    range_months = {"this-month": 3, "30-days": 3, "this-year": 12, "7d": 3, "30d": 3, "90d": 6}
-    num_months = range_months.get(date_range, 6)
+    return [
+        {
+            "name": cat,
+            "value": val,
+            "percentage": round((val / total_income) * 100, 1) if total_income > 0 else 0,
+            "color": colors[i % len(colors)]
+        }
+        for i, (cat, val) in enumerate(categories.items())
+    ]
+
+
+@app.get("/api/reports/")
+def get_reports(range: str = 'this-month', account: str = 'all', session: Session = Depends(get_session)):
+    """
+    Gera dados agregados para os gráficos de relatório.
+    Calcula KPI e distribuição de despesas com base nas transações reais e dívidas previstas.
+    """
+    return build_expense_report(session, REPORT_RANGE_DAYS.get(range, 30), account)
 
-    start_date = (today - timedelta(days=30 * num_months)).strftime("%Y-%m-%d")
-    end_date = today.strftime("%Y-%m-%d")
-    
-    transactions = get_unified_transactions(session, start_date, end_date, account)
-    
-    range_months = {
-        "this-month": 3,
-        "30-days": 3,
-        "this-year": 12,
-        "7d": 3,
-        "30d": 3,
-        "90d": 6,
-    }
-    num_months = range_months.get(date_range, 6)
-    
-    months_pt = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
-    today = datetime.now()
-    result = []
-    prev_value = None
-    
-    for idx in range(num_months - 1, -1, -1):
-        target_date = today - timedelta(days=30 * idx)
-        month_start = target_date.replace(day=1).strftime("%Y-%m")
-        month_label = months_pt[target_date.month - 1]
-        
-        month_expense = sum(t.amount for t in transactions 
-                          if t.type == "expense" and t.date.startswith(month_start))
-        
-        # Calcular variação percentual
-        if prev_value is not None and prev_value > 0:
-            change = round(((month_expense - prev_value) / prev_value) * 100, 1)
-        else:
-            change = 0
-        
-        result.append({
-            "month": month_label,
-            "value": month_expense,
-            "change": change
-        })
-        prev_value = month_expense
-    
-    return result
+
+@app.get("/api/reports/cash-flow/")
+def get_cash_flow(
+    date_range: str = "this-year",
+    account: str = 'all',
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    granularity: str = "month",
+    session: Session = Depends(get_session)
+):
+    """
+    Retorna dados de fluxo de caixa (receitas vs despesas) por mês de calendário.
+    Aceita `start`/`end` (YYYY-MM-DD) e `granularity` (month, week, day) opcionais.
+    """
+    range_months = {"this-month": 1, "30-days": 1, "this-year": 12, "7d": 1, "30d": 1, "90d": 3}
+    start_date, end_date = _series_window(range_months.get(date_range, 6), start, end)
+    return get_time_series(session, start_date, end_date, granularity, account)
+
+
+@app.get("/api/reports/spending-trends/")
+def get_spending_trends(
+    date_range: str = "this-year",
+    account: str = 'all',
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    granularity: str = "month",
+    session: Session = Depends(get_session)
+):
+    """Retorna tendência de gastos ao longo dos meses de calendário (ou semanas/dias)."""
+    range_months = {"this-month": 3, "30-days": 3, "this-year": 12, "7d": 3, "30d": 3, "90d": 6}
+    start_date, end_date = _series_window(range_months.get(date_range, 6), start, end)
+    series = get_time_series(session, start_date, end_date, granularity, account)
+    return get_spending_trend_series(series)
 
 
-@app.get("/api/reports/income-sources/")
 @app.get("/api/reports/income-sources/")
 def get_income_sources(date_range: str = "this-month", account: str = 'all', session: Session = Depends(get_session)):
     """Retorna receitas agrupadas por categoria/fonte."""
-    
-    range_map = {"this-month": 30, "30-days": 30, "this-year": 365, "7d": 7, "30d": 30, "90d": 90}
-    days = range_map.get(date_range, 30)
-    
-    today = datetime.now()
-    start_date = (today - timedelta(days=days)).strftime("%Y-%m-%d")
-    end_date = today.strftime("%Y-%m-%d")
-    
-    transactions = get_unified_transactions(session, start_date, end_date, account)
-    
-    # Filtrar apenas incomes (Unified normalmente retorna despesas virtuais, mas transacoes reais de income virão junto)
-    filtered = [t for t in transactions if t.type == "income"]
-    
-    categories = {}
-    total_income = sum(t.amount for t in filtered)
-    colors = ['#22c55e', '#3b82f6', '#8b5cf6', '#f59e0b', '#14b8a6', '#ec4899']
-    
-    for t in filtered:
-        cat = t.category or "Outros"
-        categories[cat] = categories.get(cat, 0) + t.amount
-    
-    result = []
-    for i, (cat, val) in enumerate(categories.items()):
-        result.append({
-            "name": cat,
-            "value": val,
-            "percentage": round((val / total_income) * 100, 1) if total_income > 0 else 0,
-            "color": colors[i % len(colors)]
-        })
-    
-    return result
+    return build_income_sources(session, REPORT_RANGE_DAYS.get(date_range, 30), account)
+
+
+@app.get("/api/reports/bundle")
+def get_reports_bundle(
+    date_range: str = Query("this-month", alias="range"),
+    account: str = 'all',
+    session: Session = Depends(get_session)
+):
+    """
+    Retorna todos os dados da tela de relatórios em uma única chamada:
+    KPIs, distribuição, fluxo de caixa, tendências e fontes de receita.
+    """
+    days = REPORT_RANGE_DAYS.get(date_range, 30)
+    cf_months = {"this-month": 1, "30-days": 1, "this-year": 12, "7d": 1, "30d": 1, "90d": 3}.get(date_range, 6)
+    trend_months = {"this-month": 3, "30-days": 3, "this-year": 12, "7d": 3, "30d": 3, "90d": 6}.get(date_range, 6)
+
+    # Fluxo de caixa e tendência: a janela de tendência sempre contém a de fluxo de caixa
+    series_start, series_end = _series_window(trend_months, None, None)
+    # Dívidas previstas calculadas uma vez, na união das janelas de KPIs e tendência
+    projected = None
+    if account == 'all':
+        report_start = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        projected = get_projected_debt_transactions(session, min(report_start, series_start), series_end)
+
+    report = build_expense_report(session, days, account, projected)
+    series = get_time_series(session, series_start, series_end, "month", account, projected)
+
+    return {
+        **report,
+        "cashFlow": series[-cf_months:],
+        "spendingTrends": get_spending_trend_series(series),
+        "incomeSources": build_income_sources(session, days, account)
+    }
 
 
 @app.get("/api/leakage-analysis/")
@@ -2584,12 +4759,9 @@ def get_predictive_analysis(session: Session = Depends(get_session)):
     total_balance = sum(a.balance for a in accounts)
     
     # Calcular médias reais (simplified for now)
-    transactions = session.exec(select(Transaction)).all()
-    incomes = [t.amount for t in transactions if t.type == 'income']
-    expenses = [t.amount for t in transactions if t.type == 'expense']
-    
-    monthly_income = sum(incomes) / 3 if incomes else 0 # Média aproximada
-    monthly_expense = sum(expenses) / 3 if expenses else 0
+    store = get_transaction_store(session)
+    monthly_income = store.total(t_type="income") / 3 # Média aproximada
+    monthly_expense = store.total(t_type="expense") / 3
     
     # TENTATIVA DE IA (Sugestão de Cenários de Economia Interativa)
     prompt = f"""
@@ -2645,194 +4817,197 @@ class AllocationRequest(BaseModel):
     paycheck_date: str
 
 
+# Otimizador determinístico: preenche, em ordem, margem mínima -> contas que
+# vencem antes do próximo salário -> orçamentos -> metas. A IA só narra o resultado.
+ALLOCATION_PERIOD_DAYS = 15  # Intervalo entre salários (quinzenal)
+ALLOCATION_MIN_SAFETY_RATIO = 0.05  # Margem de segurança mínima (restrição)
+GOAL_DEFAULT_HORIZON_DAYS = 180  # Metas sem prazo válido
+ALLOCATION_CATEGORIES = [
+    ("essentials", "Essenciais", "#ef4444"),
+    ("goals", "Metas", "#3b82f6"),
+    ("budgets", "Orçamentos", "#a855f7"),
+    ("safety_margin", "Margem de Segurança", "#eab308"),
+]
+
+
+def _fill_in_order(available: float, needs: np.ndarray) -> np.ndarray:
+    """Guloso: atende as necessidades na ordem dada até acabar o dinheiro."""
+    before = np.cumsum(needs) - needs
+    return np.clip(available - before, 0, needs)
+
+
+def _fill_proportional(available: float, caps: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Divide `available` proporcionalmente aos pesos, sem passar dos tetos (water-filling)."""
+    filled = np.zeros(len(caps))
+    open_ = (caps > 0) & (weights > 0)
+    while available > 0.005 and open_.any():
+        share = np.where(open_, weights, 0) / weights[open_].sum() * available
+        grant = np.minimum(share, caps - filled)
+        filled += grant
+        available -= grant.sum()
+        open_ &= caps - filled > 0.005
+    return filled
+
+
+def allocation_start_day(paycheck_date: str) -> int:
+    """Dia do salário (hoje, se a data for inválida)."""
+    start = parse_day_number(paycheck_date)
+    return start if start != INVALID_DAY else day_number(datetime.now().strftime("%Y-%m-%d"))
+
+
+def paycheck_debt_occurrences(session: Session, paycheck_date: str) -> List[tuple]:
+    """
+    Ocorrências de dívidas ainda não pagas entre o salário e o próximo (recorrência
+    de debt_recurrence, casadas com pagamentos como em unpaid_debt_occurrences),
+    mais a ocorrência em aberto de dívidas Atrasadas anteriores a esse intervalo.
+    """
+    start = allocation_start_day(paycheck_date)
+    start_str = str(np.datetime64(start, "D"))
+    end_str = str(np.datetime64(start + ALLOCATION_PERIOD_DAYS - 1, "D"))
+    overdue = session.exec(
+        select(func.min(Debt.dueDate)).where(Debt.status == "Atrasado", Debt.dueDate < start_str)
+    ).one()
+    lookback = min(start_str, f"{overdue[:7]}-01") if overdue else start_str
+    return [
+        occurrence for occurrence in unpaid_debt_occurrences(session, lookback, end_str)
+        if occurrence[0].status != "Quitado" and (occurrence[1] >= start_str or occurrence[0].status == "Atrasado")
+    ]
+
+
+def optimize_paycheck_allocation(
+    amount: float,
+    paycheck_date: str,
+    debt_occurrences: List[tuple],
+    goals: List[Goal],
+    budgets: List[Budget],
+    budget_spend: dict,
+    min_safety_ratio: float = ALLOCATION_MIN_SAFETY_RATIO,
+) -> dict:
+    """
+    Distribui o salário sobre arrays NumPy:
+    1. reserva a margem mínima de segurança;
+    2. contas que vencem até o próximo salário (`debt_occurrences`, de
+       paycheck_debt_occurrences), na ordem de score_debt_priorities, até o valor
+       da ocorrência (ou o saldo restante, se menor);
+    3. orçamentos, proporcional ao gasto médio mensal (`budget_spend`) do período;
+    4. metas, proporcional ao ritmo necessário (falta / salários até o prazo);
+    5. sobra vai para metas com espaço e, depois, para a margem.
+    Retorna {"categories": [...], "shortfall": valor de contas não cobertas}.
+    """
+    start = allocation_start_day(paycheck_date)
+    amount = max(amount, 0)
+    available = amount * (1 - min_safety_ratio)
+
+    # Ocorrências do período, na ordem de prioridade da dívida (e depois por data)
+    debts = list({occurrence[0].id: occurrence[0] for occurrence in debt_occurrences}.values())
+    rank = {p["id"]: position for position, p in enumerate(score_debt_priorities(debts))} if debts else {}
+    occurrences = sorted(debt_occurrences, key=lambda occurrence: (rank[occurrence[0].id], occurrence[1]))
+    period_debts = [debt for debt, _, _, _ in occurrences]
+    debt_needs = np.array([
+        min(occurrence_amount, debt.remaining) if (debt.remaining or 0) > 0 else occurrence_amount
+        for debt, _, _, occurrence_amount in occurrences
+    ], dtype=np.float64)
+    debt_paid = _fill_in_order(available, debt_needs)
+    available -= debt_paid.sum()
+
+    # Orçamentos: gasto médio mensal proporcional à quinzena
+    period_ratio = ALLOCATION_PERIOD_DAYS / 30
+    budget_needs = np.array([budget_spend.get(b.category, 0) * period_ratio for b in budgets], dtype=np.float64)
+    budget_paid = _fill_proportional(available, budget_needs, budget_needs)
+    available -= budget_paid.sum()
+
+    # Metas: quanto falta dividido pelos salários restantes até o prazo
+    goal_missing = np.array([max((g.targetAmount or 0) - (g.currentAmount or 0), 0) for g in goals], dtype=np.float64)
+    deadlines = day_numbers([g.deadline or "" for g in goals])
+    days_left = np.where(deadlines != INVALID_DAY, deadlines - start, GOAL_DEFAULT_HORIZON_DAYS)
+    paychecks_left = np.maximum(days_left / ALLOCATION_PERIOD_DAYS, 1)
+    goal_pace = goal_missing / paychecks_left
+    goal_paid = _fill_proportional(available, goal_pace, goal_pace)
+    available -= goal_paid.sum()
+    # Sobra: adianta metas (mesmos pesos) até completá-las
+    goal_paid += _fill_proportional(available, goal_missing - goal_paid, goal_pace)
+
+    def items(models, paid, reference_type, name):
+        return [
+            {"name": name(m), "amount": round(float(v), 2), "reference_type": reference_type, "reference_id": m.id}
+            for m, v in zip(models, paid) if round(float(v), 2) > 0
+        ]
+
+    grouped = {
+        "essentials": items(period_debts, debt_paid, "debt", lambda d: d.name),
+        "goals": items(goals, goal_paid, "goal", lambda g: g.name),
+        "budgets": items(budgets, budget_paid, "budget", lambda b: b.category),
+    }
+    # Margem = o que sobrou depois do arredondamento (soma bate com o salário)
+    allocated = sum(item["amount"] for cat_items in grouped.values() for item in cat_items)
+    grouped["safety_margin"] = [{"name": "Reserva para imprevistos", "amount": round(amount - allocated, 2)}]
+    return {
+        "categories": [
+            {"id": cat_id, "name": name, "color": color, "items": grouped[cat_id]}
+            for cat_id, name, color in ALLOCATION_CATEGORIES
+        ],
+        "shortfall": round(float(debt_needs.sum() - debt_paid.sum()), 2),
+    }
+
+
+def allocation_insights(plan: dict, amount: float) -> List[str]:
+    """Insights determinísticos da alocação (usados quando a IA não está disponível)."""
+    totals = {cat["id"]: sum(item["amount"] for item in cat["items"]) for cat in plan["categories"]}
+    insights = []
+    if plan["shortfall"] > 0:
+        insights.append(f"Faltaram R$ {plan['shortfall']:.2f} para cobrir todas as contas que vencem antes do próximo salário")
+    elif totals["essentials"] > 0:
+        insights.append(f"Todas as contas até o próximo salário estão cobertas (R$ {totals['essentials']:.2f})")
+    if totals["goals"] > 0:
+        insights.append(f"R$ {totals['goals']:.2f} vão para metas, priorizando prazos próximos e menor progresso")
+    share = totals["safety_margin"] / amount * 100 if amount > 0 else 0
+    insights.append(f"Margem de segurança de R$ {totals['safety_margin']:.2f} ({share:.0f}% do salário)")
+    return insights
+
+
 @app.post("/api/allocation/suggest")
 def suggest_allocation(request: AllocationRequest, session: Session = Depends(get_session)):
     """
-    Gera sugestão inteligente de alocação do salário quinzenal.
-    Analisa dívidas, metas, orçamentos e sugere distribuição otimizada.
+    Gera sugestão de alocação do salário quinzenal.
+    A distribuição vem de optimize_paycheck_allocation (determinística); a IA,
+    se configurada, apenas escreve os insights sobre o resultado.
     """
     amount = request.paycheck_amount
     paycheck_date = request.paycheck_date
     
     # Buscar dados financeiros
-    debts = session.exec(select(Debt)).all()
+    debt_occurrences = paycheck_debt_occurrences(session, paycheck_date)
     goals = session.exec(select(Goal)).all()
     budgets = session.exec(select(Budget)).all()
-    transactions = session.exec(select(Transaction)).all()
-    
-    # Ordenar dívidas por urgência e data de vencimento
-    def debt_priority(d):
-        try:
-            due = datetime.strptime(d.dueDate, "%Y-%m-%d")
-            days_until = (due - datetime.now()).days
-            urgency_score = 1000 if d.isUrgent else 0
-            return -urgency_score + days_until  # Menores vêm primeiro
-        except:
-            return 999
-    
-    sorted_debts = sorted(debts, key=debt_priority)
     
-    # Ordenar metas por deadline
-    def goal_priority(g):
-        try:
-            deadline = datetime.strptime(g.deadline, "%Y-%m-%d")
-            progress = g.currentAmount / g.targetAmount if g.targetAmount > 0 else 1
-            return (deadline - datetime.now()).days * (1 - progress)
-        except:
-            return 999
-    
-    sorted_goals = sorted(goals, key=goal_priority)
-    
-    # Calcular gastos médios por categoria nos últimos 3 meses
+    # Gasto médio mensal por categoria nos últimos 90 dias (sem histórico: metade do limite)
+    stats = spending_stats.get(session)
     budget_averages = {}
     for b in budgets:
-        cat_expenses = [t.amount for t in transactions if t.category == b.category and t.type == 'expense']
-        budget_averages[b.category] = sum(cat_expenses) / 3 if cat_expenses else b.limit / 2
-    
-    # Preparar dados para a IA
-    debts_info = [
-        f"- {d.name}: R$ {d.monthly:.2f}/mês, vence dia {d.dueDate}, {'URGENTE' if d.isUrgent else d.status}"
-        for d in sorted_debts[:10]
-    ]
+        average = category_monthly_average(stats, b.category)
+        budget_averages[b.category] = average if average is not None else b.limit / 2
     
-    goals_info = [
-        f"- {g.name}: {(g.currentAmount/g.targetAmount*100):.0f}% completa, faltam R$ {g.targetAmount - g.currentAmount:.2f}, prazo {g.deadline}"
-        for g in sorted_goals[:5]
-    ]
+    plan = optimize_paycheck_allocation(amount, paycheck_date, debt_occurrences, goals, budgets, budget_averages)
     
-    budgets_info = [
-        f"- {b.category}: limite R$ {b.limit:.2f}, gasto médio mensal R$ {budget_averages.get(b.category, 0):.2f}"
-        for b in budgets[:8]
+    allocation_lines = [
+        f"- {cat['name']}: " + (", ".join(f"{item['name']} R$ {item['amount']:.2f}" for item in cat["items"]) or "nada")
+        for cat in plan["categories"]
     ]
-    
     prompt = f"""
-Analise a situação financeira e sugira como alocar o salário quinzenal de R$ {amount:.2f}.
-
-DÍVIDAS E CONTAS (pagar primeiro):
-{chr(10).join(debts_info) if debts_info else "- Nenhuma dívida cadastrada"}
-
-METAS DE POUPANÇA:
-{chr(10).join(goals_info) if goals_info else "- Nenhuma meta cadastrada"}
-
-ORÇAMENTOS VARIÁVEIS:
-{chr(10).join(budgets_info) if budgets_info else "- Nenhum orçamento cadastrado"}
-
-Regras de alocação:
-1. Priorize dívidas urgentes e com vencimento nos próximos 15 dias
-2. Reserve 5-15% para margem de segurança (imprevistos)
-3. Contribua para metas atrasadas ou próximas do prazo
-4. Distribua o restante proporcionalmente entre orçamentos
+O salário quinzenal de R$ {amount:.2f} já foi distribuído assim:
+{chr(10).join(allocation_lines)}
+Contas do período sem cobertura: R$ {plan['shortfall']:.2f}
 
+Não altere os valores. Explique a alocação em 3 insights curtos e práticos.
 Retorne APENAS JSON nesta estrutura:
-{{
-    "categories": [
-        {{
-            "id": "essentials",
-            "name": "Essenciais",
-            "color": "#ef4444",
-            "items": [
-                {{"name": "Nome da despesa", "amount": 0.00, "reference_type": "debt", "reference_id": null}}
-            ]
-        }},
-        {{
-            "id": "goals",
-            "name": "Metas",
-            "color": "#3b82f6",
-            "items": [
-                {{"name": "Nome da meta", "amount": 0.00, "reference_type": "goal", "reference_id": null}}
-            ]
-        }},
-        {{
-            "id": "budgets",
-            "name": "Orçamentos",
-            "color": "#a855f7",
-            "items": [
-                {{"name": "Categoria", "amount": 0.00, "reference_type": "budget", "reference_id": null}}
-            ]
-        }},
-        {{
-            "id": "safety_margin",
-            "name": "Margem de Segurança",
-            "color": "#eab308",
-            "items": [
-                {{"name": "Reserva para imprevistos", "amount": 0.00}}
-            ]
-        }}
-    ],
-    "insights": [
-        "Insight 1 sobre a alocação",
-        "Insight 2 sobre metas ou dívidas",
-        "Insight 3 sobre economia"
-    ]
-}}
+{{"insights": ["Insight 1", "Insight 2", "Insight 3"]}}
 """
-    
     ai_result = ask_ai_analysis(prompt, session)
-    
-    # Fallback se IA falhar
-    if not ai_result or "categories" not in ai_result:
-        # Distribuição padrão: 50% essenciais, 20% metas, 25% orçamentos, 5% margem
-        essentials_amt = amount * 0.50
-        goals_amt = amount * 0.20
-        budgets_amt = amount * 0.25
-        safety_amt = amount * 0.05
-        
-        # Distribuir entre dívidas proporcionalmente
-        essential_items = []
-        if sorted_debts:
-            debt_total = sum(d.monthly for d in sorted_debts[:4])
-            for d in sorted_debts[:4]:
-                item_amount = (d.monthly / debt_total * essentials_amt) if debt_total > 0 else essentials_amt / len(sorted_debts[:4])
-                essential_items.append({
-                    "name": d.name,
-                    "amount": round(item_amount, 2),
-                    "reference_type": "debt",
-                    "reference_id": d.id
-                })
-        else:
-            essential_items.append({"name": "Custos fixos gerais", "amount": round(essentials_amt, 2)})
-        
-        # Distribuir entre metas
-        goal_items = []
-        if sorted_goals:
-            for g in sorted_goals[:2]:
-                goal_items.append({
-                    "name": g.name,
-                    "amount": round(goals_amt / len(sorted_goals[:2]), 2),
-                    "reference_type": "goal",
-                    "reference_id": g.id
-                })
-        else:
-            goal_items.append({"name": "Reserva de emergência", "amount": round(goals_amt, 2)})
-        
-        # Distribuir entre orçamentos
-        budget_items = []
-        if budgets:
-            for b in budgets[:4]:
-                budget_items.append({
-                    "name": b.category,
-                    "amount": round(budgets_amt / len(budgets[:4]), 2),
-                    "reference_type": "budget",
-                    "reference_id": b.id
-                })
-        else:
-            budget_items.append({"name": "Gastos variáveis", "amount": round(budgets_amt, 2)})
-        
-        ai_result = {
-            "categories": [
-                {"id": "essentials", "name": "Essenciais", "color": "#ef4444", "items": essential_items},
-                {"id": "goals", "name": "Metas", "color": "#3b82f6", "items": goal_items},
-                {"id": "budgets", "name": "Orçamentos", "color": "#a855f7", "items": budget_items},
-                {"id": "safety_margin", "name": "Margem de Segurança", "color": "#eab308", "items": [
-                    {"name": "Reserva para imprevistos", "amount": round(safety_amt, 2)}
-                ]}
-            ],
-            "insights": [
-                "Distribuição baseada no método 50/30/20 adaptado",
-                f"Você tem {len(debts)} dívidas cadastradas no sistema",
-                f"{'Configure a IA para sugestões personalizadas' if not debts else 'Alocação calculada automaticamente'}"
-            ]
-        }
+    insights = ai_result.get("insights") if isinstance(ai_result, dict) else None
+    ai_result = {
+        "categories": plan["categories"],
+        "insights": insights if isinstance(insights, list) and insights else allocation_insights(plan, amount),
+    }
     
     # Calcular percentuais e totais
     for cat in ai_result["categories"]:
@@ -2883,110 +5058,203 @@ Retorne APENAS JSON nesta estrutura:
     }
 
 
+def _allocation_apply_result(session: Session, allocation_id: int) -> dict:
+    """Resumo de uma alocação já aplicada (resposta repetida para a mesma chave)."""
+    created = session.exec(
+        select(func.count(AllocationItem.id))
+        .where(AllocationItem.allocation_id == allocation_id, AllocationItem.category != "safety_margin")
+    ).one()
+    goal_names = session.exec(
+        select(Goal.name)
+        .join(AllocationItem, AllocationItem.reference_id == Goal.id)
+        .where(AllocationItem.allocation_id == allocation_id, AllocationItem.reference_type == "goal")
+        .order_by(AllocationItem.id)
+    ).all()
+    return {
+        "success": True,
+        "message": "Alocação aplicada com sucesso!",
+        "transactions_created": created,
+        "goals_updated": list(goal_names)
+    }
+
+
 @app.post("/api/allocation/apply")
-def apply_allocation(data: dict, session: Session = Depends(get_session)):
+def apply_allocation(data: dict, request: Request, session: Session = Depends(get_session)):
     """
     Aplica a alocação aprovada.
     Cria transações automáticas e atualiza metas/dívidas.
+
+    Seguro contra cliques duplicados: a alocação é travada (FOR UPDATE no
+    PostgreSQL) e o status muda por compare-and-set, então só uma requisição
+    aplica. Repetir com a mesma chave (`idempotency_key` no corpo ou header
+    Idempotency-Key) devolve o resultado original em vez de erro.
     """
     allocation_id = data.get("allocation_id")
+    apply_key = data.get("idempotency_key") or request.headers.get("Idempotency-Key")
     
-    allocation = session.get(PaycheckAllocation, allocation_id)
+    allocation = session.exec(
+        select(PaycheckAllocation).where(PaycheckAllocation.id == allocation_id).with_for_update()
+    ).first()
     if not allocation:
         raise HTTPException(status_code=404, detail="Alocação não encontrada")
     
-    if allocation.status == "applied":
+    # Compare-and-set: no SQLite a escrita serializa aqui; quem chegar depois vê 0 linhas
+    claimed = session.connection().execute(
+        update(PaycheckAllocation.__table__)
+        .where(PaycheckAllocation.__table__.c.id == allocation_id,
+               PaycheckAllocation.__table__.c.status != "applied")
+        .values(status="applied", apply_key=apply_key)
+    ).rowcount
+    if not claimed:
+        session.rollback()
+        session.refresh(allocation)
+        if apply_key and allocation.apply_key == apply_key:
+            return _allocation_apply_result(session, allocation_id)
         raise HTTPException(status_code=400, detail="Alocação já foi aplicada")
-    
+    record_changes(session, PaycheckAllocation, [allocation_id])
+
     # Buscar itens da alocação
     items = session.exec(
-        select(AllocationItem).where(AllocationItem.allocation_id == allocation_id)
+        select(AllocationItem).where(AllocationItem.allocation_id == allocation_id).order_by(AllocationItem.id)
     ).all()
     
     # Buscar conta padrão (primeira conta disponível)
-    default_account = session.exec(select(Account)).first()
-    account_id = default_account.id if default_account else None
+    account_id = session.exec(select(Account.id)).first()
     
-    created_transactions = []
-    updated_goals = []
+    # Criar transações de despesa/alocação num único INSERT
+    # (margem de segurança fica na conta)
+    rows = [
+        {
+            "accountId": account_id,
+            "description": f"Alocação quinzenal: {item.name}",
+            "amount": item.amount,
+            "type": "expense",
+            "date": allocation.paycheck_date,
+            "category": item.name,
+            "status": "completed",
+        }
+        for item in items if item.category != "safety_margin"
+    ]
+    new_transactions = list(session.scalars(insert(Transaction).returning(Transaction), rows)) if rows else []
+    record_changes(session, Transaction, [t.id for t in new_transactions])
+    for transaction in new_transactions:
+        track_transaction_alerts(session, None, transaction_fields(transaction))
     
+    # Atualizar metas com um único UPDATE (valores somados por meta)
+    goal_amounts = {}
     for item in items:
-        # Criar transação de despesa/alocação
-        if item.category != "safety_margin":  # Margem de segurança fica na conta
-            transaction = Transaction(
-                accountId=account_id,
-                description=f"Alocação quinzenal: {item.name}",
-                amount=item.amount,
-                type="expense",
-                date=allocation.paycheck_date,
-                category=item.name,
-                status="completed"
-            )
-            session.add(transaction)
-            created_transactions.append(item.name)
-        
-        # Atualizar meta se for do tipo goal
         if item.reference_type == "goal" and item.reference_id:
-            goal = session.get(Goal, item.reference_id)
-            if goal:
-                goal.currentAmount += item.amount
-                session.add(goal)
-                updated_goals.append(goal.name)
-    
-    # Atualizar status da alocação
-    allocation.status = "applied"
-    session.add(allocation)
+            goal_amounts[item.reference_id] = goal_amounts.get(item.reference_id, 0) + item.amount
+    updated_goals = []
+    if goal_amounts:
+        goal_table = Goal.__table__
+        updated = session.connection().execute(
+            update(goal_table)
+            .where(goal_table.c.id.in_(goal_amounts))
+            .values(currentAmount=goal_table.c.currentAmount + case(goal_amounts, value=goal_table.c.id))
+            .returning(goal_table.c.id, goal_table.c.name)
+        ).all()
+        record_changes(session, Goal, [goal_id for goal_id, _ in updated])
+        names = dict(updated)
+        updated_goals = [names[item.reference_id] for item in items
+                         if item.reference_type == "goal" and item.reference_id in names]
+    
     session.commit()
+    for transaction in new_transactions:
+        transaction_store.upsert(transaction)
+        evaluate_alert_rules(session, None, transaction_fields(transaction))
+        event_bus.publish("transaction", {"action": "created", "transaction": transaction.model_dump()})
+    publish_budget_spent(session, {t.category for t in new_transactions})
     
     return {
         "success": True,
         "message": "Alocação aplicada com sucesso!",
-        "transactions_created": len(created_transactions),
+        "transactions_created": len(new_transactions),
         "goals_updated": updated_goals
     }
 
 
 @app.get("/api/allocation/history")
-def get_allocation_history(session: Session = Depends(get_session)):
+def get_allocation_history(
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = None,
+    summary: bool = False,
+    session: Session = Depends(get_session),
+):
     """
-    Retorna histórico de alocações anteriores.
+    Retorna histórico de alocações anteriores, da mais recente para a mais antiga.
+    Paginação por cursor: passe `before_id` = `next_before_id` da página anterior.
+    Com `summary=true`, cada categoria traz só o total e a contagem (GROUP BY),
+    sem os itens.
     """
-    allocations = session.exec(
-        select(PaycheckAllocation).order_by(PaycheckAllocation.id.desc())
-    ).all()
-    
-    result = []
-    for alloc in allocations:
-        items = session.exec(
-            select(AllocationItem).where(AllocationItem.allocation_id == alloc.id)
+    page = select(PaycheckAllocation.id).order_by(PaycheckAllocation.id.desc()).limit(limit + 1)
+    if before_id is not None:
+        page = page.where(PaycheckAllocation.id < before_id)
+    page_ids = select(page.subquery().c.id)
+
+    if summary:
+        allocations = session.exec(
+            select(PaycheckAllocation)
+            .where(PaycheckAllocation.id.in_(page_ids))
+            .order_by(PaycheckAllocation.id.desc())
         ).all()
-        
+        totals = session.exec(
+            select(AllocationItem.allocation_id, AllocationItem.category,
+                   func.sum(AllocationItem.amount), func.count(AllocationItem.id))
+            .where(AllocationItem.allocation_id.in_(page_ids))
+            .group_by(AllocationItem.allocation_id, AllocationItem.category)
+            .order_by(AllocationItem.allocation_id, func.min(AllocationItem.id))
+        ).all()
+        rows = [(alloc, None) for alloc in allocations]
+    else:
+        # Uma consulta: cabeçalhos da página + itens (LEFT JOIN), agrupados numa passada
+        rows = session.exec(
+            select(PaycheckAllocation, AllocationItem)
+            .join(AllocationItem, AllocationItem.allocation_id == PaycheckAllocation.id, isouter=True)
+            .where(PaycheckAllocation.id.in_(page_ids))
+            .order_by(PaycheckAllocation.id.desc(), AllocationItem.id)
+        ).all()
+        totals = []
+
+    result = []
+    by_id = {}
+    for alloc, item in rows:
+        entry = by_id.get(alloc.id)
+        if entry is None:
+            entry = by_id[alloc.id] = {
+                "id": alloc.id,
+                "paycheck_date": alloc.paycheck_date,
+                "paycheck_amount": alloc.paycheck_amount,
+                "status": alloc.status,
+                "created_at": alloc.created_at,
+                "categories": {},
+            }
+            result.append(entry)
+        if item is None:
+            continue
         # Agrupar itens por categoria
-        categories = {}
-        for item in items:
-            if item.category not in categories:
-                categories[item.category] = {
-                    "id": item.category,
-                    "items": [],
-                    "total": 0
-                }
-            categories[item.category]["items"].append({
-                "name": item.name,
-                "amount": item.amount,
-                "percentage": item.percentage
-            })
-            categories[item.category]["total"] += item.amount
-        
-        result.append({
-            "id": alloc.id,
-            "paycheck_date": alloc.paycheck_date,
-            "paycheck_amount": alloc.paycheck_amount,
-            "status": alloc.status,
-            "created_at": alloc.created_at,
-            "categories": list(categories.values())
+        categories = entry["categories"]
+        if item.category not in categories:
+            categories[item.category] = {"id": item.category, "items": [], "total": 0}
+        categories[item.category]["items"].append({
+            "name": item.name,
+            "amount": item.amount,
+            "percentage": item.percentage
         })
-    
-    return result
+        categories[item.category]["total"] += item.amount
+
+    for allocation_id, category, total, count in totals:
+        by_id[allocation_id]["categories"][category] = {"id": category, "total": total, "count": count}
+
+    has_more = len(result) > limit
+    result = result[:limit]
+    for entry in result:
+        entry["categories"] = list(entry["categories"].values())
+
+    return {
+        "allocations": result,
+        "next_before_id": result[-1]["id"] if has_more else None,
+    }
 
 
 # ==========================================
@@ -3195,28 +5463,17 @@ def get_calendar_events(
             "sourceId": tx.id
         })
     
-    # Dívidas (gerar evento no dia do vencimento)
+    # Dívidas (um evento por ocorrência da recorrência no mês)
     debts = session.exec(select(Debt)).all()
+    month_end = (date.fromisoformat(next_month_start) - timedelta(days=1)).isoformat()
     
-    for debt in debts:
-        # Extrair dia do vencimento
-        try:
-            due_day = int(debt.dueDate.split('-')[2]) if '-' in debt.dueDate else int(debt.dueDate)
-        except:
-            due_day = 1
-        
-        # Verificar se o dia existe no mês
-        try:
-            event_date = date(year, month, due_day)
-        except ValueError:
-            # Se o dia não existe (ex: 31 em mês de 30 dias), usar último dia
-            from calendar import monthrange
-            last_day = monthrange(year, month)[1]
-            event_date = date(year, month, last_day)
-        
+    for debt, occ_date, number, recurring in debt_recurrence.expand(debts, month_start, month_end):
+        event_date = date.fromisoformat(occ_date)
         diff_days = (event_date - today).days
         
-        if diff_days < 0:
+        if number is not None and number < (debt.currentInstallment or 1):
+            status = "paid"  # Parcela anterior à atual
+        elif diff_days < 0:
             status = "overdue" if debt.status == 'Atrasado' else "paid"
         elif diff_days <= 3:
             status = "pending"
@@ -3233,7 +5490,8 @@ def get_calendar_events(
             "category": debt.category,
             "sourceType": "debt",
             "sourceId": debt.id,
-            "isRecurring": debt.debtType == 'fixo',
+            "isRecurring": recurring,
+            "installment": number,
             "daysUntilDue": diff_days
         })
     
@@ -3281,10 +5539,21 @@ class Investment(SQLModel, table=True):
     current_value: float
     profit_loss: float
     profit_loss_percent: float
+    purchase_date: Optional[str] = None  # Entrada na carteira (vazio = created_at)
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
     updated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
 
 
+class InvestmentPrice(SQLModel, table=True):
+    """Cotação diária de um ticker (arquivos CSV/JSON ou lançamento manual)"""
+    __table_args__ = (UniqueConstraint("ticker", "date"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ticker: str  # Sempre em maiúsculas
+    date: str  # YYYY-MM-DD
+    price: float
+    source: str = "manual"  # manual, file
+
+
 class InvestmentCreate(BaseModel):
     name: str
     ticker: str
@@ -3292,6 +5561,13 @@ class InvestmentCreate(BaseModel):
     average_price: float
     current_price: float
     quantity: float
+    purchase_date: Optional[str] = None
+
+
+class InvestmentPriceCreate(BaseModel):
+    ticker: str
+    date: str
+    price: float
 
 
 class InvestmentAISuggestionRequest(BaseModel):
@@ -3299,6 +5575,201 @@ class InvestmentAISuggestionRequest(BaseModel):
     current_investments: list = []
 
 
+# --- Cotações ---
+# As posições não guardam histórico: a série de preços fica em InvestmentPrice
+# (ticker, data). current_price e os campos derivados de cada posição são
+# recalculados em SQL a partir da cotação mais recente do ticker.
+
+PRICE_IMPORT_CHUNK_ROWS = 1000
+PRICE_FILE_COLUMNS = {
+    "ticker": ("ticker", "symbol", "ativo", "codigo"),
+    "date": ("date", "data"),
+    "price": ("price", "close", "preco", "preço", "fechamento"),
+}
+
+
+class PriceImportError(ValueError):
+    """Arquivo de cotações malformado (vira HTTP 400)."""
+
+
+def price_row(ticker: str, date: str, price, source: str = "manual") -> dict:
+    """Linha validada de InvestmentPrice (ticker em maiúsculas, data YYYY-MM-DD)."""
+    ticker = (ticker or "").strip().upper()
+    day = parse_day_number(str(date or ""))
+    if not ticker or day == INVALID_DAY:
+        raise PriceImportError(f"Cotação inválida: ticker '{ticker}', data '{date}'")
+    if isinstance(price, str) and "," in price:
+        # Formato brasileiro (1.234,56) ou separador de milhar americano (1,234.56)
+        price = price.replace(".", "").replace(",", ".") if price.rfind(",") > price.rfind(".") else price.replace(",", "")
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        raise PriceImportError(f"Preço inválido para {ticker} em {date}: '{price}'")
+    if not np.isfinite(price) or price < 0:
+        raise PriceImportError(f"Preço inválido para {ticker} em {date}: '{price}'")
+    return {"ticker": ticker, "date": str(np.datetime64(day, "D")), "price": price, "source": source}
+
+
+def parse_price_file(content: bytes, ticker: Optional[str] = None) -> List[dict]:
+    """
+    Lê cotações de um arquivo local:
+    - JSON: lista de {"ticker", "date", "price"} ou {"TICKER": {"YYYY-MM-DD": preço}};
+    - CSV (`,`, `;` ou tab) com cabeçalho: ticker/symbol, date/data, price/close/preco.
+      Sem coluna de ticker (ex.: histórico exportado de uma corretora), use `ticker`.
+    Repetições de (ticker, data) ficam com a última.
+    """
+    text_content = content.decode("utf-8-sig").strip()
+    if not text_content:
+        raise PriceImportError("Arquivo de cotações vazio")
+    rows = {}
+    if text_content[0] in "[{":
+        try:
+            data = json.loads(text_content)
+        except json.JSONDecodeError:
+            raise PriceImportError("Arquivo de cotações inválido: JSON malformado")
+        if isinstance(data, dict):
+            entries = [
+                {"ticker": symbol, "date": date, "price": price}
+                for symbol, series in data.items() if isinstance(series, dict)
+                for date, price in series.items()
+            ]
+        else:
+            entries = data
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise PriceImportError("Arquivo de cotações inválido: esperado objetos com ticker, date e price")
+            row = price_row(entry.get("ticker") or ticker, entry.get("date"), entry.get("price"), "file")
+            rows[(row["ticker"], row["date"])] = row
+        return list(rows.values())
+
+    delimiter = max(",;\t", key=text_content.splitlines()[0].count)
+    reader = csv.reader(io.StringIO(text_content), delimiter=delimiter)
+    header = [name.strip().lower() for name in next(reader)]
+    positions = {}
+    for key, names in PRICE_FILE_COLUMNS.items():
+        found = [header.index(name) for name in names if name in header]
+        if found:
+            positions[key] = found[0]
+    if "date" not in positions or "price" not in positions or ("ticker" not in positions and not ticker):
+        raise PriceImportError("CSV de cotações precisa das colunas date e price (e ticker, ou o parâmetro ticker)")
+    for line_number, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        try:
+            symbol = values[positions["ticker"]] if "ticker" in positions else ticker
+            row = price_row(symbol, values[positions["date"]], values[positions["price"]], "file")
+        except IndexError:
+            raise PriceImportError(f"Linha {line_number} do CSV de cotações está incompleta")
+        rows[(row["ticker"], row["date"])] = row
+    return list(rows.values())
+
+
+def upsert_investment_prices(session: Session, rows: List[dict]) -> int:
+    """Grava as cotações em lotes (INSERT ... ON CONFLICT (ticker, date) DO UPDATE)."""
+    table = InvestmentPrice.__table__
+    conn = session.connection()
+    dialect_insert = upsert_insert(conn)
+    ids = []
+    for start in range(0, len(rows), PRICE_IMPORT_CHUNK_ROWS):
+        statement = dialect_insert(table).values(rows[start:start + PRICE_IMPORT_CHUNK_ROWS])
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.ticker, table.c.date],
+            set_={"price": statement.excluded.price, "source": statement.excluded.source},
+        ).returning(table.c.id)
+        ids += conn.execute(statement).scalars().all()
+    record_changes(session, InvestmentPrice, ids)
+    return len(ids)
+
+
+def refresh_investment_values(session: Session, tickers: Optional[List[str]] = None) -> int:
+    """
+    Atualiza current_price das posições com a cotação mais recente do ticker e
+    recalcula os campos derivados, tudo em dois UPDATEs. Retorna quantas mudaram.
+    """
+    investments = Investment.__table__
+    prices = InvestmentPrice.__table__
+    ticker = func.upper(investments.c.ticker)
+    latest = (
+        select(prices.c.price).where(prices.c.ticker == ticker)
+        .order_by(prices.c.date.desc()).limit(1).scalar_subquery()
+    )
+    conn = session.connection()
+    statement = update(investments).where(select(prices.c.id).where(prices.c.ticker == ticker).exists())
+    if tickers is not None:
+        statement = statement.where(ticker.in_([t.strip().upper() for t in tickers]))
+    ids = conn.execute(
+        statement.values(current_price=latest, updated_at=datetime.now().isoformat()).returning(investments.c.id)
+    ).scalars().all()
+    if not ids:
+        return 0
+    invested = investments.c.average_price * investments.c.quantity
+    value = investments.c.current_price * investments.c.quantity
+    conn.execute(
+        update(investments).where(investments.c.id.in_(ids)).values(
+            total_invested=invested,
+            current_value=value,
+            profit_loss=value - invested,
+            profit_loss_percent=case((invested > 0, (value - invested) / invested * 100), else_=0),
+        )
+    )
+    record_changes(session, Investment, ids)
+    return len(ids)
+
+
+def store_investment_prices(rows: List[dict]) -> dict:
+    """Grava cotações, atualiza as posições dos tickers e a fotografia de patrimônio."""
+    with Session(engine) as session:
+        stored = upsert_investment_prices(session, rows)
+        tickers = sorted({row["ticker"] for row in rows})
+        updated = refresh_investment_values(session, tickers)
+        session.commit()
+        if updated:
+            record_net_worth_snapshot(session)
+    return {"imported": stored, "tickers": tickers, "investments_updated": updated}
+
+
+@app.get("/api/investments/prices")
+def get_investment_prices(
+    ticker: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """Série de cotações de um ticker (opcionalmente num intervalo de datas)"""
+    query = select(InvestmentPrice).where(InvestmentPrice.ticker == ticker.strip().upper())
+    if start:
+        query = query.where(InvestmentPrice.date >= start)
+    if end:
+        query = query.where(InvestmentPrice.date <= end)
+    return session.exec(query.order_by(InvestmentPrice.date)).all()
+
+
+@app.post("/api/investments/prices")
+def create_investment_price(price: InvestmentPriceCreate):
+    """Lança (ou corrige) manualmente a cotação de um ticker numa data"""
+    try:
+        row = price_row(price.ticker, price.date, price.price)
+    except PriceImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return store_investment_prices([row])
+
+
+@app.post("/api/investments/prices/import")
+async def import_investment_prices(request: Request, ticker: Optional[str] = None):
+    """
+    Importa um arquivo de cotações (CSV ou JSON) enviado como corpo da requisição.
+    Ver parse_price_file para os formatos aceitos.
+    """
+    content = await request.body()
+    try:
+        rows = parse_price_file(content, ticker)
+    except (PriceImportError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="Nenhuma cotação encontrada no arquivo")
+    return await run_in_threadpool(store_investment_prices, rows)
+
+
 @app.get("/api/investments")
 def get_investments(session: Session = Depends(get_session)):
     """Lista todos os investimentos"""
@@ -3308,12 +5779,7 @@ def get_investments(session: Session = Depends(get_session)):
 
 @app.post("/api/investments")
 def create_investment(inv: InvestmentCreate, session: Session = Depends(get_session)):
-    """Cria um novo investimento"""
-    total_invested = inv.average_price * inv.quantity
-    current_value = inv.current_price * inv.quantity
-    profit_loss = current_value - total_invested
-    profit_loss_percent = (profit_loss / total_invested * 100) if total_invested > 0 else 0
-    
+    """Cria um novo investimento (o preço atual vira a cotação de hoje do ticker)"""
     investment = Investment(
         name=inv.name,
         ticker=inv.ticker,
@@ -3321,14 +5787,19 @@ def create_investment(inv: InvestmentCreate, session: Session = Depends(get_sess
         average_price=inv.average_price,
         current_price=inv.current_price,
         quantity=inv.quantity,
-        total_invested=total_invested,
-        current_value=current_value,
-        profit_loss=profit_loss,
-        profit_loss_percent=profit_loss_percent,
+        purchase_date=inv.purchase_date,
+        total_invested=0,
+        current_value=0,
+        profit_loss=0,
+        profit_loss_percent=0,
     )
     
     session.add(investment)
+    session.flush()
+    upsert_investment_prices(session, [price_row(inv.ticker, datetime.now().strftime("%Y-%m-%d"), inv.current_price)])
+    refresh_investment_values(session, [inv.ticker])
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(investment)
     
     return investment
@@ -3347,14 +5818,15 @@ def update_investment(investment_id: int, inv: InvestmentCreate, session: Sessio
     investment.average_price = inv.average_price
     investment.current_price = inv.current_price
     investment.quantity = inv.quantity
-    investment.total_invested = inv.average_price * inv.quantity
-    investment.current_value = inv.current_price * inv.quantity
-    investment.profit_loss = investment.current_value - investment.total_invested
-    investment.profit_loss_percent = (investment.profit_loss / investment.total_invested * 100) if investment.total_invested > 0 else 0
+    investment.purchase_date = inv.purchase_date
     investment.updated_at = datetime.now().isoformat()
     
     session.add(investment)
+    session.flush()
+    upsert_investment_prices(session, [price_row(inv.ticker, datetime.now().strftime("%Y-%m-%d"), inv.current_price)])
+    refresh_investment_values(session, [inv.ticker])
     session.commit()
+    record_net_worth_snapshot(session)
     session.refresh(investment)
     
     return investment
@@ -3369,6 +5841,7 @@ def delete_investment(investment_id: int, session: Session = Depends(get_session
     
     session.delete(investment)
     session.commit()
+    record_net_worth_snapshot(session)
     
     return {"success": True, "message": "Investimento removido com sucesso"}
 
@@ -3551,10 +6024,110 @@ Forneça 3-5 sugestões acionáveis.
     return {"suggestions": suggestions[:5]}
 
 
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Propaga o último valor conhecido (não NaN) de cada coluna para baixo."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def portfolio_history(session: Session, investments: List[Investment], start_day: int, end_day: int) -> dict:
+    """
+    Valoriza a carteira em cada data com cotação no intervalo, sobre uma matriz
+    (datas x tickers) alinhada com forward-fill: sem cotação no dia vale a última
+    conhecida; antes da primeira, o preço médio da posição.
+
+    Cada posição entra na carteira em purchase_date (ou created_at); a entrada é
+    tratada como aporte, então a rentabilidade ponderada no tempo (TWR) encadeia
+    só a variação de preço: r_t = (V_t - aportes_t) / V_{t-1}.
+    """
+    tickers = sorted({i.ticker.strip().upper() for i in investments})
+    rows = session.exec(
+        select(InvestmentPrice.ticker, InvestmentPrice.date, InvestmentPrice.price)
+        .where(InvestmentPrice.ticker.in_(tickers), InvestmentPrice.date <= str(np.datetime64(end_day, "D")))
+        .order_by(InvestmentPrice.date)
+    ).all()
+    if not rows:
+        return {"history": [], "time_weighted_return": None, "positions": []}
+
+    price_tickers, dates, values = zip(*rows)
+    days, day_index = np.unique(day_numbers(dates), return_inverse=True)
+    columns = {t: k for k, t in enumerate(tickers)}
+    prices = np.full((len(days), len(tickers)), np.nan)
+    prices[day_index, [columns[t] for t in price_tickers]] = values
+    prices = forward_fill(prices)
+    # Só as datas do intervalo; se start cai entre cotações, uma linha âncora em
+    # start guarda os preços vigentes para a variação até a primeira cotação contar
+    first = np.searchsorted(days, start_day)
+    if 0 < first and (first == len(days) or days[first] != start_day):
+        days = np.concatenate(([start_day], days[first:]))
+        prices = np.vstack((prices[first - 1], prices[first:]))
+    else:
+        days, prices = days[first:], prices[first:]
+    if not len(days):
+        return {"history": [], "time_weighted_return": None, "positions": []}
+
+    quantity = np.array([i.quantity or 0 for i in investments], dtype=np.float64)
+    average = np.array([i.average_price or 0 for i in investments], dtype=np.float64)
+    entry = day_numbers([i.purchase_date or i.created_at or "" for i in investments])
+    position_prices = prices[:, [columns[i.ticker.strip().upper()] for i in investments]]
+    position_prices = np.where(np.isnan(position_prices), average, position_prices)
+
+    held = days[:, None] >= entry[None, :]
+    position_values = held * quantity * position_prices
+    value = position_values.sum(axis=1)
+    invested = (held * quantity * average).sum(axis=1)
+    entered = held.copy()
+    entered[0] = False  # O que já estava na carteira no início é o valor inicial, não aporte
+    entered[1:] &= ~held[:-1]
+    inflow = (entered * quantity * position_prices).sum(axis=1)
+    growth = np.divide(value[1:] - inflow[1:], value[:-1], out=np.ones(len(days) - 1), where=value[:-1] > 0)
+    cumulative = np.concatenate(([1.0], np.cumprod(growth)))
+
+    # Resultado de cada posição: no período (desde o início ou a entrada) e sobre o preço médio
+    first_held = np.argmax(held, axis=0)
+    period_start = position_prices[first_held, np.arange(len(investments))]
+    last = position_prices[-1]
+    held_now = held[-1]
+    labels = np.array(days, dtype="datetime64[D]").astype(str)
+    return {
+        "history": [
+            {"date": labels[t], "value": round(float(value[t]), 2), "invested": round(float(invested[t]), 2),
+             "return_percent": round(float((cumulative[t] - 1) * 100), 2)}
+            for t in range(len(days))
+        ],
+        "time_weighted_return": round(float((cumulative[-1] - 1) * 100), 2),
+        "positions": [
+            {
+                "id": inv.id,
+                "ticker": inv.ticker,
+                "price": round(float(last[j]), 2),
+                "value": round(float(position_values[-1, j]), 2),
+                "profit_loss": round(float(held_now[j] * quantity[j] * (last[j] - average[j])), 2),
+                "period_profit": round(float(held_now[j] * quantity[j] * (last[j] - period_start[j])), 2),
+            }
+            for j, inv in enumerate(investments)
+        ],
+    }
+
+
 @app.get("/api/investments/summary")
-def get_investments_summary(session: Session = Depends(get_session)):
-    """Retorna resumo da carteira de investimentos"""
-    investments = session.exec(select(Investment)).all()
+def get_investments_summary(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """
+    Retorna resumo da carteira de investimentos e, a partir das cotações, o
+    histórico de valor, a rentabilidade ponderada no tempo e o resultado por
+    posição no intervalo [start, end] (padrão: todo o histórico até hoje).
+    """
+    start_day = parse_day_number(start) if start else INVALID_DAY + 1
+    end_day = parse_day_number(end) if end else day_number(datetime.now().strftime("%Y-%m-%d"))
+    if start_day == INVALID_DAY or end_day == INVALID_DAY:
+        raise HTTPException(status_code=400, detail="Data inválida (use YYYY-MM-DD)")
+
+    investments = session.exec(select(Investment).order_by(Investment.id)).all()
     
     if not investments:
         return {
@@ -3565,25 +6138,30 @@ def get_investments_summary(session: Session = Depends(get_session)):
             "best_performer": None,
             "worst_performer": None,
             "allocation": [],
+            "history": [],
+            "time_weighted_return": None,
+            "positions": [],
         }
     
-    total_invested = sum(i.total_invested for i in investments)
-    current_value = sum(i.current_value for i in investments)
+    invested = np.array([i.total_invested for i in investments], dtype=np.float64)
+    values = np.array([i.current_value for i in investments], dtype=np.float64)
+    percents = np.array([i.profit_loss_percent for i in investments], dtype=np.float64)
+    total_invested = float(invested.sum())
+    current_value = float(values.sum())
     total_profit = current_value - total_invested
     total_profit_percent = (total_profit / total_invested * 100) if total_invested > 0 else 0
     
-    sorted_inv = sorted(investments, key=lambda x: x.profit_loss_percent, reverse=True)
-    best = sorted_inv[0]
-    worst = sorted_inv[-1]
-    
-    # Alocação por categoria
-    categories = {}
-    for inv in investments:
-        categories[inv.category] = categories.get(inv.category, 0) + inv.current_value
+    # Empate: o primeiro cadastrado (como na ordenação estável anterior)
+    best = investments[int(np.argmax(percents))]
+    worst = investments[len(percents) - 1 - int(np.argmin(percents[::-1]))]
     
+    # Alocação por categoria (na ordem em que cada categoria aparece)
+    categories, first_seen, codes = np.unique([i.category for i in investments], return_index=True, return_inverse=True)
+    category_values = np.bincount(codes, weights=values, minlength=len(categories))
     allocation = [
-        {"category": cat, "value": val, "percent": (val / current_value * 100) if current_value > 0 else 0}
-        for cat, val in categories.items()
+        {"category": str(categories[c]), "value": float(category_values[c]),
+         "percent": float(category_values[c] / current_value * 100) if current_value > 0 else 0}
+        for c in np.argsort(first_seen)
     ]
     
     return {
@@ -3594,6 +6172,7 @@ def get_investments_summary(session: Session = Depends(get_session)):
         "best_performer": {"name": best.ticker, "percent": best.profit_loss_percent},
         "worst_performer": {"name": worst.ticker, "percent": worst.profit_loss_percent} if worst.profit_loss_percent < 0 else None,
         "allocation": allocation,
+        **portfolio_history(session, investments, start_day, end_day),
     }
 
 
@@ -3689,12 +6268,14 @@ class LifeProject(SQLModel, table=True):
     status: str = "ativo"  # ativo, pausado, concluido
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
     priority: str = "media"  # alta, media, baixa
+    tasks: List["ProjectTask"] = Relationship(cascade_delete=True, passive_deletes=True)
 
 
 class ProjectTask(SQLModel, table=True):
     """Tarefa/Etapa de um projeto"""
+    __table_args__ = (Index("ix_projecttask_project_status_priority", "project_id", "status", "priority"),)
     id: Optional[int] = Field(default=None, primary_key=True)
-    project_id: int = Field(foreign_key="lifeproject.id")
+    project_id: int = Field(foreign_key="lifeproject.id", ondelete="CASCADE")
     name: str
     estimated_cost: float
     actual_cost: Optional[float] = None
@@ -3724,29 +6305,65 @@ class ProjectTaskCreate(BaseModel):
 
 # --- CRUD Projetos ---
 
+def project_task_totals():
+    """
+    Subconsulta com os agregados das tarefas por projeto (GROUP BY project_id):
+    custo estimado, custo real das concluídas, total de tarefas e concluídas.
+    """
+    done = ProjectTask.status == "concluido"
+    return (
+        select(
+            ProjectTask.project_id,
+            func.sum(ProjectTask.estimated_cost).label("total_estimated"),
+            func.sum(case((done, func.coalesce(ProjectTask.actual_cost, 0)), else_=0)).label("total_spent"),
+            func.count(ProjectTask.id).label("tasks_count"),
+            func.sum(case((done, 1), else_=0)).label("completed_count"),
+        )
+        .group_by(ProjectTask.project_id)
+        .subquery()
+    )
+
+
 @app.get("/api/life-projects")
-def get_life_projects(session: Session = Depends(get_session)):
-    """Lista todos os projetos de vida com suas tarefas"""
-    projects = session.exec(select(LifeProject).where(LifeProject.status != "arquivado")).all()
+def get_life_projects(include_tasks: bool = True, session: Session = Depends(get_session)):
+    """
+    Lista todos os projetos de vida com os totais das tarefas (uma consulta
+    agregada) e, se `include_tasks`, as tarefas (uma consulta para todos).
+    """
+    totals = project_task_totals()
+    rows = session.exec(
+        select(LifeProject, totals.c.total_estimated, totals.c.total_spent,
+               totals.c.tasks_count, totals.c.completed_count)
+        .join(totals, totals.c.project_id == LifeProject.id, isouter=True)
+        .where(LifeProject.status != "arquivado")
+        .order_by(LifeProject.id)
+    ).all()
+    
+    tasks_by_project = {}
+    if include_tasks and rows:
+        tasks = session.exec(
+            select(ProjectTask)
+            .where(ProjectTask.project_id.in_([project.id for project, *_ in rows]))
+            .order_by(ProjectTask.project_id, ProjectTask.id)
+        ).all()
+        for task in tasks:
+            tasks_by_project.setdefault(task.project_id, []).append(task.model_dump())
     
     result = []
-    for project in projects:
-        tasks = session.exec(select(ProjectTask).where(ProjectTask.project_id == project.id)).all()
-        
-        # Calcular totais
-        total_estimated = sum(t.estimated_cost for t in tasks)
-        total_spent = sum(t.actual_cost or 0 for t in tasks if t.status == "concluido")
-        completed_count = len([t for t in tasks if t.status == "concluido"])
-        
-        result.append({
+    for project, total_estimated, total_spent, tasks_count, completed_count in rows:
+        tasks_count = tasks_count or 0
+        completed_count = completed_count or 0
+        entry = {
             **project.model_dump(),
-            "total_estimated": total_estimated,
-            "total_spent": total_spent,
-            "tasks_count": len(tasks),
+            "total_estimated": total_estimated or 0,
+            "total_spent": total_spent or 0,
+            "tasks_count": tasks_count,
             "completed_count": completed_count,
-            "progress": (completed_count / len(tasks) * 100) if tasks else 0,
-            "tasks": [t.model_dump() for t in tasks]
-        })
+            "progress": (completed_count / tasks_count * 100) if tasks_count else 0,
+        }
+        if include_tasks:
+            entry["tasks"] = tasks_by_project.get(project.id, [])
+        result.append(entry)
     
     return result
 
@@ -3779,16 +6396,11 @@ def update_life_project(project_id: int, project: LifeProjectCreate, session: Se
 
 @app.delete("/api/life-projects/{project_id}")
 def delete_life_project(project_id: int, session: Session = Depends(get_session)):
-    """Remove um projeto e suas tarefas"""
+    """Remove um projeto e suas tarefas (ON DELETE CASCADE)"""
     project = session.get(LifeProject, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Projeto não encontrado")
     
-    # Remover tarefas associadas
-    tasks = session.exec(select(ProjectTask).where(ProjectTask.project_id == project_id)).all()
-    for task in tasks:
-        session.delete(task)
-    
     session.delete(project)
     session.commit()
     return {"success": True}
@@ -3923,34 +6535,31 @@ def ai_allocation_suggestion(session: Session = Depends(get_session)):
     Integra com a feature de Alocação Quinzenal.
     """
     
-    # Buscar projetos ativos
-    projects = session.exec(select(LifeProject).where(LifeProject.status == "ativo")).all()
-    
-    # Buscar tarefas pendentes de alta prioridade
-    high_priority_tasks = []
-    for project in projects:
-        tasks = session.exec(
-            select(ProjectTask)
-            .where(ProjectTask.project_id == project.id)
-            .where(ProjectTask.status == "pendente")
-            .where(ProjectTask.priority == "alta")
-        ).all()
-        for task in tasks:
-            high_priority_tasks.append({
-                "project": project.name,
-                "project_category": project.category,
-                "task": task.name,
-                "cost": task.estimated_cost,
-                "icon": project.icon
-            })
+    # Contar projetos ativos
+    projects_count = session.exec(
+        select(func.count(LifeProject.id)).where(LifeProject.status == "ativo")
+    ).one()
+    
+    # Tarefas pendentes de alta prioridade dos projetos ativos, numa consulta
+    # (menor custo primeiro para viabilidade)
+    rows = session.exec(
+        select(LifeProject.name, LifeProject.category, LifeProject.icon,
+               ProjectTask.name, ProjectTask.estimated_cost)
+        .join(LifeProject, LifeProject.id == ProjectTask.project_id)
+        .where(LifeProject.status == "ativo")
+        .where(ProjectTask.status == "pendente")
+        .where(ProjectTask.priority == "alta")
+        .order_by(ProjectTask.estimated_cost, LifeProject.id, ProjectTask.id)
+    ).all()
+    high_priority_tasks = [
+        {"project": project, "project_category": category, "task": task, "cost": cost, "icon": icon}
+        for project, category, icon, task, cost in rows
+    ]
     
     # Buscar dívidas
     debts = session.exec(select(Debt).where(Debt.status != "Quitado")).all()
     monthly_debts = sum(d.monthly for d in debts)
     
-    # Ordenar tarefas por custo (menor primeiro para viabilidade)
-    high_priority_tasks.sort(key=lambda x: x["cost"])
-    
     suggestions = []
     
     # 1. Dívidas primeiro
@@ -3990,9 +6599,9 @@ def ai_allocation_suggestion(session: Session = Depends(get_session)):
     
     return {
         "suggestions": suggestions,
-        "total_projects": len(projects),
+        "total_projects": projects_count,
         "high_priority_tasks": len(high_priority_tasks),
-        "message": f"Você tem {len(high_priority_tasks)} tarefas de alta prioridade em {len(projects)} projetos ativos."
+        "message": f"Você tem {len(high_priority_tasks)} tarefas de alta prioridade em {projects_count} projetos ativos."
     }
 
 
@@ -9,7 +9,7 @@ export const BackupRestore: React.FC = () => {
     const [isImporting, setIsImporting] = useState(false);
     const [message, setMessage] = useState<{ type: 'success' | 'error' | 'info'; text: string } | null>(null);
     const [showConfirmModal, setShowConfirmModal] = useState(false);
-    const [pendingBackupData, setPendingBackupData] = useState<any>(null);
+    const [pendingBackupFile, setPendingBackupFile] = useState<File | null>(null);
     const fileInputRef = useRef<HTMLInputElement>(null);
 
     // Exportar Backup
@@ -18,17 +18,16 @@ export const BackupRestore: React.FC = () => {
         setMessage(null);
 
         try {
-            const backupData = await apiService.exportBackup();
+            const blob = await apiService.exportBackup();
 
-            // Criar e baixar arquivo
-            const blob = new Blob([JSON.stringify(backupData, null, 2)], { type: 'application/json' });
+            // Baixar arquivo
             const url = URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
 
             // Nome do arquivo com data
             const date = new Date().toISOString().split('T')[0];
-            a.download = `axxy-backup-${date}.json`;
+            a.download = `axxy-backup-${date}.ndjson.gz`;
 
             document.body.appendChild(a);
             a.click();
@@ -49,24 +48,13 @@ export const BackupRestore: React.FC = () => {
         const file = event.target.files?.[0];
         if (!file) return;
 
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            try {
-                const data = JSON.parse(e.target?.result as string);
-
-                // Validar estrutura básica
-                if (!data.data || !data.version) {
-                    setMessage({ type: 'error', text: 'Arquivo de backup inválido. Verifique o formato.' });
-                    return;
-                }
-
-                setPendingBackupData(data);
-                setShowConfirmModal(true);
-            } catch (error) {
-                setMessage({ type: 'error', text: 'Erro ao ler arquivo. Certifique-se de que é um JSON válido.' });
-            }
-        };
-        reader.readAsText(file);
+        // O conteúdo é validado pelo backend (formato, integridade e rodapé do NDJSON)
+        if (!/\.(json|ndjson|gz)$/i.test(file.name)) {
+            setMessage({ type: 'error', text: 'Arquivo de backup inválido. Use o .ndjson.gz exportado ou um backup .json.' });
+        } else {
+            setPendingBackupFile(file);
+            setShowConfirmModal(true);
+        }
 
         // Limpar input para permitir selecionar o mesmo arquivo novamente
         if (fileInputRef.current) {
@@ -76,14 +64,14 @@ export const BackupRestore: React.FC = () => {
 
     // Confirmar e executar importação
     const handleConfirmImport = async () => {
-        if (!pendingBackupData) return;
+        if (!pendingBackupFile) return;
 
         setIsImporting(true);
         setShowConfirmModal(false);
         setMessage(null);
 
         try {
-            const result = await apiService.importBackup(pendingBackupData);
+            const result = await apiService.importBackup(pendingBackupFile);
 
             if (result.success) {
                 setMessage({
@@ -103,7 +91,7 @@ export const BackupRestore: React.FC = () => {
             setMessage({ type: 'error', text: 'Erro ao importar backup. Verifique o arquivo e tente novamente.' });
         } finally {
             setIsImporting(false);
-            setPendingBackupData(null);
+            setPendingBackupFile(null);
         }
     };
 
@@ -169,7 +157,7 @@ export const BackupRestore: React.FC = () => {
                 <input
                     ref={fileInputRef}
                     type="file"
-                    accept=".json"
+                    accept=".json,.ndjson,.gz"
                     onChange={handleFileSelect}
                     className="hidden"
                 />
@@ -194,14 +182,13 @@ export const BackupRestore: React.FC = () => {
                             Certifique-se de que deseja continuar.
                         </p>
 
-                        {pendingBackupData && (
+                        {pendingBackupFile && (
                             <div className="bg-axxy-dark/50 rounded-xl p-4 mb-6 text-sm">
                                 <p className="text-gray-400 mb-2">Informações do backup:</p>
                                 <ul className="text-gray-300 space-y-1">
-                                    <li>• Versão: {pendingBackupData.version}</li>
-                                    <li>• Exportado em: {new Date(pendingBackupData.exportedAt).toLocaleString('pt-BR')}</li>
-                                    <li>• Contas: {pendingBackupData.data?.accounts?.length || 0}</li>
-                                    <li>• Transações: {pendingBackupData.data?.transactions?.length || 0}</li>
+                                    <li>• Arquivo: {pendingBackupFile.name}</li>
+                                    <li>• Tamanho: {(pendingBackupFile.size / 1024).toFixed(1)} KB</li>
+                                    <li>• Modificado em: {new Date(pendingBackupFile.lastModified).toLocaleString('pt-BR')}</li>
                                 </ul>
                             </div>
                         )}
@@ -210,7 +197,7 @@ export const BackupRestore: React.FC = () => {
                             <button
                                 onClick={() => {
                                     setShowConfirmModal(false);
-                                    setPendingBackupData(null);
+                                    setPendingBackupFile(null);
                                 }}
                                 className="flex-1 px-4 py-2 bg-axxy-border hover:bg-axxy-border/70 text-white rounded-xl transition-colors"
                             >
@@ -42,21 +42,12 @@ export const Reports: React.FC = () => {
   const fetchReports = async () => {
     setLoading(true);
     try {
-      // Fetch main report data
-      const reportData = await apiService.getReports(dateRange, selectedAccount);
-      setData(reportData);
-
-      // Fetch cash flow data
-      const cashFlow = await apiService.getCashFlow(dateRange, selectedAccount).catch(() => null);
-      if (cashFlow) setCashFlowData(cashFlow);
-
-      // Fetch trend data
-      const trends = await apiService.getSpendingTrends(dateRange, selectedAccount).catch(() => null);
-      if (trends) setTrendData(trends);
-
-      // Fetch income sources
-      const sources = await apiService.getIncomeSources(dateRange, selectedAccount).catch(() => null);
-      if (sources) setIncomeSourceData(sources);
+      // Uma única chamada traz KPIs, fluxo de caixa, tendências e fontes de receita
+      const bundle = await apiService.getReportsBundle(dateRange, selectedAccount);
+      setData({ kpi: bundle.kpi, distribution: bundle.distribution });
+      setCashFlowData(bundle.cashFlow);
+      setTrendData(bundle.spendingTrends);
+      setIncomeSourceData(bundle.incomeSources);
     } catch (err) {
       console.error("Failed to load reports:", err);
     } finally {
@@ -1,17 +1,19 @@
 #!/bin/bash
 # =================================
 # Axxy Finance - Backup Script
-# Backup do banco de dados SQLite
+# Fotografia consistente do banco (SQLite ou PostgreSQL)
 # =================================
+# Usa `backup_cli.py snapshot`: no SQLite, a API de backup online (em lotes,
+# sem copiar um arquivo pela metade enquanto o app escreve); no PostgreSQL,
+# um dump COPY restaurável com `gunzip -c arquivo.sql.gz | psql`.
 
 set -e
 
 # Configuration
 PROJECT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 BACKUP_DIR="$PROJECT_DIR/backups"
-DB_FILE="$PROJECT_DIR/backend/database.db"
+BACKEND_DIR="$PROJECT_DIR/backend"
 DATE=$(date +%Y-%m-%d_%H-%M-%S)
-BACKUP_FILE="$BACKUP_DIR/axxy_backup_$DATE.db"
 KEEP_DAYS=7
 
 # Colors
@@ -26,27 +28,39 @@ echo "================================"
 # Create backup directory
 mkdir -p "$BACKUP_DIR"
 
-# Check if database exists
-if [ ! -f "$DB_FILE" ]; then
-    # Try Docker volume
-    DOCKER_DB=$(docker compose exec -T backend cat /app/database.db 2>/dev/null) || true
-    if [ -n "$DOCKER_DB" ]; then
-        echo "Copiando banco do container Docker..."
-        docker compose cp backend:/app/database.db "$BACKUP_FILE"
+if docker compose ps --status running backend 2>/dev/null | grep -q backend; then
+    # Docker: PostgreSQL, dump gerado dentro do container e enviado pela saída padrão
+    BACKUP_FILE="$BACKUP_DIR/axxy_backup_$DATE.sql.gz"
+    echo "Gerando dump do banco no container Docker..."
+    docker compose exec -T backend python backup_cli.py snapshot -o - > "$BACKUP_FILE"
+else
+    # Local: banco SQLite do backend (caminho padrão do main.py, ou o legado)
+    if [ -z "$DATABASE_FILE" ] && [ -z "$DATABASE_URL" ]; then
+        if [ -f "$BACKEND_DIR/database/database.db" ]; then
+            export DATABASE_FILE="$BACKEND_DIR/database/database.db"
+        elif [ -f "$BACKEND_DIR/database.db" ]; then
+            export DATABASE_FILE="$BACKEND_DIR/database.db"
+        else
+            echo -e "${RED}❌ Banco de dados não encontrado!${NC}"
+            exit 1
+        fi
+    fi
+    PYTHON="${PYTHON:-$BACKEND_DIR/venv/bin/python}"
+    [ -x "$PYTHON" ] || PYTHON=python3
+    if [ -n "$DATABASE_URL" ]; then
+        BACKUP_FILE="$BACKUP_DIR/axxy_backup_$DATE.sql.gz"
     else
-        echo -e "${RED}❌ Banco de dados não encontrado!${NC}"
-        exit 1
+        BACKUP_FILE="$BACKUP_DIR/axxy_backup_$DATE.db.gz"
     fi
-else
-    # Copy local database
-    echo "Copiando banco de dados local..."
-    cp "$DB_FILE" "$BACKUP_FILE"
+    echo "Gerando fotografia do banco local..."
+    (cd "$BACKEND_DIR" && "$PYTHON" backup_cli.py snapshot -o "$BACKUP_FILE")
 fi
 
-# Compress backup
-echo "Comprimindo backup..."
-gzip "$BACKUP_FILE"
-BACKUP_FILE="$BACKUP_FILE.gz"
+if [ ! -s "$BACKUP_FILE" ]; then
+    rm -f "$BACKUP_FILE"
+    echo -e "${RED}❌ Falha ao gerar o backup!${NC}"
+    exit 1
+fi
 
 # Calculate size
 SIZE=$(du -h "$BACKUP_FILE" | cut -f1)
@@ -55,7 +69,7 @@ echo -e "${GREEN}✓ Backup criado: $BACKUP_FILE ($SIZE)${NC}"
 
 # Cleanup old backups
 echo -e "\n${YELLOW}Removendo backups antigos (> $KEEP_DAYS dias)...${NC}"
-find "$BACKUP_DIR" -name "axxy_backup_*.db.gz" -mtime +$KEEP_DAYS -delete 2>/dev/null || true
+find "$BACKUP_DIR" -name "axxy_backup_*.gz" -mtime +$KEEP_DAYS -delete 2>/dev/null || true
 
 # List remaining backups
 echo -e "\nBackups disponíveis:"
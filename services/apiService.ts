@@ -1,4 +1,4 @@
-import { Transaction, Goal, UserProfile, Budget, Account, Category, Debt, Alert, LeakageAnalysis, ReportData, PredictionBaseData, Asset, Liability, NetWorthGoal, LifeProject, ProjectTask, BudgetItem } from '../types';
+import { Transaction, Goal, UserProfile, Budget, Account, Category, Debt, Alert, LeakageAnalysis, ReportData, ReportBundle, PredictionBaseData, DebtSimulation, DebtStrategy, Asset, Liability, NetWorthGoal, LifeProject, ProjectTask, BudgetItem } from '../types';
 import { djangoService } from './djangoService';
 
 const API_URL = 'http://localhost:8000/api';
@@ -94,6 +94,15 @@ export const apiService = {
         });
         return res.json();
     },
+    simulateDebts: async (strategies: DebtStrategy[], extraPayments: number[] = [0], customOrder?: number[]): Promise<DebtSimulation | null> => {
+        const res = await fetch(`${API_URL}/debts/simulate`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify({ strategies, extraPayments, customOrder })
+        });
+        if (!res.ok) return null;
+        return res.json();
+    },
 
     // --- Goals ---
     getGoals: async (): Promise<Goal[]> => {
@@ -207,6 +216,12 @@ export const apiService = {
         if (!res.ok) throw new Error('Failed to fetch reports');
         return res.json();
     },
+    getReportsBundle: async (range: string, account: string): Promise<ReportBundle> => {
+        const params = new URLSearchParams({ range, account });
+        const res = await fetch(`${API_URL}/reports/bundle?${params}`);
+        if (!res.ok) throw new Error('Failed to fetch reports bundle');
+        return res.json();
+    },
 
     // --- AI Settings ---
     getAISettings: async (): Promise<{ api_key: string; instructions: string; provider: string }> => {
@@ -281,13 +296,21 @@ export const apiService = {
     },
 
     // --- Backup & Restore ---
-    exportBackup: async (): Promise<any> => {
+    exportBackup: async (): Promise<Blob> => {
+        // NDJSON comprimido (gzip), gerado em streaming pelo backend
         const res = await fetch(`${API_URL}/backup/export/`);
-        return res.json();
+        if (!res.ok) throw new Error('Falha ao exportar backup');
+        return res.blob();
     },
-    importBackup: async (data: any): Promise<{ success: boolean; message: string }> => {
-        const res = await fetch(`${API_URL}/backup/import/`, { method: 'POST', headers, body: JSON.stringify(data) });
-        return res.json();
+    importBackup: async (file: Blob): Promise<{ success: boolean; message: string; imported?: Record<string, number>; skipped?: Record<string, number> }> => {
+        // Envia o arquivo como está (.ndjson.gz do export ou JSON legado)
+        const res = await fetch(`${API_URL}/backup/import/`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: file
+        });
+        const data = await res.json();
+        return res.ok ? data : { success: false, message: data.detail || 'Erro ao importar backup.' };
     },
 
     // --- Settings ---
@@ -0,0 +1,35 @@
+import { ServerEventHandlers, ServerEventType } from '../types';
+
+const API_URL = 'http://localhost:8000/api';
+
+export const eventsService = {
+    /**
+     * Abre o stream SSE de mudanças e entrega cada evento ao handler do seu tipo.
+     * Só os tipos com handler são pedidos ao servidor. Retorna a função que fecha a conexão.
+     * O EventSource reconecta sozinho; após reconectar (ou receber `resync`) o estado
+     * local pode estar defasado, então `resync` também é disparado nesse caso.
+     */
+    subscribe: (handlers: ServerEventHandlers): (() => void) => {
+        const types = Object.keys(handlers) as ServerEventType[];
+        const source = new EventSource(`${API_URL}/events?types=${encodeURIComponent(types.join(','))}`);
+        let connectedOnce = false;
+
+        source.onopen = () => {
+            if (connectedOnce) handlers.resync?.({ dropped: 0 });
+            connectedOnce = true;
+        };
+
+        for (const type of types) {
+            source.addEventListener(type, (event: MessageEvent) => {
+                try {
+                    const message = JSON.parse(event.data);
+                    (handlers[type] as ((data: any) => void) | undefined)?.(message.data);
+                } catch (e) {
+                    console.error(`Evento inválido (${type})`, e);
+                }
+            });
+        }
+
+        return () => source.close();
+    },
+};
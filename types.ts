@@ -83,8 +83,58 @@ export interface Debt {
   totalInstallments?: number;  // Total de parcelas (para parcelado)
   currentInstallment?: number; // Parcela atual (para parcelado)
   category?: string; // Categoria da dívida
+  interestRate?: number; // Juros ao mês em % (opcional)
+  recurrenceFreq?: 'monthly' | 'none' | null; // Vazio = derivado de debtType/parcelas
+  recurrenceDay?: number | null; // Dia do mês
+  recurrenceCount?: number | null; // Nº de ocorrências (vazio = sem fim)
+  recurrenceStart?: string | null; // Primeira ocorrência (YYYY-MM-DD)
 }
 
+export type DebtStrategy = 'avalanche' | 'snowball' | 'custom';
+
+export interface DebtSimulationScenario {
+  strategy: DebtStrategy;
+  extraPayment: number;
+  monthsToPayoff: number | null;
+  payoffDate: string | null;
+  totalInterest: number;
+  totalPaid: number;
+  payoffOrder: { debtId: number; name: string; month: number; date: string | null }[];
+  unpaidDebtIds: number[];
+  timeline: { month: number; date: string; balance: number }[];
+}
+
+export interface DebtSimulation {
+  debts: { id: number; name: string; remaining: number; monthly: number; monthlyRate: number; rateSource: string }[];
+  scenarios: DebtSimulationScenario[];
+  horizonMonths: number;
+}
+
+// --- Server Events (SSE /api/events) ---
+
+export type ServerEventType =
+  | 'transaction'
+  | 'account-balance'
+  | 'budget-spent'
+  | 'debt-status'
+  | 'insight-ready'
+  | 'alert.fired'
+  | 'resync';
+
+export interface ServerEventPayloads {
+  'transaction': { action: 'created' | 'updated' | 'deleted'; transaction: Transaction };
+  'account-balance': { accountId: number; balance: number };
+  'budget-spent': { budgetId: number; category: string; spent: number };
+  'debt-status': { action: 'created' | 'updated' | 'deleted'; debt: Debt };
+  'insight-ready': { kind: string; [key: string]: any };
+  'alert.fired': { id: number; alert_id: number; category: string; period: string; spent: number; budget: number; threshold: number; message: string };
+  'resync': { dropped: number };
+}
+
+export type ServerEventHandlers = {
+  [K in ServerEventType]?: (data: ServerEventPayloads[K]) => void;
+};
+
 export interface Alert {
   id: string;
   category: string;
@@ -148,6 +198,12 @@ export interface ReportData {
   distribution: ReportCategoryData[];
 }
 
+export interface ReportBundle extends ReportData {
+  cashFlow: { month: string; income: number; expense: number; balance: number }[];
+  spendingTrends: { month: string; value: number; change: number }[];
+  incomeSources: ReportCategoryData[];
+}
+
 
 
 export interface PredictionScenario {